@@ -1,12 +1,25 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from .routers import chat, documents, admin, chatbots
-from .database import engine
+from .database import engine, DATABASE_DIRECT_URL
 from .models import Base
+from .services.config_cache import config_cache
+from .services.background import start_periodic_tasks, stop_periodic_tasks
+from .services.write_behind import chat_write_buffer
+from .services.metrics import ServerTimingMiddleware
+from .services.tracing import setup_tracing, shutdown_tracing
+from .services.slow_queries import slow_query_monitor
+from .services.archive_service import prepare_partitions
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import os
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+# create_all makes chat_messages partitioned but with no partitions: inserts need this month's to exist
+prepare_partitions()
+
+# Record statements slower than SLOW_QUERY_THRESHOLD_MS (shown at /admin/slow-queries)
+slow_query_monitor.attach(engine)
 
 app = FastAPI(
     title="Local Chatbot API",
@@ -21,8 +34,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Per-stage timings for every request (Server-Timing header and /metrics histograms)
+app.add_middleware(ServerTimingMiddleware)
+
+# Optional OpenTelemetry tracing (TRACING_ENABLED=true); added last so the server span wraps everything
+setup_tracing(app, engine)
+
+@app.on_event("startup")
+async def start_background_workers():
+    # Listen for chatbot/settings changes made by other workers
+    config_cache.start_listener(DATABASE_DIRECT_URL)
+    # Periodic maintenance (expired admin session sweeper, ...)
+    start_periodic_tasks()
+    # Batched chat persistence (only when CHAT_WRITE_BEHIND=true)
+    chat_write_buffer.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await chat_write_buffer.stop()
+    await stop_periodic_tasks()
+    config_cache.stop_listener()
+    shutdown_tracing()
+
 # Include routers
 app.include_router(chat.router)
 app.include_router(documents.router)
@@ -38,6 +74,11 @@ async def root():
         "health": "/health"
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for this worker"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/health")
 async def health_check():
     return {
@@ -1,8 +1,15 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, ARRAY, Boolean, JSON, Table
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, ARRAY, Boolean, JSON, Table, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from pgvector.sqlalchemy import Vector
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Dimension of the default embedding space stored on document_chunks
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 1536))
 
 Base = declarative_base()
 
@@ -13,7 +20,9 @@ chatbot_documents = Table(
     Column('id', Integer, primary_key=True),
     Column('chatbot_id', Integer, ForeignKey('chatbots.id', ondelete='CASCADE'), nullable=False),
     Column('document_id', Integer, ForeignKey('documents.id', ondelete='CASCADE'), nullable=False),
-    Column('created_at', DateTime, default=datetime.utcnow)
+    Column('created_at', DateTime, default=datetime.utcnow),
+    # Also serves the link/unlink membership checks
+    UniqueConstraint('chatbot_id', 'document_id', name='chatbot_documents_chatbot_id_document_id_key')
 )
 
 class Chatbot(Base):
@@ -25,13 +34,30 @@ class Chatbot(Base):
     system_prompt = Column(Text, nullable=False)
     settings = Column(JSON, default={})
     is_active = Column(Boolean, default=True)
+    # Set when the chatbot is deleted; rows are removed later by PurgeService
+    deleted_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Many-to-many relationship with documents
     documents = relationship("Document", secondary=chatbot_documents, back_populates="chatbots")
     # One-to-many relationship with chat sessions
-    chat_sessions = relationship("ChatSession", back_populates="chatbot", cascade="all, delete-orphan")
+    # passive_deletes: rely on ON DELETE CASCADE instead of loading children before a delete
+    chat_sessions = relationship("ChatSession", back_populates="chatbot", cascade="all, delete-orphan", passive_deletes=True)
+    # Materialized statistics, maintained incrementally by ChatbotService
+    counters = relationship("ChatbotCounter", uselist=False, back_populates="chatbot", cascade="all, delete-orphan", passive_deletes=True)
+
+class ChatbotCounter(Base):
+    __tablename__ = "chatbot_counters"
+    
+    chatbot_id = Column(Integer, ForeignKey("chatbots.id", ondelete="CASCADE"), primary_key=True)
+    document_count = Column(Integer, nullable=False, default=0)
+    chunk_count = Column(Integer, nullable=False, default=0)
+    session_count = Column(Integer, nullable=False, default=0)
+    message_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    chatbot = relationship("Chatbot", back_populates="counters")
 
 class Document(Base):
     __tablename__ = "documents"
@@ -40,10 +66,15 @@ class Document(Base):
     filename = Column(String(255), nullable=False)
     content = Column(Text, nullable=False)
     file_type = Column(String(50), nullable=False)
+    chunk_count = Column(Integer, nullable=False, default=0)
+    content_length = Column(Integer, nullable=False, default=0)
+    total_chunk_length = Column(BigInteger, nullable=False, default=0)
+    # Set when the document is deleted; rows are removed later by PurgeService
+    deleted_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
     # Many-to-many relationship with chatbots
     chatbots = relationship("Chatbot", secondary=chatbot_documents, back_populates="documents")
 
@@ -51,37 +82,79 @@ class DocumentChunk(Base):
     __tablename__ = "document_chunks"
     
     id = Column(Integer, primary_key=True, index=True)
-    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"))
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True)
     chunk_text = Column(Text, nullable=False)
     chunk_index = Column(Integer, nullable=False)
-    embedding = Column(Vector(1536))
+    embedding = Column(Vector(EMBEDDING_DIMENSION))
     created_at = Column(DateTime, default=datetime.utcnow)
     
     document = relationship("Document", back_populates="chunks")
 
+class ChunkEmbedding(Base):
+    """Chunk embeddings in a non-default space (see services/providers.py), for chatbots with their own embedding model"""
+    __tablename__ = "chunk_embeddings"
+    
+    chunk_id = Column(Integer, ForeignKey("document_chunks.id", ondelete="CASCADE"), primary_key=True)
+    space = Column(String(255), primary_key=True)
+    # Dimension varies by space, so the column is unconstrained
+    embedding = Column(Vector(), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(255), unique=True, nullable=False, index=True)
     chatbot_id = Column(Integer, ForeignKey("chatbots.id", ondelete="CASCADE"))
+    message_count = Column(Integer, nullable=False, default=0)
+    # Rolling summary of the turns older than the verbatim memory window
+    summary = Column(Text)
+    summary_message_count = Column(Integer, nullable=False, default=0)
+    summary_through = Column(DateTime)
+    summary_through_id = Column(Integer)  # with summary_through, keyset position of the last summarized turn
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
+    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan", passive_deletes=True)
     chatbot = relationship("Chatbot", back_populates="chat_sessions")
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Serves keyset-paginated history: newest-first scan within one session
+        Index("idx_chat_messages_session_created", "session_id", "created_at", "id"),
+        # Monthly partitions are created by ArchiveService (see migration 007)
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    # The partition key has to be part of the primary key
+    id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String(255), ForeignKey("chat_sessions.session_id", ondelete="CASCADE"))
     message = Column(Text, nullable=False)
     response = Column(Text, nullable=False)
     context_chunks = Column(ARRAY(String))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    retrieval_decision = Column(String(32))  # see services/retrieval_planner.py
+    degraded = Column(Boolean, nullable=False, default=False)  # fallback answer after the request deadline
+    abandoned = Column(Boolean, nullable=False, default=False)  # client disconnected before the answer; hidden from history
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
     
     session = relationship("ChatSession", back_populates="messages")
 
+class UsageRollup(Base):
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", "chatbot_id", name="uq_usage_rollups_bucket"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    granularity = Column(String(10), nullable=False)  # 'hour' or 'day'
+    bucket_start = Column(DateTime, nullable=False, index=True)
+    chatbot_id = Column(Integer, ForeignKey("chatbots.id", ondelete="CASCADE"), nullable=False, index=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    session_count = Column(Integer, nullable=False, default=0)
+    context_hit_count = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+
 class AdminSettings(Base):
     __tablename__ = "admin_settings"
     
@@ -98,5 +171,5 @@ class AdminSession(Base):
     id = Column(Integer, primary_key=True, index=True)
     session_token = Column(String(255), unique=True, nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
     is_active = Column(Boolean, default=True)
\ No newline at end of file
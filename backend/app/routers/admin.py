@@ -1,14 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..services.admin_service import AdminService
 from ..services.embeddings import EmbeddingService
+from ..services.providers import provider_guards
+from ..services.slow_queries import slow_query_monitor
+from ..services.profiler import stack_sampler, memory_tracker
 from ..services.document_processor import DocumentProcessor
-from ..models import Document, DocumentChunk, ChatMessage, ChatSession
+from ..services.chatbot_service import ChatbotService
+from ..services.analytics_service import AnalyticsService, GRANULARITIES
+from ..services.archive_service import ArchiveService
+from ..services.export_service import ExportService, EXPORT_FORMATS
+from ..services.purge_service import PurgeService
+from ..models import Chatbot, Document, DocumentChunk, ChatSession, ChatbotCounter
+from sqlalchemy import func
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import os
 
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -18,6 +29,17 @@ security = HTTPBearer(auto_error=False)
 admin_service = AdminService()
 embedding_service = EmbeddingService()
 document_processor = DocumentProcessor(embedding_service)
+chatbot_service = ChatbotService()
+analytics_service = AnalyticsService()
+archive_service = ArchiveService()
+export_service = ExportService()
+purge_service = PurgeService()
+
+def as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert a timezone-aware query parameter to naive UTC, matching the naive UTC timestamps stored"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
 
 class LoginRequest(BaseModel):
     password: str
@@ -51,8 +73,6 @@ async def admin_login(
     db: Session = Depends(get_db)
 ):
     """Admin login endpoint"""
-    admin_service.cleanup_expired_sessions(db)
-    
     if admin_service.authenticate(request.password):
         token = admin_service.create_session(db)
         return LoginResponse(
@@ -137,30 +157,60 @@ async def update_setting(
 
 @router.get("/dashboard")
 async def get_dashboard_stats(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = "day",
+    chatbot_id: Optional[int] = None,
     admin: bool = Depends(get_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Get dashboard statistics"""
-    # Get document statistics
-    total_documents = db.query(Document).count()
-    total_chunks = db.query(DocumentChunk).count()
+    """Get dashboard statistics from materialized counters and usage rollups"""
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Granularity must be one of: {', '.join(GRANULARITIES)}")
+    
+    start, end = analytics_service.default_range(granularity, as_naive_utc(start), as_naive_utc(end))
+    
+    # Get document statistics (chunk totals come from the cached per-document count)
+    total_documents, total_chunks = db.query(
+        func.count(Document.id), func.coalesce(func.sum(Document.chunk_count), 0)
+    ).filter(Document.deleted_at.is_(None)).one()
     
-    # Get chat statistics
-    total_sessions = db.query(ChatSession).count()
-    total_messages = db.query(ChatMessage).count()
+    # Get chat statistics from per-chatbot counters
+    total_sessions, total_messages = db.query(
+        func.coalesce(func.sum(ChatbotCounter.session_count), 0),
+        func.coalesce(func.sum(ChatbotCounter.message_count), 0)
+    ).join(Chatbot, Chatbot.id == ChatbotCounter.chatbot_id).filter(Chatbot.deleted_at.is_(None)).one()
     
     # Get recent documents
-    recent_documents = db.query(Document).order_by(Document.created_at.desc()).limit(5).all()
+    recent_documents = db.query(
+        Document.id, Document.filename, Document.file_type, Document.created_at, Document.chunk_count
+    ).filter(Document.deleted_at.is_(None)).order_by(Document.created_at.desc()).limit(5).all()
     
     # Get recent chat sessions
-    recent_sessions = db.query(ChatSession).order_by(ChatSession.created_at.desc()).limit(5).all()
+    recent_sessions = db.query(ChatSession).join(Chatbot, Chatbot.id == ChatSession.chatbot_id).filter(
+        Chatbot.deleted_at.is_(None)
+    ).order_by(ChatSession.created_at.desc()).limit(5).all()
+    
+    # Get usage for the requested time range from the rollup tables
+    series = analytics_service.get_usage_series(db, start, end, granularity, chatbot_id)
+    by_chatbot = analytics_service.get_usage_by_chatbot(db, start, end, granularity)
+    range_totals = analytics_service.get_usage_totals(db, start, end, granularity, chatbot_id)
     
     return {
         "statistics": {
             "total_documents": total_documents,
-            "total_chunks": total_chunks,
-            "total_sessions": total_sessions,
-            "total_messages": total_messages
+            "total_chunks": int(total_chunks),
+            "total_sessions": int(total_sessions),
+            "total_messages": int(total_messages)
+        },
+        "usage": {
+            "granularity": granularity,
+            "start": start,
+            "end": end,
+            "chatbot_id": chatbot_id,
+            "totals": range_totals,
+            "series": series,
+            "by_chatbot": by_chatbot
         },
         "recent_documents": [
             {
@@ -168,7 +218,7 @@ async def get_dashboard_stats(
                 "filename": doc.filename,
                 "file_type": doc.file_type,
                 "created_at": doc.created_at,
-                "chunks_count": len(doc.chunks)
+                "chunks_count": doc.chunk_count
             }
             for doc in recent_documents
         ],
@@ -176,7 +226,7 @@ async def get_dashboard_stats(
             {
                 "session_id": session.session_id,
                 "created_at": session.created_at,
-                "message_count": len(session.messages)
+                "message_count": session.message_count
             }
             for session in recent_sessions
         ]
@@ -184,22 +234,37 @@ async def get_dashboard_stats(
 
 @router.get("/documents/analytics")
 async def get_document_analytics(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
     admin: bool = Depends(get_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Get detailed document analytics"""
-    documents = db.query(Document).all()
+    """Get detailed document analytics from precomputed per-document sizes"""
+    query = db.query(
+        Document.id,
+        Document.filename,
+        Document.file_type,
+        Document.created_at,
+        Document.content_length,
+        Document.chunk_count,
+        Document.total_chunk_length
+    ).filter(Document.deleted_at.is_(None))
+    start, end = as_naive_utc(start), as_naive_utc(end)
+    if start:
+        query = query.filter(Document.created_at >= start)
+    if end:
+        query = query.filter(Document.created_at < end)
     
     analytics = []
-    for doc in documents:
+    for doc in query.order_by(Document.created_at.desc()).all():
         analytics.append({
             "id": doc.id,
             "filename": doc.filename,
             "file_type": doc.file_type,
             "created_at": doc.created_at,
-            "content_length": len(doc.content),
-            "chunks_count": len(doc.chunks),
-            "avg_chunk_length": sum(len(chunk.chunk_text) for chunk in doc.chunks) / len(doc.chunks) if doc.chunks else 0
+            "content_length": doc.content_length,
+            "chunks_count": doc.chunk_count,
+            "avg_chunk_length": doc.total_chunk_length / doc.chunk_count if doc.chunk_count else 0
         })
     
     return {"documents": analytics}
@@ -211,7 +276,7 @@ async def get_document_chunks(
     db: Session = Depends(get_db)
 ):
     """Get all chunks for a document"""
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = db.query(Document).filter(Document.id == document_id, Document.deleted_at.is_(None)).first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
@@ -238,20 +303,201 @@ async def get_document_chunks(
 @router.delete("/documents/{document_id}")
 async def admin_delete_document(
     document_id: int,
+    background_tasks: BackgroundTasks,
     admin: bool = Depends(get_admin_user),
     db: Session = Depends(get_db)
 ):
     """Admin delete document"""
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = db.query(Document).filter(Document.id == document_id, Document.deleted_at.is_(None)).first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     filename = document.filename
-    db.delete(document)
-    db.commit()
+    purge_service.soft_delete_document(db, document)
+    background_tasks.add_task(purge_service.purge_document, document_id)
     
     return {"message": f"Document '{filename}' deleted successfully"}
 
+@router.post("/counters/rebuild")
+async def rebuild_chatbot_counters(
+    chatbot_id: Optional[int] = None,
+    admin: bool = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Recompute chatbot statistics counters from the source tables to repair drift"""
+    query = db.query(Chatbot.id).filter(Chatbot.deleted_at.is_(None))
+    if chatbot_id is not None:
+        query = query.filter(Chatbot.id == chatbot_id)
+    chatbot_ids = [row.id for row in query.order_by(Chatbot.id).all()]
+    if chatbot_id is not None and not chatbot_ids:
+        raise HTTPException(status_code=404, detail="Chatbot not found")
+    
+    for rebuild_id in chatbot_ids:
+        await run_in_threadpool(chatbot_service.rebuild_counters, db, rebuild_id)
+    return {"rebuilt_chatbots": chatbot_ids}
+
+@router.get("/providers")
+async def get_provider_health(admin: bool = Depends(get_admin_user)):
+    """Circuit breaker state, latency and hedging counters for upstream model calls"""
+    return {"providers": [guard.stats() for guard in provider_guards]}
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    vector_only: bool = False,
+    admin: bool = Depends(get_admin_user)
+):
+    """Recently captured slow queries with their sampled EXPLAIN plans, newest first"""
+    return {
+        **slow_query_monitor.stats(),
+        "entries": slow_query_monitor.entries(limit, vector_only)
+    }
+
+@router.delete("/slow-queries")
+async def clear_slow_queries(admin: bool = Depends(get_admin_user)):
+    """Empty the slow query buffer"""
+    slow_query_monitor.clear()
+    return {"message": "Slow query buffer cleared"}
+
+@router.get("/profile/cpu")
+async def profile_cpu(
+    seconds: float = Query(10, gt=0),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    format: str = "folded",
+    include_idle: bool = False,
+    admin: bool = Depends(get_admin_user)
+):
+    """Sample this worker's thread stacks for a while; folded stacks for flamegraphs, or a JSON summary"""
+    if format not in ("folded", "json"):
+        raise HTTPException(status_code=400, detail="Format must be one of: folded, json")
+    
+    try:
+        # Sampled from a threadpool thread so the event loop keeps serving (and being profiled)
+        profile = await run_in_threadpool(stack_sampler.sample, seconds, interval_ms, include_idle)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    if format == "folded":
+        return PlainTextResponse(stack_sampler.folded(profile))
+    return {**profile, "top": stack_sampler.top_functions(profile)}
+
+@router.get("/profile/memory")
+async def profile_memory(
+    limit: int = Query(25, ge=1, le=500),
+    group_by: str = "lineno",
+    reset: bool = False,
+    admin: bool = Depends(get_admin_user)
+):
+    """Allocation growth since memory tracing started (or since the last reset)"""
+    try:
+        return await run_in_threadpool(memory_tracker.diff, limit, group_by, reset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/profile/memory/start")
+async def start_memory_profile(
+    frames: int = Query(10, ge=1, le=100),
+    admin: bool = Depends(get_admin_user)
+):
+    """Start tracemalloc and take the baseline snapshot"""
+    return await run_in_threadpool(memory_tracker.start, frames)
+
+@router.post("/profile/memory/stop")
+async def stop_memory_profile(admin: bool = Depends(get_admin_user)):
+    """Stop tracemalloc and free its traces"""
+    return memory_tracker.stop()
+
+@router.get("/archive")
+async def get_archive_status(
+    admin: bool = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """List live chat message partitions and archived months"""
+    return {
+        "partitioned": archive_service.is_partitioned(db),
+        "retention_months": archive_service.retention_months,
+        "partitions": [
+            {"name": partition["name"], "month": partition["month"].isoformat()}
+            for partition in archive_service.list_partitions(db)
+        ],
+        "archives": archive_service.list_archives()
+    }
+
+@router.get("/archive/messages")
+async def query_archived_messages(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    chatbot_id: Optional[int] = None,
+    session_id: Optional[str] = None,
+    limit: int = 100,
+    admin: bool = Depends(get_admin_user)
+):
+    """Query archived chat messages"""
+    if limit < 1 or limit > 10000:
+        raise HTTPException(status_code=400, detail="Limit must be between 1 and 10000")
+    
+    try:
+        messages = await run_in_threadpool(
+            archive_service.query_archive, as_naive_utc(start), as_naive_utc(end), chatbot_id, session_id, limit
+        )
+        return {"messages": messages, "returned_messages": len(messages)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error querying archive: {str(e)}")
+
+@router.post("/archive/run")
+async def run_archive_maintenance(
+    admin: bool = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Create upcoming partitions and archive expired ones now"""
+    try:
+        created = await run_in_threadpool(archive_service.ensure_partitions, db)
+        archived = await run_in_threadpool(archive_service.archive_expired_partitions, db)
+        return {"created_partitions": created, "archived": archived}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error running archive maintenance: {str(e)}")
+
+@router.get("/export/messages")
+async def export_messages(
+    chatbot_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: str = "ndjson",
+    admin: bool = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Stream all messages for a chatbot and time range (default: last 30 days) as NDJSON or Parquet"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+    
+    chatbot = chatbot_service.get_chatbot(db, chatbot_id)
+    if not chatbot:
+        raise HTTPException(status_code=404, detail="Chatbot not found")
+    
+    end = as_naive_utc(end) or datetime.utcnow()
+    start = as_naive_utc(start) or end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=422, detail="Start must be before end")
+    
+    filename = f"chatbot_{chatbot_id}_{start:%Y%m%d}_{end:%Y%m%d}.{'ndjson' if format == 'ndjson' else 'parquet'}"
+    if format == "ndjson":
+        body = export_service.stream_ndjson(chatbot_id, start, end)
+        media_type = "application/x-ndjson"
+    else:
+        body = export_service.stream_parquet(chatbot_id, start, end)
+        media_type = "application/vnd.apache.parquet"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.post("/initialize")
 async def initialize_admin_settings(
     admin: bool = Depends(get_admin_user),
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..services.embeddings import EmbeddingService
 from ..services.document_processor import DocumentProcessor
 from ..services.chat_service import ChatService
+from ..services.admission import AdmissionRejected
 from pydantic import BaseModel
+import asyncio
+import os
 import uuid
 from typing import Optional, List, Dict, Any
 
@@ -15,6 +18,17 @@ embedding_service = EmbeddingService()
 document_processor = DocumentProcessor(embedding_service)
 chat_service = ChatService(embedding_service, document_processor)
 
+# How often to check whether the client is still connected while a response is generated
+DISCONNECT_POLL_SECONDS = int(os.getenv("CHAT_DISCONNECT_POLL_MS", 250)) / 1000
+
+# Non-standard status (nginx convention) logged for requests the client abandoned
+CLIENT_CLOSED_REQUEST = 499
+
+async def wait_for_disconnect(http_request: Request) -> None:
+    """Return once the client has gone away"""
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
 class ChatRequest(BaseModel):
     message: str
     chatbot_id: int
@@ -25,13 +39,19 @@ class ChatResponse(BaseModel):
     session_id: str
     context_used: bool
     sources: List[str]
+    degraded: bool = False
 
 @router.post("/", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
+    http_request: Request,
     db: Session = Depends(get_db)
 ):
-    """Send a message to the chatbot"""
+    """Send a message to the chatbot.
+    
+    Generation is cancelled (and the turn recorded as abandoned) if the
+    client disconnects before the answer is ready.
+    """
     if not request.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
     
@@ -39,11 +59,24 @@ async def chat(
     session_id = request.session_id or str(uuid.uuid4())
     
     try:
-        result = await chat_service.generate_response(
+        generation = asyncio.create_task(chat_service.generate_response(
             request.message, session_id, request.chatbot_id, db
-        )
-        return ChatResponse(**result)
+        ))
+        disconnect = asyncio.create_task(wait_for_disconnect(http_request))
+        try:
+            await asyncio.wait({generation, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+            if not generation.done():
+                # Client is gone (or this handler was cancelled): stop the upstream calls
+                generation.cancel()
+                await asyncio.gather(generation, return_exceptions=True)
+        if generation.cancelled():
+            return Response(status_code=CLIENT_CLOSED_REQUEST)
+        return ChatResponse(**generation.result())
     
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
@@ -51,28 +84,37 @@ async def chat(
 async def get_chat_history(
     session_id: str,
     limit: int = 10,
+    before: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get chat history for a session with metadata"""
+    """Get chat history for a session with metadata.
+    
+    Returns the newest ``limit`` messages; pass ``next_cursor`` back as
+    ``before`` to load the previous page.
+    """
     try:
         session = chat_service.get_session(session_id, db)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        history = chat_service.get_chat_history(session_id, db, limit)
-        total_count = chat_service.get_message_count(session_id, db)
+        page = chat_service.get_chat_history_page(session_id, db, limit, before)
+        total_count = chat_service.get_message_count(session_id, db, session)
         
         return {
             "session_id": session_id,
             "chatbot_id": session.chatbot_id,
-            "history": history,
+            "history": page["history"],
             "total_messages": total_count,
-            "returned_messages": len(history),
+            "returned_messages": len(page["history"]),
+            "has_more": page["has_more"],
+            "next_cursor": page["next_cursor"],
             "created_at": session.created_at
         }
     
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving chat history: {str(e)}")
 
@@ -106,7 +148,7 @@ async def get_session(
             "session_id": session.session_id,
             "chatbot_id": session.chatbot_id,
             "created_at": session.created_at,
-            "message_count": chat_service.get_message_count(session_id, db)
+            "message_count": chat_service.get_message_count(session_id, db, session)
         }
     
     except HTTPException:
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..services.chatbot_service import ChatbotService
+from ..services.purge_service import PurgeService
+from ..services.embeddings import EmbeddingService
+from ..services.document_processor import DocumentProcessor
+from ..services.providers import embedding_space_for, validate_provider_settings
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 
@@ -9,6 +13,8 @@ router = APIRouter(prefix="/chatbots", tags=["chatbots"])
 
 # Initialize service
 chatbot_service = ChatbotService()
+purge_service = PurgeService()
+document_processor = DocumentProcessor(EmbeddingService())
 
 class ChatbotCreate(BaseModel):
     name: str
@@ -41,6 +47,7 @@ class ChatbotStats(BaseModel):
     document_count: int
     chunk_count: int
     session_count: int
+    message_count: int
     created_at: str
     updated_at: str
 
@@ -83,6 +90,11 @@ async def create_chatbot(
     if not request.system_prompt.strip():
         raise HTTPException(status_code=400, detail="System prompt cannot be empty")
     
+    try:
+        validate_provider_settings(request.settings)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # Check if chatbot with this name already exists
         existing = chatbot_service.get_chatbot_by_name(db, request.name)
@@ -144,6 +156,7 @@ async def get_chatbot(
 async def update_chatbot(
     chatbot_id: int,
     request: ChatbotUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Update a chatbot"""
@@ -167,7 +180,13 @@ async def update_chatbot(
                 raise HTTPException(status_code=400, detail="System prompt cannot be empty")
             update_data['system_prompt'] = request.system_prompt
         
+        previous = chatbot_service.get_chatbot(db, chatbot_id)
+        previous_space = embedding_space_for(previous.settings) if previous else None
         if request.settings is not None:
+            try:
+                validate_provider_settings(request.settings)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
             update_data['settings'] = request.settings
         
         if request.is_active is not None:
@@ -177,6 +196,11 @@ async def update_chatbot(
         if not chatbot:
             raise HTTPException(status_code=404, detail="Chatbot not found")
         
+        space = embedding_space_for(chatbot.settings)
+        if space != previous_space:
+            # Existing documents must be embedded in the new space before it can be searched
+            background_tasks.add_task(document_processor.backfill_chatbot_space, chatbot_id, space)
+        
         return ChatbotResponse(
             id=chatbot.id,
             name=chatbot.name,
@@ -196,13 +220,15 @@ async def update_chatbot(
 @router.delete("/{chatbot_id}")
 async def delete_chatbot(
     chatbot_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
-    """Delete a chatbot"""
+    """Delete a chatbot; its sessions and messages are purged in the background"""
     try:
         success = chatbot_service.delete_chatbot(db, chatbot_id)
         if not success:
             raise HTTPException(status_code=404, detail="Chatbot not found")
+        background_tasks.add_task(purge_service.purge_chatbot, chatbot_id)
         
         return {"message": "Chatbot deleted successfully"}
     
@@ -222,6 +248,8 @@ async def add_document_to_chatbot(
         success = chatbot_service.add_document_to_chatbot(db, chatbot_id, request.document_id)
         if not success:
             raise HTTPException(status_code=404, detail="Chatbot or document not found")
+        chatbot = chatbot_service.get_chatbot(db, chatbot_id)
+        await document_processor.ensure_space_embeddings([request.document_id], embedding_space_for(chatbot.settings), db)
         
         return {"message": "Document added to chatbot successfully"}
     
@@ -263,7 +291,7 @@ async def get_chatbot_documents(
                 "filename": doc.filename,
                 "file_type": doc.file_type,
                 "created_at": doc.created_at.isoformat(),
-                "chunk_count": len(doc.chunks)
+                "chunk_count": doc.chunk_count
             }
             for doc in documents
         ]
@@ -290,6 +318,7 @@ async def get_chatbot_stats(
             document_count=stats['document_count'],
             chunk_count=stats['chunk_count'],
             session_count=stats['session_count'],
+            message_count=stats['message_count'],
             created_at=stats['created_at'].isoformat(),
             updated_at=stats['updated_at'].isoformat()
         )
@@ -313,6 +342,7 @@ async def get_all_chatbot_stats(db: Session = Depends(get_db)):
                 document_count=stats['document_count'],
                 chunk_count=stats['chunk_count'],
                 session_count=stats['session_count'],
+                message_count=stats['message_count'],
                 created_at=stats['created_at'].isoformat(),
                 updated_at=stats['updated_at'].isoformat()
             )
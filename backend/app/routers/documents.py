@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, File, UploadFile, HTTPException, Form
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..services.embeddings import EmbeddingService
 from ..services.document_processor import DocumentProcessor
 from ..services.chatbot_service import ChatbotService
+from ..services.purge_service import PurgeService
+from ..services.providers import embedding_space_for
+from ..services.metrics import set_chatbot
 from ..models import Document
 import os
 import uuid
@@ -15,6 +18,7 @@ router = APIRouter(prefix="/documents", tags=["documents"])
 embedding_service = EmbeddingService()
 document_processor = DocumentProcessor(embedding_service)
 chatbot_service = ChatbotService()
+purge_service = PurgeService()
 
 @router.post("/upload")
 async def upload_document(
@@ -23,6 +27,7 @@ async def upload_document(
     db: Session = Depends(get_db)
 ):
     """Upload and process a document (PDF or TXT) for a specific chatbot"""
+    set_chatbot(chatbot_id)
     # Validate chatbot exists and is active
     chatbot = chatbot_service.get_chatbot(db, chatbot_id)
     if not chatbot:
@@ -55,6 +60,8 @@ async def upload_document(
         
         # Associate document with chatbot
         chatbot_service.add_document_to_chatbot(db, chatbot_id, document.id)
+        # Chatbots with their own embedding model need the chunks in that space too
+        await document_processor.ensure_space_embeddings([document.id], embedding_space_for(chatbot.settings), db)
         
         # Clean up temporary file
         os.remove(file_path)
@@ -63,7 +70,7 @@ async def upload_document(
             "message": "Document uploaded and processed successfully",
             "document_id": document.id,
             "filename": document.filename,
-            "chunks_created": len(document.chunks),
+            "chunks_created": document.chunk_count,
             "chatbot_id": chatbot_id,
             "chatbot_name": chatbot.name
         }
@@ -86,20 +93,20 @@ async def list_documents(chatbot_id: int = None, db: Session = Depends(get_db)):
                 "filename": doc.filename,
                 "file_type": doc.file_type,
                 "created_at": doc.created_at,
-                "chunks_count": len(doc.chunks)
+                "chunks_count": doc.chunk_count
             }
             for doc in documents
         ]
     else:
         # Deprecated: List all documents globally
-        documents = db.query(Document).all()
+        documents = db.query(Document).filter(Document.deleted_at.is_(None)).all()
         return [
             {
                 "id": doc.id,
                 "filename": doc.filename,
                 "file_type": doc.file_type,
                 "created_at": doc.created_at,
-                "chunks_count": len(doc.chunks),
+                "chunks_count": doc.chunk_count,
                 "associated_chatbots": len(doc.chatbots)
             }
             for doc in documents
@@ -108,7 +115,7 @@ async def list_documents(chatbot_id: int = None, db: Session = Depends(get_db)):
 @router.get("/{document_id}")
 async def get_document(document_id: int, db: Session = Depends(get_db)):
     """Get document details"""
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = db.query(Document).filter(Document.id == document_id, Document.deleted_at.is_(None)).first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
@@ -118,18 +125,18 @@ async def get_document(document_id: int, db: Session = Depends(get_db)):
         "file_type": document.file_type,
         "created_at": document.created_at,
         "content_preview": document.content[:500] + "..." if len(document.content) > 500 else document.content,
-        "chunks_count": len(document.chunks)
+        "chunks_count": document.chunk_count
     }
 
 @router.delete("/{document_id}")
-async def delete_document(document_id: int, db: Session = Depends(get_db)):
-    """Delete a document and its chunks"""
-    document = db.query(Document).filter(Document.id == document_id).first()
+async def delete_document(document_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Delete a document; its chunks are purged in the background"""
+    document = db.query(Document).filter(Document.id == document_id, Document.deleted_at.is_(None)).first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    db.delete(document)
-    db.commit()
+    purge_service.soft_delete_document(db, document)
+    background_tasks.add_task(purge_service.purge_document, document_id)
     
     return {"message": "Document deleted successfully"}
 
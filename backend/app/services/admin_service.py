@@ -1,14 +1,73 @@
 import os
 import hashlib
 import secrets
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from sqlalchemy.orm import Session
 from ..models import AdminSettings, AdminSession
+from .config_cache import config_cache
+from .background import PeriodicTask, register_periodic_task
 from dotenv import load_dotenv
 
 load_dotenv()
 
+class SessionTokenCache:
+    """Process-wide cache of validated admin session tokens.
+    
+    Tokens are keyed by their SHA-256 digest and each entry expires at the
+    earlier of the session's expires_at and ADMIN_SESSION_CACHE_TTL.
+    """
+    
+    def __init__(self):
+        self.ttl_seconds = float(os.getenv("ADMIN_SESSION_CACHE_TTL", 300))
+        self.max_entries = int(os.getenv("ADMIN_SESSION_CACHE_SIZE", 10000))
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def token_hash(session_token: str) -> str:
+        return hashlib.sha256(session_token.encode("utf-8")).hexdigest()
+    
+    def is_valid(self, session_token: str) -> bool:
+        """Return True if the token was validated recently and has not expired"""
+        key = self.token_hash(session_token)
+        with self._lock:
+            deadline = self._entries.get(key)
+            if deadline is None:
+                return False
+            if deadline <= time.monotonic():
+                del self._entries[key]
+                return False
+            return True
+    
+    def put(self, session_token: str, expires_at: datetime) -> None:
+        """Cache a validated token until its expiry (bounded by the cache TTL)"""
+        remaining = (expires_at - datetime.utcnow()).total_seconds()
+        if remaining <= 0:
+            return
+        deadline = time.monotonic() + min(remaining, self.ttl_seconds)
+        key = self.token_hash(session_token)
+        with self._lock:
+            self._entries[key] = deadline
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def invalidate_hash(self, key: str) -> None:
+        """Drop a token by digest (used for cross-worker invalidation)"""
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def invalidate(self, session_token: str) -> None:
+        """Drop a token"""
+        self.invalidate_hash(self.token_hash(session_token))
+
+session_token_cache = SessionTokenCache()
+config_cache.subscribe("admin_session", session_token_cache.invalidate_hash)
+
 class AdminService:
     def __init__(self):
         self.admin_password = os.getenv("ADMIN_PASSWORD", "admin123")
@@ -41,13 +100,20 @@ class AdminService:
         if not session_token:
             return False
         
+        if session_token_cache.is_valid(session_token):
+            return True
+        
         session = db.query(AdminSession).filter(
             AdminSession.session_token == session_token,
             AdminSession.is_active == True,
             AdminSession.expires_at > datetime.utcnow()
         ).first()
         
-        return session is not None
+        if session is None:
+            return False
+        
+        session_token_cache.put(session_token, session.expires_at)
+        return True
     
     def invalidate_session(self, session_token: str, db: Session) -> bool:
         """Invalidate admin session"""
@@ -55,18 +121,29 @@ class AdminService:
             AdminSession.session_token == session_token
         ).first()
         
+        session_token_cache.invalidate(session_token)
         if session:
             session.is_active = False
+            # Other workers drop their cached copy when this commits
+            config_cache.notify(db, f"admin_session:{session_token_cache.token_hash(session_token)}")
             db.commit()
             return True
         return False
     
-    def cleanup_expired_sessions(self, db: Session):
-        """Clean up expired sessions"""
-        db.query(AdminSession).filter(
-            AdminSession.expires_at < datetime.utcnow()
-        ).update({"is_active": False})
-        db.commit()
+    def cleanup_expired_sessions(self, db: Session, batch_size: int = 1000) -> int:
+        """Delete expired and logged-out sessions in batches, returning the number removed"""
+        total_deleted = 0
+        while True:
+            expired_ids = db.query(AdminSession.id).filter(
+                (AdminSession.expires_at < datetime.utcnow()) | (AdminSession.is_active == False)
+            ).limit(batch_size).subquery()
+            deleted = db.query(AdminSession).filter(
+                AdminSession.id.in_(expired_ids.select())
+            ).delete(synchronize_session=False)
+            db.commit()
+            total_deleted += deleted
+            if deleted < batch_size:
+                return total_deleted
     
     def get_setting(self, key: str, db: Session, default: str = None) -> Optional[str]:
         """Get admin setting value"""
@@ -90,7 +167,9 @@ class AdminService:
             )
             db.add(setting)
         
+        config_cache.notify(db, "settings")
         db.commit()
+        config_cache.invalidate_settings()
         db.refresh(setting)
         return setting
     
@@ -154,4 +233,19 @@ class AdminService:
                 setting = AdminSettings(**setting_data)
                 db.add(setting)
         
-        db.commit()
\ No newline at end of file
+        config_cache.notify(db, "settings")
+        db.commit()
+        config_cache.invalidate_settings()
+
+def _sweep_expired_sessions(db: Session) -> None:
+    deleted = AdminService().cleanup_expired_sessions(
+        db, batch_size=int(os.getenv("ADMIN_SESSION_SWEEP_BATCH", 1000))
+    )
+    if deleted:
+        print(f"Removed {deleted} expired admin sessions")
+
+register_periodic_task(PeriodicTask(
+    "admin-session-sweeper",
+    float(os.getenv("ADMIN_SESSION_SWEEP_INTERVAL", 600)),
+    _sweep_expired_sessions
+))
\ No newline at end of file
@@ -0,0 +1,187 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+from .config_cache import ChatbotConfig
+from .deadline import DeadlineExceeded
+from .metrics import stage, llm_slots_in_flight, llm_slots_queued
+
+class AdmissionRejected(Exception):
+    """Raised when a request is turned away instead of queued; maps to 429/503 with Retry-After"""
+    
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, holding at most ``burst``"""
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+    
+    def try_take(self) -> float:
+        """Take a token; returns 0 on success, otherwise seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class AdmissionController:
+    """Per-chatbot rate limits and fair scheduling for LLM-bound chat work.
+    
+    Each chatbot gets a token bucket configured by ``rate_limit_per_minute``
+    and ``rate_limit_burst`` in its settings (falling back to
+    CHATBOT_RATE_LIMIT_PER_MINUTE / CHATBOT_RATE_LIMIT_BURST; a rate of 0
+    means unlimited). At most LLM_MAX_IN_FLIGHT requests run at once; the rest
+    wait in per-chatbot queues that are served by start-time fair queuing,
+    weighted by the chatbot's ``scheduler_weight`` setting. Requests that
+    would exceed LLM_MAX_QUEUED waiters or wait longer than LLM_QUEUE_TIMEOUT
+    seconds are rejected instead of piling up.
+    """
+    
+    def __init__(self):
+        self.max_in_flight = int(os.getenv("LLM_MAX_IN_FLIGHT", 32))
+        self.max_queued = int(os.getenv("LLM_MAX_QUEUED", 100))
+        self.queue_timeout = float(os.getenv("LLM_QUEUE_TIMEOUT", 10))
+        self.default_rate_per_minute = float(os.getenv("CHATBOT_RATE_LIMIT_PER_MINUTE", 0))
+        self.default_burst = float(os.getenv("CHATBOT_RATE_LIMIT_BURST", 10))
+        self._in_flight = 0
+        self._queued = 0
+        self._queues: Dict[int, Deque[Tuple[asyncio.Future, float]]] = {}
+        self._virtual_start: Dict[int, float] = {}
+        self._virtual_clock = 0.0
+        self._buckets: Dict[int, Tuple[Tuple[float, float], TokenBucket]] = {}
+    
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+    
+    @property
+    def queued(self) -> int:
+        return self._queued
+    
+    def _setting(self, chatbot: ChatbotConfig, key: str, default: float) -> float:
+        try:
+            return float((chatbot.settings or {}).get(key, default))
+        except (TypeError, ValueError):
+            return default
+    
+    def _bucket(self, chatbot: ChatbotConfig) -> Optional[TokenBucket]:
+        rate_per_minute = self._setting(chatbot, "rate_limit_per_minute", self.default_rate_per_minute)
+        if rate_per_minute <= 0:
+            self._buckets.pop(chatbot.id, None)
+            return None
+        config = (rate_per_minute, max(self._setting(chatbot, "rate_limit_burst", self.default_burst), 1))
+        entry = self._buckets.get(chatbot.id)
+        if entry is None or entry[0] != config:
+            # New chatbot or its limits changed
+            entry = (config, TokenBucket(config[0] / 60, config[1]))
+            self._buckets[chatbot.id] = entry
+        return entry[1]
+    
+    def check_rate(self, chatbot: ChatbotConfig) -> None:
+        """Take a token from the chatbot's bucket or raise a 429"""
+        bucket = self._bucket(chatbot)
+        if bucket is None:
+            return
+        wait = bucket.try_take()
+        if wait > 0:
+            raise AdmissionRejected(429, math.ceil(wait), "Rate limit exceeded for this chatbot")
+    
+    @asynccontextmanager
+    async def slot(self, chatbot: ChatbotConfig, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold one of the global in-flight slots, waiting fairly (at most ``timeout`` seconds) if needed.
+        
+        Raises AdmissionRejected when the queue is full or LLM_QUEUE_TIMEOUT
+        passes, and DeadlineExceeded when the caller's own ``timeout`` (its
+        request deadline) runs out first, so the caller can degrade instead.
+        """
+        deadline_bound = timeout is not None and timeout < self.queue_timeout
+        with stage("queue"):
+            await self._acquire(chatbot, timeout if deadline_bound else self.queue_timeout, deadline_bound)
+        try:
+            yield
+        finally:
+            self._release()
+    
+    def _weight(self, chatbot: ChatbotConfig) -> float:
+        return max(self._setting(chatbot, "scheduler_weight", 1.0), 0.01)
+    
+    async def _acquire(self, chatbot: ChatbotConfig, timeout: float, deadline_bound: bool = False) -> None:
+        weight = self._weight(chatbot)
+        if self._in_flight < self.max_in_flight and not self._queued:
+            self._in_flight += 1
+            self._charge(chatbot.id, weight)
+            return
+        if self._queued >= self.max_queued:
+            raise AdmissionRejected(503, 1, "Server is busy, please retry")
+        
+        queue = self._queues.setdefault(chatbot.id, deque())
+        if not queue:
+            # A chatbot that was idle starts at the current virtual time instead of its old credit
+            self._virtual_start[chatbot.id] = max(self._virtual_start.get(chatbot.id, 0.0), self._virtual_clock)
+        future = asyncio.get_running_loop().create_future()
+        queue.append((future, weight))
+        self._queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as we gave up: hand it on
+                self._release()
+            else:
+                future.cancel()
+                self._remove(chatbot.id, future)
+            if isinstance(e, asyncio.TimeoutError) and deadline_bound:
+                raise DeadlineExceeded("Deadline ran out while queued for an LLM slot")
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected(503, max(math.ceil(timeout), 1), "Server is busy, please retry")
+            raise
+    
+    def _charge(self, chatbot_id: int, weight: float) -> None:
+        start = max(self._virtual_start.get(chatbot_id, 0.0), self._virtual_clock)
+        self._virtual_clock = start
+        self._virtual_start[chatbot_id] = start + 1 / weight
+    
+    def _remove(self, chatbot_id: int, future: asyncio.Future) -> None:
+        queue = self._queues.get(chatbot_id)
+        if not queue:
+            return
+        for entry in queue:
+            if entry[0] is future:
+                queue.remove(entry)
+                self._queued -= 1
+                break
+        if not queue:
+            del self._queues[chatbot_id]
+    
+    def _release(self) -> None:
+        self._in_flight -= 1
+        while self._in_flight < self.max_in_flight and self._queues:
+            # Serve the backlogged chatbot with the earliest virtual start time
+            chatbot_id = min(self._queues, key=lambda key: self._virtual_start.get(key, 0.0))
+            queue = self._queues[chatbot_id]
+            future, weight = queue.popleft()
+            self._queued -= 1
+            if not queue:
+                del self._queues[chatbot_id]
+            if future.done():
+                continue
+            self._in_flight += 1
+            self._charge(chatbot_id, weight)
+            future.set_result(None)
+
+admission_controller = AdmissionController()
+llm_slots_in_flight.set_function(lambda: admission_controller.in_flight)
+llm_slots_queued.set_function(lambda: admission_controller.queued)
@@ -0,0 +1,154 @@
+from typing import List, Dict, Any, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from ..models import UsageRollup
+from datetime import datetime, timedelta
+
+GRANULARITIES = ("hour", "day")
+
+class AnalyticsService:
+    """Maintains hourly and daily usage rollups per chatbot.
+    
+    Rollup rows are upserted in the same transaction as the chat write that
+    produced them, so dashboards never need to scan chat_messages.
+    """
+    
+    def __init__(self):
+        pass
+    
+    def bucket_start(self, timestamp: datetime, granularity: str) -> datetime:
+        """Truncate a timestamp to the start of its rollup bucket"""
+        if granularity == "hour":
+            return timestamp.replace(minute=0, second=0, microsecond=0)
+        if granularity == "day":
+            return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+        raise ValueError(f"Unsupported granularity: {granularity}")
+    
+    def increment(self, db: Session, chatbot_id: int, timestamp: datetime, **deltas: int) -> None:
+        """Upsert the hourly and daily buckets for a chatbot. Caller commits."""
+        table = UsageRollup.__table__
+        for granularity in GRANULARITIES:
+            stmt = insert(table).values(
+                granularity=granularity,
+                bucket_start=self.bucket_start(timestamp, granularity),
+                chatbot_id=chatbot_id,
+                **deltas
+            )
+            stmt = stmt.on_conflict_do_update(
+                constraint="uq_usage_rollups_bucket",
+                set_={key: table.c[key] + value for key, value in deltas.items()}
+            )
+            db.execute(stmt)
+    
+    def record_session(self, db: Session, chatbot_id: int, timestamp: Optional[datetime] = None) -> None:
+        """Count a newly created chat session"""
+        self.increment(db, chatbot_id, timestamp or datetime.utcnow(), session_count=1)
+    
+    def record_message(
+        self,
+        db: Session,
+        chatbot_id: int,
+        context_used: bool,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        timestamp: Optional[datetime] = None
+    ) -> None:
+        """Count a chat message and the tokens it consumed"""
+        self.increment(
+            db,
+            chatbot_id,
+            timestamp or datetime.utcnow(),
+            message_count=1,
+            context_hit_count=1 if context_used else 0,
+            prompt_tokens=prompt_tokens or 0,
+            completion_tokens=completion_tokens or 0
+        )
+    
+    def default_range(self, granularity: str, start: Optional[datetime], end: Optional[datetime]) -> tuple:
+        """Fill in a missing time range: last 24 hours for hourly, last 30 days for daily"""
+        end = end or datetime.utcnow()
+        if not start:
+            start = end - (timedelta(hours=24) if granularity == "hour" else timedelta(days=30))
+        return self.bucket_start(start, granularity), end
+    
+    def _usage_query(self, db: Session, start: datetime, end: datetime, granularity: str, *group_by):
+        """Build an aggregate query over rollup buckets in a time range"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+        
+        return db.query(
+            *group_by,
+            func.sum(UsageRollup.message_count),
+            func.sum(UsageRollup.session_count),
+            func.sum(UsageRollup.context_hit_count),
+            func.sum(UsageRollup.prompt_tokens),
+            func.sum(UsageRollup.completion_tokens)
+        ).filter(
+            UsageRollup.granularity == granularity,
+            UsageRollup.bucket_start >= start,
+            UsageRollup.bucket_start < end
+        )
+    
+    def get_usage_totals(
+        self,
+        db: Session,
+        start: datetime,
+        end: datetime,
+        granularity: str = "day",
+        chatbot_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Get usage totals in a time range, optionally for a single chatbot"""
+        query = self._usage_query(db, start, end, granularity)
+        if chatbot_id is not None:
+            query = query.filter(UsageRollup.chatbot_id == chatbot_id)
+        return self._format_usage(*query.one())
+    
+    def get_usage_series(
+        self,
+        db: Session,
+        start: datetime,
+        end: datetime,
+        granularity: str = "day",
+        chatbot_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Get per-bucket usage in a time range, summed over chatbots unless one is given"""
+        query = self._usage_query(db, start, end, granularity, UsageRollup.bucket_start)
+        if chatbot_id is not None:
+            query = query.filter(UsageRollup.chatbot_id == chatbot_id)
+        
+        rows = query.group_by(UsageRollup.bucket_start).order_by(UsageRollup.bucket_start).all()
+        return [
+            self._format_usage(messages, sessions, hits, prompt_tokens, completion_tokens, bucket_start=bucket)
+            for bucket, messages, sessions, hits, prompt_tokens, completion_tokens in rows
+        ]
+    
+    def get_usage_by_chatbot(
+        self,
+        db: Session,
+        start: datetime,
+        end: datetime,
+        granularity: str = "day"
+    ) -> List[Dict[str, Any]]:
+        """Get usage totals per chatbot in a time range"""
+        rows = self._usage_query(
+            db, start, end, granularity, UsageRollup.chatbot_id
+        ).group_by(UsageRollup.chatbot_id).all()
+        
+        return [
+            self._format_usage(messages, sessions, hits, prompt_tokens, completion_tokens, chatbot_id=chatbot_id)
+            for chatbot_id, messages, sessions, hits, prompt_tokens, completion_tokens in rows
+        ]
+    
+    def _format_usage(self, messages, sessions, hits, prompt_tokens, completion_tokens, **extra) -> Dict[str, Any]:
+        """Shape an aggregated rollup row for API responses"""
+        messages = int(messages or 0)
+        hits = int(hits or 0)
+        return {
+            **extra,
+            "messages": messages,
+            "sessions": int(sessions or 0),
+            "prompt_tokens": int(prompt_tokens or 0),
+            "completion_tokens": int(completion_tokens or 0),
+            "context_hit_rate": round(hits / messages, 4) if messages else 0.0
+        }
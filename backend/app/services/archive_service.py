@@ -0,0 +1,286 @@
+import os
+import re
+from datetime import datetime, date
+from typing import List, Dict, Any, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from .background import PeriodicTask, register_periodic_task
+
+PARTITION_NAME = re.compile(r"^chat_messages_y(\d{4})m(\d{2})$")
+ARCHIVE_NAME = re.compile(r"^chat_messages_(\d{4})_(\d{2})\.parquet$")
+
+# Matches the chat_messages columns (plus chatbot_id) so archived turns keep their flags
+ARCHIVE_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("session_id", pa.string()),
+    ("chatbot_id", pa.int64()),
+    ("message", pa.string()),
+    ("response", pa.string()),
+    ("context_chunks", pa.list_(pa.string())),
+    ("retrieval_decision", pa.string()),
+    ("degraded", pa.bool_()),
+    ("abandoned", pa.bool_()),
+    ("created_at", pa.timestamp("us"))
+])
+
+def add_months(month: date, months: int) -> date:
+    """Return the first day of the month ``months`` after ``month``"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+class ArchiveService:
+    """Monthly partitions of chat_messages and their Parquet archive.
+    
+    Partitions are created a few months ahead. Once a month falls outside
+    the CHAT_RETENTION_MONTHS window its partition is exported to a
+    compressed Parquet file under CHAT_ARCHIVE_DIR, then detached and
+    dropped; the chatbots' message counters drop its turns in the same
+    transaction, so they keep matching the live table.
+    """
+    
+    def __init__(self):
+        self.archive_dir = os.getenv("CHAT_ARCHIVE_DIR", "archive")
+        self.retention_months = int(os.getenv("CHAT_RETENTION_MONTHS", 0))
+        self.months_ahead = int(os.getenv("CHAT_PARTITION_MONTHS_AHEAD", 3))
+        self.export_batch_size = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", 10000))
+    
+    def is_partitioned(self, db: Session) -> bool:
+        """Check whether chat_messages has been converted to a partitioned table"""
+        return db.execute(text(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('chat_messages')"
+        )).scalar() or False
+    
+    def partition_name(self, month: date) -> str:
+        return f"chat_messages_y{month.year:04d}m{month.month:02d}"
+    
+    def ensure_partitions(self, db: Session) -> List[str]:
+        """Create the default partition and monthly partitions through months_ahead.
+        
+        Months whose rows ended up in the default partition (written before
+        their partition existed) get a partition too, so they are archived
+        like any other month.
+        """
+        if not self.is_partitioned(db):
+            return []
+        
+        db.execute(text("CREATE TABLE IF NOT EXISTS chat_messages_default PARTITION OF chat_messages DEFAULT"))
+        existing = {partition["name"] for partition in self.list_partitions(db)}
+        current = date.today().replace(day=1)
+        months = {add_months(current, offset) for offset in range(self.months_ahead + 1)}
+        months.update(db.execute(text(
+            "SELECT DISTINCT date_trunc('month', created_at)::date FROM chat_messages_default"
+        )).scalars())
+        
+        created = []
+        for month in sorted(months):
+            name = self.partition_name(month)
+            if name in existing:
+                continue
+            self.create_partition(db, month)
+            created.append(name)
+        db.commit()
+        return created
+    
+    def create_partition(self, db: Session, month: date) -> None:
+        """Create one month's partition, moving any of its rows out of the default partition"""
+        name = self.partition_name(month)
+        start, end = month.isoformat(), add_months(month, 1).isoformat()
+        in_default = db.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM chat_messages_default WHERE created_at >= :start AND created_at < :end)"
+        ), {"start": start, "end": end}).scalar()
+        if not in_default:
+            db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF chat_messages "
+                f"FOR VALUES FROM ('{start}') TO ('{end}')"
+            ))
+            return
+        
+        # CREATE ... PARTITION OF fails while the default partition holds rows in the range:
+        # build the table detached, move the rows across, then attach it
+        db.execute(text(f"CREATE TABLE {name} (LIKE chat_messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        moved = db.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM chat_messages_default
+                WHERE created_at >= '{start}' AND created_at < '{end}'
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """)).rowcount
+        db.execute(text(f"ALTER TABLE chat_messages ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+        print(f"Moved {moved} chat messages from chat_messages_default into {name}")
+    
+    def list_partitions(self, db: Session) -> List[Dict[str, Any]]:
+        """List monthly partitions of chat_messages, oldest first"""
+        rows = db.execute(text("""
+            SELECT child.relname AS name
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = 'chat_messages'
+        """)).fetchall()
+        
+        partitions = []
+        for row in rows:
+            match = PARTITION_NAME.match(row.name)
+            if match:
+                partitions.append({"name": row.name, "month": date(int(match.group(1)), int(match.group(2)), 1)})
+        return sorted(partitions, key=lambda partition: partition["month"])
+    
+    def archive_path(self, month: date) -> str:
+        return os.path.join(self.archive_dir, f"chat_messages_{month.year:04d}_{month.month:02d}.parquet")
+    
+    def export_partition(self, db: Session, partition: Dict[str, Any]) -> int:
+        """Stream a partition to a zstd-compressed Parquet file, returning the row count"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = self.archive_path(partition["month"])
+        temp_path = path + ".tmp"
+        
+        # Resolve chatbot_id now: the session may be gone by the time the archive is read
+        query = text(f"""
+            SELECT cm.id, cm.session_id, cs.chatbot_id, cm.message, cm.response,
+                   cm.context_chunks, cm.retrieval_decision, cm.degraded, cm.abandoned, cm.created_at
+            FROM {partition['name']} cm
+            LEFT JOIN chat_sessions cs ON cs.session_id = cm.session_id
+            ORDER BY cm.created_at, cm.id
+        """)
+        schema = ARCHIVE_SCHEMA
+        
+        rows_written = 0
+        connection = db.connection().execution_options(stream_results=True)
+        with pq.ParquetWriter(temp_path, schema, compression="zstd") as writer:
+            if os.path.exists(path):
+                # The month was archived before and has since received late rows: keep the earlier archive's rows
+                previous = pq.read_table(path)
+                for column in schema:
+                    if column.name not in previous.column_names:
+                        # Flags added after that archive was written were false for every row in it
+                        fill = pa.array([False] * len(previous)) if column.type == pa.bool_() else pa.nulls(len(previous), column.type)
+                        previous = previous.append_column(column, fill)
+                writer.write_table(previous.select(schema.names).cast(schema))
+                rows_written += len(previous)
+            for chunk in pd.read_sql(query, connection, chunksize=self.export_batch_size):
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                rows_written += len(chunk)
+        os.replace(temp_path, path)
+        return rows_written
+    
+    def archive_expired_partitions(self, db: Session) -> List[Dict[str, Any]]:
+        """Export, detach and drop partitions older than the retention window"""
+        if self.retention_months <= 0 or not self.is_partitioned(db):
+            return []
+        
+        cutoff = add_months(date.today().replace(day=1), -self.retention_months)
+        archived = []
+        for partition in self.list_partitions(db):
+            if partition["month"] >= cutoff:
+                break
+            rows = self.export_partition(db, partition)
+            db.rollback()  # end the read transaction before taking the DDL lock
+            db.execute(text(f"ALTER TABLE chat_messages DETACH PARTITION {partition['name']}"))
+            self.release_message_counters(db, partition)
+            db.execute(text(f"DROP TABLE {partition['name']}"))
+            db.commit()
+            archived.append({"partition": partition["name"], "rows": rows, "file": self.archive_path(partition["month"])})
+            print(f"Archived {rows} chat messages from {partition['name']}")
+        return archived
+    
+    def release_message_counters(self, db: Session, partition: Dict[str, Any]) -> None:
+        """Take a partition's counted (not abandoned) turns off the per-chatbot message counters"""
+        db.execute(text(f"""
+            UPDATE chatbot_counters AS counters
+            SET message_count = GREATEST(counters.message_count - archived.messages, 0),
+                updated_at = :now
+            FROM (
+                SELECT s.chatbot_id, count(*) AS messages
+                FROM {partition['name']} m
+                JOIN chat_sessions s ON s.session_id = m.session_id
+                WHERE NOT m.abandoned
+                GROUP BY s.chatbot_id
+            ) AS archived
+            WHERE counters.chatbot_id = archived.chatbot_id
+        """), {"now": datetime.utcnow()})
+    
+    def list_archives(self) -> List[Dict[str, Any]]:
+        """List archived months available on disk"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        
+        archives = []
+        for filename in sorted(os.listdir(self.archive_dir)):
+            match = ARCHIVE_NAME.match(filename)
+            if not match:
+                continue
+            path = os.path.join(self.archive_dir, filename)
+            archives.append({
+                "month": f"{match.group(1)}-{match.group(2)}",
+                "file": filename,
+                "size_bytes": os.path.getsize(path),
+                "rows": pq.ParquetFile(path).metadata.num_rows
+            })
+        return archives
+    
+    def query_archive(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        chatbot_id: Optional[int] = None,
+        session_id: Optional[str] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Read archived messages matching the filters, oldest first (abandoned turns excluded)"""
+        filters = []
+        if start:
+            filters.append(("created_at", ">=", pd.Timestamp(start)))
+        if end:
+            filters.append(("created_at", "<", pd.Timestamp(end)))
+        if chatbot_id is not None:
+            filters.append(("chatbot_id", "==", chatbot_id))
+        if session_id:
+            filters.append(("session_id", "==", session_id))
+        
+        results = []
+        for archive in self.list_archives():
+            month = datetime.strptime(archive["month"], "%Y-%m")
+            # Skip files entirely outside the requested range
+            if end and month >= end:
+                continue
+            if start and add_months(month.date(), 1) <= start.date():
+                continue
+            
+            path = os.path.join(self.archive_dir, archive["file"])
+            file_filters = list(filters)
+            # Archives written before the abandoned column existed hold no abandoned turns
+            if "abandoned" in pq.read_schema(path).names:
+                file_filters.append(("abandoned", "==", False))
+            table = pq.read_table(path, filters=file_filters or None)
+            for record in table.slice(0, limit - len(results)).to_pylist():
+                results.append(record)
+            if len(results) >= limit:
+                break
+        return results
+
+def prepare_partitions() -> None:
+    """Create this month's and the upcoming partitions before serving traffic"""
+    db = SessionLocal()
+    try:
+        ArchiveService().ensure_partitions(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Error creating chat message partitions: {e}")
+    finally:
+        db.close()
+
+def _maintain_partitions(db: Session) -> None:
+    archive_service = ArchiveService()
+    archive_service.ensure_partitions(db)
+    archive_service.archive_expired_partitions(db)
+
+register_periodic_task(PeriodicTask(
+    "chat-message-partitions",
+    float(os.getenv("CHAT_PARTITION_MAINTENANCE_INTERVAL", 86400)),
+    _maintain_partitions
+))
@@ -0,0 +1,69 @@
+import asyncio
+from typing import Callable, List, Optional
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+
+class PeriodicTask:
+    """Runs a blocking maintenance function on an interval with its own DB session.
+    
+    The function runs in a worker thread so slow maintenance queries never
+    block the event loop.
+    """
+    
+    def __init__(self, name: str, interval_seconds: float, func: Callable[[Session], None], run_at_start: bool = True):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.run_at_start = run_at_start
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Schedule the task on the running event loop"""
+        if self._task is None and self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+    
+    async def stop(self) -> None:
+        """Cancel the task and wait for it to exit"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+    
+    def run_once(self) -> None:
+        """Run the function once in the calling thread"""
+        db = SessionLocal()
+        try:
+            self.func(db)
+        finally:
+            db.close()
+    
+    async def _run(self) -> None:
+        if not self.run_at_start:
+            await asyncio.sleep(self.interval_seconds)
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"Error in background task {self.name}: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+periodic_tasks: List[PeriodicTask] = []
+
+def register_periodic_task(task: PeriodicTask) -> PeriodicTask:
+    """Register a task to be started with the application"""
+    periodic_tasks.append(task)
+    return task
+
+def start_periodic_tasks() -> None:
+    """Start all registered tasks"""
+    for task in periodic_tasks:
+        task.start()
+
+async def stop_periodic_tasks() -> None:
+    """Stop all registered tasks"""
+    for task in periodic_tasks:
+        await task.stop()
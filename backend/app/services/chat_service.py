@@ -1,12 +1,38 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Optional
 from sqlalchemy.orm import Session
+from sqlalchemy import tuple_
+from sqlalchemy.exc import OperationalError
+from psycopg2.errors import QueryCanceled
 from .embeddings import EmbeddingService
 from .document_processor import DocumentProcessor
 from .admin_service import AdminService
 from .chatbot_service import ChatbotService
+from .analytics_service import AnalyticsService
+from .config_cache import config_cache, ChatbotConfig
+from .write_behind import chat_write_buffer
+from .retrieval_planner import RetrievalPlanner, RETRIEVAL_SEARCH, RETRIEVAL_REUSE, RETRIEVAL_MERGE
+from .working_set import session_working_sets, as_vector, cosine_similarity
+from .providers import embedding_space_for
+from .memory_service import ConversationMemory
+from .singleflight import SingleFlight
+from .admission import admission_controller
+from .deadline import Deadline, DeadlineExceeded
+from .resilience import CircuitOpenError
+from .fallback import FallbackResponder, normalize_message
+from .metrics import stage, set_chatbot
+from datetime import datetime
+from ..database import SessionLocal
 from ..models import ChatSession, ChatMessage, Chatbot
+import asyncio
 import uuid
 import os
+import base64
+
+# Sort key used in history cursors for messages not yet assigned an id
+PENDING_MESSAGE_ID = 2**31 - 1
+
+# Identical first-turn messages to the same chatbot that are in flight at the same time
+response_calls = SingleFlight()
 
 class ChatService:
     def __init__(self, embedding_service: EmbeddingService, document_processor: DocumentProcessor):
@@ -14,7 +40,41 @@ class ChatService:
         self.document_processor = document_processor
         self.admin_service = AdminService()
         self.chatbot_service = ChatbotService()
+        self.analytics_service = AnalyticsService()
+        self.retrieval_planner = RetrievalPlanner()
+        self.memory = ConversationMemory(embedding_service)
+        self.fallback = FallbackResponder()
+        self.request_timeout = float(os.getenv("CHAT_REQUEST_TIMEOUT", 30))
         self.top_k_results = int(os.getenv("TOP_K_RESULTS", 5))
+        self.coalesce_requests = os.getenv("CHAT_COALESCE_REQUESTS", "true").lower() == "true"
+    
+    def get_retrieval_settings(self, chatbot: ChatbotConfig, db: Session) -> Tuple[float, int]:
+        """Resolve similarity threshold and context size: chatbot settings, then admin settings, then defaults"""
+        bot_settings = chatbot.settings or {}
+        threshold = bot_settings.get("similarity_threshold")
+        if threshold is None:
+            threshold = config_cache.get_setting(db, "similarity_threshold")
+        max_chunks = bot_settings.get("max_context_chunks")
+        if max_chunks is None:
+            max_chunks = config_cache.get_setting(db, "max_context_chunks")
+        
+        try:
+            threshold = float(threshold) if threshold is not None else 0.7
+        except (TypeError, ValueError):
+            threshold = 0.7
+        try:
+            max_chunks = int(max_chunks) if max_chunks is not None else self.top_k_results
+        except (TypeError, ValueError):
+            max_chunks = self.top_k_results
+        
+        return threshold, max_chunks
+    
+    def get_request_timeout(self, chatbot: ChatbotConfig) -> float:
+        """End-to-end deadline in seconds: chatbot setting, then CHAT_REQUEST_TIMEOUT"""
+        try:
+            return float((chatbot.settings or {}).get("request_timeout_seconds", self.request_timeout))
+        except (TypeError, ValueError):
+            return self.request_timeout
     
     def get_or_create_session(self, session_id: str, chatbot_id: int, db: Session) -> ChatSession:
         """Get existing session or create new one"""
@@ -22,37 +82,160 @@ class ChatService:
         if not session:
             session = ChatSession(session_id=session_id, chatbot_id=chatbot_id)
             db.add(session)
+            self.chatbot_service.increment_counters(db, [chatbot_id], session_count=1)
+            self.analytics_service.record_session(db, chatbot_id)
             db.commit()
             db.refresh(session)
         return session
     
-    async def generate_response(self, message: str, session_id: str, chatbot_id: int, db: Session) -> Dict[str, Any]:
-        """Generate chatbot response using RAG"""
-        # Get chatbot
-        chatbot = self.chatbot_service.get_chatbot(db, chatbot_id)
-        if not chatbot or not chatbot.is_active:
-            raise ValueError(f"Chatbot with id {chatbot_id} not found or inactive")
+    async def ensure_session(self, session_id: str, chatbot_id: int, db: Session) -> None:
+        """Make sure a session exists, buffering its creation when write-behind is enabled"""
+        if not chat_write_buffer.enabled:
+            self.get_or_create_session(session_id, chatbot_id, db)
+            return
+        
+        if chat_write_buffer.get_pending_session(session_id):
+            return
+        if db.query(ChatSession.id).filter(ChatSession.session_id == session_id).first():
+            return
+        if chat_write_buffer.is_full():
+            # Backpressure: drain the buffer before accepting more writes
+            await chat_write_buffer.flush_async()
+        if not chat_write_buffer.add_session(session_id, chatbot_id):
+            self.get_or_create_session(session_id, chatbot_id, db)
+    
+    async def save_message(self, record: Dict[str, Any], db: Session) -> None:
+        """Persist a chat message, through the write-behind buffer when enabled"""
+        if chat_write_buffer.enabled:
+            if chat_write_buffer.is_full():
+                await chat_write_buffer.flush_async()
+            if chat_write_buffer.add_message(record):
+                return
+            # Buffer is still full: make sure the session row exists before writing directly
+            self.get_or_create_session(record["session_id"], record["chatbot_id"], db)
+        
+        chat_message = ChatMessage(
+            session_id=record["session_id"],
+            message=record["message"],
+            response=record["response"],
+            context_chunks=record["context_chunks"],
+            retrieval_decision=record["retrieval_decision"],
+            degraded=record["degraded"],
+            abandoned=record["abandoned"],
+            created_at=record["created_at"]
+        )
+        db.add(chat_message)
+        if record["abandoned"]:
+            # Kept for auditing only: not part of the history, counters or usage
+            db.commit()
+            return
+        db.query(ChatSession).filter(ChatSession.session_id == record["session_id"]).update(
+            {ChatSession.message_count: ChatSession.message_count + 1}, synchronize_session=False
+        )
+        self.chatbot_service.increment_counters(db, [record["chatbot_id"]], message_count=1)
+        self.analytics_service.record_message(
+            db,
+            record["chatbot_id"],
+            context_used=len(record["context_chunks"]) > 0,
+            prompt_tokens=record["prompt_tokens"],
+            completion_tokens=record["completion_tokens"],
+            timestamp=record["created_at"]
+        )
+        db.commit()
+    
+    async def retrieve(
+        self, message: str, session_id: str, chatbot: ChatbotConfig, db: Session, max_chunks: int, deadline: Deadline
+    ) -> Tuple[List[Tuple[Any, float]], str]:
+        """Retrieve context chunks, reusing the session's working set for close follow-ups"""
+        space = embedding_space_for(chatbot.settings)
+        with stage("embedding"):
+            query_embedding = as_vector(await deadline.run(self.embedding_service.get_embedding(message, space)))
+        
+        decision = RETRIEVAL_SEARCH
+        cached = []
+        working_set = session_working_sets.get(session_id, chatbot)
+        if working_set is not None:
+            decision = self.retrieval_planner.plan_follow_up(
+                cosine_similarity(query_embedding, working_set.query_embedding)
+            )
+            cached = working_set.chunks
         
-        # Get or create session
-        session = self.get_or_create_session(session_id, chatbot_id, db)
+        if decision == RETRIEVAL_REUSE:
+            candidates = list(cached)
+        else:
+            # A close follow-up only needs a narrower search on top of the previous turn's chunks
+            top_k = max(1, max_chunks // 2) if decision == RETRIEVAL_MERGE else max_chunks
+            timeout_ms = deadline.statement_timeout_ms()
+            if timeout_ms is None:
+                raise DeadlineExceeded("No time left for the vector search")
+            try:
+                found = self.document_processor.search_chunks_by_embedding(
+                    query_embedding.tolist(), chatbot.id, db, top_k, timeout_ms=timeout_ms, space_key=space.key
+                )
+            except OperationalError as e:
+                if not isinstance(e.orig, QueryCanceled):
+                    raise
+                db.rollback()
+                raise DeadlineExceeded("Vector search hit the request deadline")
+            candidates = [(chunk, as_vector(chunk.embedding)) for chunk, _ in found]
+            if decision == RETRIEVAL_MERGE:
+                seen = {chunk.id for chunk, _ in candidates}
+                candidates += [(chunk, embedding) for chunk, embedding in cached if chunk.id not in seen]
         
-        # Search for relevant document chunks from chatbot's documents only
-        similar_chunks = await self.document_processor.search_similar_chunks_for_chatbot(
-            message, chatbot_id, db, self.top_k_results
+        # Re-score every candidate against the current query
+        scored = sorted(
+            ((chunk, embedding, cosine_similarity(query_embedding, embedding)) for chunk, embedding in candidates),
+            key=lambda item: item[2],
+            reverse=True
+        )[:max_chunks]
+        session_working_sets.put(
+            session_id, chatbot, query_embedding, [(chunk, embedding) for chunk, embedding, _ in scored]
         )
+        return [(chunk, score) for chunk, _, score in scored], decision
+    
+    async def answer(
+        self,
+        message: str,
+        session_id: str,
+        chatbot: ChatbotConfig,
+        db: Session,
+        similarity_threshold: float,
+        max_context_chunks: int,
+        memory_messages: List[Dict[str, str]],
+        deadline: Deadline
+    ) -> Dict[str, Any]:
+        """Run retrieval and the completion for one message within the request deadline.
         
-        # Build context from similar chunks
-        context_texts = []
-        context_chunk_ids = []
+        If the deadline runs out or the provider's circuit is open the answer
+        is degraded: a cached answer, or the top retrieved chunks quoted verbatim.
+        """
+        degraded = False
         
-        for chunk, score in similar_chunks:
-            if score > 0.7:  # Only include chunks with high similarity
-                context_texts.append(f"From {chunk.document_filename}: {chunk.chunk_text}")
-                context_chunk_ids.append(str(chunk.id))
+        # Skip the embedding call and vector search when they cannot help
+        retrieval_decision = self.retrieval_planner.plan(message, chatbot, follow_up=bool(memory_messages))
+        similar_chunks = []
+        if retrieval_decision == RETRIEVAL_SEARCH:
+            # Search for relevant document chunks from chatbot's documents only
+            try:
+                similar_chunks, retrieval_decision = await self.retrieve(
+                    message, session_id, chatbot, db, max_context_chunks, deadline
+                )
+            except (DeadlineExceeded, CircuitOpenError):
+                degraded = True
         
-        # Use chatbot's system prompt and append markdown instructions
-        base_prompt = chatbot.system_prompt
-        markdown_instructions = """
+        with stage("prompt") as span:
+            # Build context from similar chunks
+            context_texts = []
+            context_chunk_ids = []
+            
+            for chunk, score in similar_chunks:
+                if score > similarity_threshold:  # Only include chunks with high similarity
+                    context_texts.append(f"From {chunk.document_filename}: {chunk.chunk_text}")
+                    context_chunk_ids.append(str(chunk.id))
+            
+            # Use chatbot's system prompt and append markdown instructions
+            base_prompt = chatbot.system_prompt
+            markdown_instructions = """
 
 Format your responses using markdown for better readability:
 - Use **bold** for important terms
@@ -61,66 +244,274 @@ Format your responses using markdown for better readability:
 - Use ## headings for sections
 - Use bullet points or numbered lists when appropriate
 - Use code blocks for longer code examples"""
+
+            system_prompt = base_prompt + markdown_instructions
+            
+            context_prompt = ""
+            if context_texts:
+                context_prompt = "\n\nContext information:\n" + "\n\n".join(context_texts)
+            
+            # Prepare messages for OpenAI
+            messages = [
+                {"role": "system", "content": system_prompt + context_prompt},
+                *memory_messages,
+                {"role": "user", "content": message}
+            ]
+            span.set_attribute("prompt.context_chunks", len(context_chunk_ids))
+            span.set_attribute("prompt.history_messages", len(memory_messages))
         
-        system_prompt = base_prompt + markdown_instructions
+        # Get response from OpenAI
+        if not degraded:
+            try:
+                with stage("completion") as span:
+                    response, usage = await deadline.run(self.embedding_service.get_chat_completion_with_usage(messages))
+                    span.set_attribute("gen_ai.usage.input_tokens", usage["prompt_tokens"])
+                    span.set_attribute("gen_ai.usage.output_tokens", usage["completion_tokens"])
+            except (DeadlineExceeded, CircuitOpenError):
+                degraded = True
         
-        context_prompt = ""
-        if context_texts:
-            context_prompt = "\n\nContext information:\n" + "\n\n".join(context_texts)
+        if degraded:
+            response = self.fallback.respond(
+                chatbot.id, message, [(chunk, score) for chunk, score in similar_chunks if score > similarity_threshold]
+            )
+            usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        elif not memory_messages:
+            self.fallback.remember(chatbot.id, message, response)
         
-        # Prepare messages for OpenAI
-        messages = [
-            {"role": "system", "content": system_prompt + context_prompt},
-            {"role": "user", "content": message}
-        ]
-        
-        # Get response from OpenAI
-        response = await self.embedding_service.get_chat_completion(messages)
+        return {
+            "response": response,
+            "usage": usage,
+            "degraded": degraded,
+            "context_chunks": context_chunk_ids,
+            "retrieval_decision": retrieval_decision,
+            "sources": [chunk.document_filename for chunk, score in similar_chunks if score > similarity_threshold]
+        }
+    
+    async def save_abandoned(self, session_id: str, chatbot_id: int, message: str, db: Session) -> None:
+        """Record a turn the client disconnected from; never raises, so the cancellation is what propagates"""
+        try:
+            await self.save_message({
+                "session_id": session_id,
+                "chatbot_id": chatbot_id,
+                "message": message,
+                "response": "",
+                "context_chunks": [],
+                "retrieval_decision": None,
+                "degraded": False,
+                "abandoned": True,
+                "created_at": datetime.utcnow(),
+                "prompt_tokens": 0,
+                "completion_tokens": 0
+            }, db)
+        except Exception as e:
+            db.rollback()
+            print(f"Error recording abandoned message for session {session_id}: {e}")
+    
+    def deadline_fallback(self, chatbot: ChatbotConfig, message: str) -> Dict[str, Any]:
+        """Degraded answer for a request whose deadline ran out before it could run"""
+        return {
+            "response": self.fallback.respond(chatbot.id, message, []),
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0},
+            "degraded": True,
+            "context_chunks": [],
+            "retrieval_decision": None,
+            "sources": []
+        }
+    
+    def can_coalesce(self, session_id: str, chatbot: ChatbotConfig, memory_messages: List[Dict[str, str]]) -> bool:
+        """Whether this request's answer depends only on the chatbot and the message.
         
-        # Store chat message
-        chat_message = ChatMessage(
-            session_id=session_id,
-            message=message,
-            response=response,
-            context_chunks=context_chunk_ids
+        Conversation memory and the session's retrieval working set (which
+        drives REUSE/MERGE in retrieve) are per session, so a request with
+        either must not share another session's answer.
+        """
+        return (
+            self.coalesce_requests
+            and not memory_messages
+            and session_working_sets.get(session_id, chatbot) is None
         )
-        db.add(chat_message)
-        db.commit()
+    
+    async def answer_shared(
+        self,
+        message: str,
+        session_id: str,
+        chatbot: ChatbotConfig,
+        similarity_threshold: float,
+        max_context_chunks: int,
+        deadline: Deadline
+    ) -> Dict[str, Any]:
+        """Answer a first-turn message on behalf of every identical concurrent request.
+        
+        Uses its own database session because the requests sharing the result
+        may finish (and close theirs) in any order.
+        """
+        db = SessionLocal()
+        try:
+            async with admission_controller.slot(chatbot, deadline.remaining()):
+                return await self.answer(
+                    message, session_id, chatbot, db, similarity_threshold, max_context_chunks, [], deadline
+                )
+        finally:
+            db.close()
+    
+    async def generate_response(self, message: str, session_id: str, chatbot_id: int, db: Session) -> Dict[str, Any]:
+        """Generate chatbot response using RAG"""
+        set_chatbot(chatbot_id)
+        # Get chatbot config from the in-process cache
+        with stage("config"):
+            chatbot = config_cache.get_chatbot(db, chatbot_id)
+        if not chatbot or not chatbot.is_active:
+            raise ValueError(f"Chatbot with id {chatbot_id} not found or inactive")
+        
+        # Reject over-limit traffic before doing any work
+        admission_controller.check_rate(chatbot)
+        deadline = Deadline(self.get_request_timeout(chatbot))
+        
+        similarity_threshold, max_context_chunks = self.get_retrieval_settings(chatbot, db)
+        
+        with stage("history"):
+            # Get or create session
+            await self.ensure_session(session_id, chatbot_id, db)
+            
+            # Conversation memory: rolling summary plus the last few turns verbatim
+            memory_row = db.query(
+                ChatSession.summary, ChatSession.summary_message_count, ChatSession.message_count
+            ).filter(ChatSession.session_id == session_id).first()
+            summary, summary_message_count, message_count = memory_row or (None, 0, 0)
+            history_limit = self.memory.history_limit(message_count or 0, summary_message_count or 0)
+            history = self.get_chat_history(session_id, db, history_limit) if history_limit else []
+            memory_messages = self.memory.build_messages(summary, history)
+        
+        try:
+            if self.can_coalesce(session_id, chatbot, memory_messages):
+                key = (chatbot_id, normalize_message(message))
+                result, shared = await response_calls.do(key, lambda: self.answer_shared(
+                    message, session_id, chatbot, similarity_threshold, max_context_chunks, deadline
+                ))
+            else:
+                async with admission_controller.slot(chatbot, deadline.remaining()):
+                    result = await self.answer(
+                        message, session_id, chatbot, db, similarity_threshold, max_context_chunks, memory_messages, deadline
+                    )
+                shared = False
+        except DeadlineExceeded:
+            # The deadline ran out while waiting for an LLM slot: degrade rather than reject
+            result, shared = self.deadline_fallback(chatbot, message), False
+        except asyncio.CancelledError:
+            # The client went away: the in-flight LLM calls were cancelled with us, record the turn as abandoned
+            await self.save_abandoned(session_id, chatbot_id, message, db)
+            raise
+        
+        # Store chat message; tokens are only counted once for a shared completion
+        with stage("persist"):
+            await self.save_message({
+                "session_id": session_id,
+                "chatbot_id": chatbot_id,
+                "message": message,
+                "response": result["response"],
+                "context_chunks": result["context_chunks"],
+                "retrieval_decision": result["retrieval_decision"],
+                "degraded": result["degraded"],
+                "abandoned": False,
+                "created_at": datetime.utcnow(),
+                "prompt_tokens": 0 if shared else result["usage"]["prompt_tokens"],
+                "completion_tokens": 0 if shared else result["usage"]["completion_tokens"]
+            }, db)
+        self.memory.schedule_refresh(session_id, (message_count or 0) + 1, summary_message_count or 0)
         
         return {
-            "response": response,
+            "response": result["response"],
             "session_id": session_id,
-            "context_used": len(context_chunk_ids) > 0,
-            "sources": [chunk.document_filename for chunk, _ in similar_chunks if _ > 0.7]
+            "context_used": len(result["context_chunks"]) > 0,
+            "sources": result["sources"],
+            "degraded": result["degraded"]
         }
     
-    def get_chat_history(self, session_id: str, db: Session, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get chat history for a session"""
-        messages = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id
-        ).order_by(ChatMessage.created_at.desc()).limit(limit).all()
+    def encode_history_cursor(self, created_at: datetime, message_id: Optional[int]) -> str:
+        """Encode the position of the oldest returned message as an opaque cursor"""
+        position = f"{created_at.isoformat()}|{message_id if message_id is not None else PENDING_MESSAGE_ID}"
+        return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+    
+    def decode_history_cursor(self, cursor: str) -> Tuple[datetime, int]:
+        """Decode a history cursor, raising ValueError if it is malformed"""
+        try:
+            created_at, message_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+            return datetime.fromisoformat(created_at), int(message_id)
+        except Exception:
+            raise ValueError("Invalid history cursor")
+    
+    def get_chat_history_page(self, session_id: str, db: Session, limit: int = 10, before: Optional[str] = None) -> Dict[str, Any]:
+        """Get one page of chat history, newest first, using keyset pagination.
+        
+        Messages older than the ``before`` cursor are read through the
+        (session_id, created_at, id) index, so every page costs the same no
+        matter how long the session is. Messages still in the write-behind
+        buffer sort ahead of committed ones.
+        """
+        limit = max(limit, 0)
+        position = self.decode_history_cursor(before) if before else None
         
-        return [
+        query = db.query(ChatMessage).filter(ChatMessage.session_id == session_id, ChatMessage.abandoned.is_(False))
+        if position:
+            query = query.filter(tuple_(ChatMessage.created_at, ChatMessage.id) < position)
+        rows = query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1).all()
+        
+        candidates = [
+            (msg.created_at, msg.id, msg.message, msg.response, msg.context_chunks or [])
+            for msg in rows
+        ]
+        # A flush commits rows before dropping them from the buffer, so a row can briefly be in both
+        committed = {(msg.created_at, msg.message) for msg in rows}
+        for record in chat_write_buffer.get_pending_messages(session_id):
+            if (record["created_at"], record["message"]) in committed:
+                continue
+            if not position or (record["created_at"], PENDING_MESSAGE_ID) < position:
+                candidates.append((record["created_at"], None, record["message"], record["response"], record["context_chunks"]))
+        candidates.sort(key=lambda item: (item[0], item[1] if item[1] is not None else PENDING_MESSAGE_ID), reverse=True)
+        
+        page = candidates[:limit]
+        has_more = len(candidates) > limit
+        history = [
             {
-                "message": msg.message,
-                "response": msg.response,
-                "created_at": msg.created_at,
-                "context_used": len(msg.context_chunks or []) > 0
+                "id": message_id,
+                "message": message,
+                "response": response,
+                "created_at": created_at,
+                "context_used": len(context_chunks) > 0
             }
-            for msg in reversed(messages)
+            for created_at, message_id, message, response, context_chunks in reversed(page)
         ]
+        
+        return {
+            "history": history,
+            "has_more": has_more,
+            "next_cursor": self.encode_history_cursor(page[-1][0], page[-1][1]) if has_more and page else None
+        }
+    
+    def get_chat_history(self, session_id: str, db: Session, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the most recent chat history for a session"""
+        return self.get_chat_history_page(session_id, db, limit)["history"]
     
     def get_session(self, session_id: str, db: Session) -> ChatSession:
-        """Get session by ID"""
-        return db.query(ChatSession).filter(ChatSession.session_id == session_id).first()
+        """Get session by ID, falling back to a session still in the write-behind buffer"""
+        session = db.query(ChatSession).filter(ChatSession.session_id == session_id).first()
+        if not session:
+            pending = chat_write_buffer.get_pending_session(session_id)
+            if pending:
+                # Transient object, never added to the database session
+                session = ChatSession(**pending)
+        return session
     
-    def get_message_count(self, session_id: str, db: Session) -> int:
-        """Get message count for a session"""
-        return db.query(ChatMessage).filter(ChatMessage.session_id == session_id).count()
+    def get_message_count(self, session_id: str, db: Session, session: Optional[ChatSession] = None) -> int:
+        """Get message count for a session from its maintained counter"""
+        if session is None:
+            session = self.get_session(session_id, db)
+        pending_count = len(chat_write_buffer.get_pending_messages(session_id))
+        return (session.message_count or 0 if session else 0) + pending_count
     
     def get_session_with_chatbot_info(self, session_id: str, db: Session) -> Dict[str, Any]:
         """Get session with chatbot information for deep linking"""
-        session = db.query(ChatSession).filter(ChatSession.session_id == session_id).first()
+        session = self.get_session(session_id, db)
         if not session:
             return None
         
@@ -128,7 +519,7 @@ Format your responses using markdown for better readability:
         if not chatbot:
             return None
         
-        message_count = self.get_message_count(session_id, db)
+        message_count = self.get_message_count(session_id, db, session)
         
         return {
             "session_id": session.session_id,
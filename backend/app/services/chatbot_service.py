@@ -1,7 +1,9 @@
 from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from ..models import Chatbot, Document, ChatSession
+from sqlalchemy import and_, delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from ..models import Chatbot, ChatbotCounter, Document, ChatSession, ChatMessage, chatbot_documents
+from .config_cache import config_cache
 from datetime import datetime
 
 class ChatbotService:
@@ -19,6 +21,7 @@ class ChatbotService:
             system_prompt=system_prompt,
             settings=settings
         )
+        chatbot.counters = ChatbotCounter()
         db.add(chatbot)
         db.commit()
         db.refresh(chatbot)
@@ -26,15 +29,15 @@ class ChatbotService:
     
     def get_chatbot(self, db: Session, chatbot_id: int) -> Optional[Chatbot]:
         """Get a chatbot by ID"""
-        return db.query(Chatbot).filter(Chatbot.id == chatbot_id).first()
+        return db.query(Chatbot).filter(Chatbot.id == chatbot_id, Chatbot.deleted_at.is_(None)).first()
     
     def get_chatbot_by_name(self, db: Session, name: str) -> Optional[Chatbot]:
         """Get a chatbot by name"""
-        return db.query(Chatbot).filter(Chatbot.name == name).first()
+        return db.query(Chatbot).filter(Chatbot.name == name, Chatbot.deleted_at.is_(None)).first()
     
     def get_all_chatbots(self, db: Session, include_inactive: bool = False) -> List[Chatbot]:
         """Get all chatbots"""
-        query = db.query(Chatbot)
+        query = db.query(Chatbot).filter(Chatbot.deleted_at.is_(None))
         if not include_inactive:
             query = query.filter(Chatbot.is_active == True)
         return query.order_by(Chatbot.created_at.desc()).all()
@@ -50,18 +53,25 @@ class ChatbotService:
                 setattr(chatbot, key, value)
         
         chatbot.updated_at = datetime.utcnow()
+        config_cache.notify(db, f"chatbot:{chatbot_id}")
         db.commit()
+        config_cache.invalidate_chatbot(chatbot_id)
         db.refresh(chatbot)
         return chatbot
     
     def delete_chatbot(self, db: Session, chatbot_id: int) -> bool:
-        """Delete a chatbot and all associated data"""
+        """Soft-delete a chatbot; its sessions and messages are purged in the background"""
         chatbot = self.get_chatbot(db, chatbot_id)
         if not chatbot:
             return False
-            
-        db.delete(chatbot)
+        
+        chatbot.deleted_at = datetime.utcnow()
+        chatbot.is_active = False
+        # Free the unique name right away so it can be reused
+        chatbot.name = f"__deleted_{chatbot.id}_{chatbot.name}"[:255]
+        config_cache.notify(db, f"chatbot:{chatbot_id}")
         db.commit()
+        config_cache.invalidate_chatbot(chatbot_id)
         return True
     
     def activate_chatbot(self, db: Session, chatbot_id: int) -> Optional[Chatbot]:
@@ -75,63 +85,164 @@ class ChatbotService:
     def add_document_to_chatbot(self, db: Session, chatbot_id: int, document_id: int) -> bool:
         """Add a document to a chatbot"""
         chatbot = self.get_chatbot(db, chatbot_id)
-        document = db.query(Document).filter(Document.id == document_id).first()
+        document = db.query(Document.id, Document.chunk_count).filter(
+            Document.id == document_id, Document.deleted_at.is_(None)
+        ).first()
         
         if not chatbot or not document:
             return False
-            
-        if document not in chatbot.documents:
-            chatbot.documents.append(document)
+        
+        # The unique (chatbot_id, document_id) index tells us whether the link is new,
+        # without loading the chatbot's other documents
+        linked = db.execute(
+            insert(chatbot_documents).values(
+                chatbot_id=chatbot_id, document_id=document_id, created_at=datetime.utcnow()
+            ).on_conflict_do_nothing(
+                index_elements=["chatbot_id", "document_id"]
+            ).returning(chatbot_documents.c.id)
+        ).first()
+        if linked:
+            self.increment_counters(
+                db, [chatbot_id], document_count=1, chunk_count=document.chunk_count or 0
+            )
             db.commit()
+            config_cache.invalidate_chatbot(chatbot_id)
         return True
     
     def remove_document_from_chatbot(self, db: Session, chatbot_id: int, document_id: int) -> bool:
         """Remove a document from a chatbot"""
         chatbot = self.get_chatbot(db, chatbot_id)
-        document = db.query(Document).filter(Document.id == document_id).first()
+        document = db.query(Document.id, Document.chunk_count).filter(
+            Document.id == document_id, Document.deleted_at.is_(None)
+        ).first()
         
         if not chatbot or not document:
             return False
-            
-        if document in chatbot.documents:
-            chatbot.documents.remove(document)
+        
+        unlinked = db.execute(
+            delete(chatbot_documents).where(
+                chatbot_documents.c.chatbot_id == chatbot_id,
+                chatbot_documents.c.document_id == document_id
+            ).returning(chatbot_documents.c.id)
+        ).first()
+        if unlinked:
+            self.increment_counters(
+                db, [chatbot_id], document_count=-1, chunk_count=-(document.chunk_count or 0)
+            )
             db.commit()
+            config_cache.invalidate_chatbot(chatbot_id)
         return True
     
     def get_chatbot_documents(self, db: Session, chatbot_id: int) -> List[Document]:
         """Get all documents associated with a chatbot"""
-        chatbot = self.get_chatbot(db, chatbot_id)
-        if not chatbot:
+        if not self.get_chatbot(db, chatbot_id):
             return []
-        return chatbot.documents
+        return db.query(Document).join(
+            chatbot_documents, chatbot_documents.c.document_id == Document.id
+        ).filter(
+            chatbot_documents.c.chatbot_id == chatbot_id,
+            Document.deleted_at.is_(None)
+        ).all()
     
-    def get_chatbot_stats(self, db: Session, chatbot_id: int) -> Dict[str, Any]:
-        """Get statistics for a chatbot"""
-        chatbot = self.get_chatbot(db, chatbot_id)
-        if not chatbot:
-            return {}
+    def increment_counters(self, db: Session, chatbot_ids: List[int], **deltas: int) -> None:
+        """Atomically adjust materialized counters for the given chatbots.
         
-        document_count = len(chatbot.documents)
-        session_count = db.query(ChatSession).filter(ChatSession.chatbot_id == chatbot_id).count()
+        Uses an upsert so chatbots created before the counters table existed get
+        a row on first use. The caller is responsible for committing. Chunk
+        count changes invalidate the cached chatbot config, which carries the
+        count for the retrieval planner.
+        """
+        deltas = {key: value for key, value in deltas.items() if value}
+        if not chatbot_ids or not deltas:
+            return
+        
+        table = ChatbotCounter.__table__
+        for chatbot_id in chatbot_ids:
+            stmt = insert(table).values(
+                chatbot_id=chatbot_id,
+                updated_at=datetime.utcnow(),
+                **{key: max(value, 0) for key, value in deltas.items()}
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.chatbot_id],
+                set_={
+                    "updated_at": stmt.excluded.updated_at,
+                    **{key: table.c[key] + value for key, value in deltas.items()}
+                }
+            )
+            db.execute(stmt)
+            if "chunk_count" in deltas:
+                config_cache.notify(db, f"chatbot:{chatbot_id}")
+    
+    def release_document_counters(self, db: Session, document: Document) -> List[int]:
+        """Subtract a document from the counters of every chatbot it is linked to.
         
-        # Count total chunks across all documents
-        chunk_count = 0
-        for document in chatbot.documents:
-            chunk_count += len(document.chunks)
+        Must be called before the document (and its chatbot links) is deleted.
+        Returns the affected chatbot ids.
+        """
+        chatbot_ids = [
+            row.chatbot_id
+            for row in db.execute(
+                select(chatbot_documents.c.chatbot_id).where(chatbot_documents.c.document_id == document.id)
+            )
+        ]
+        self.increment_counters(
+            db, chatbot_ids, document_count=-1, chunk_count=-(document.chunk_count or 0)
+        )
+        return chatbot_ids
+    
+    def rebuild_counters(self, db: Session, chatbot_id: int) -> None:
+        """Recompute a chatbot's counters from the source tables"""
+        document_count, chunk_count = db.query(
+            func.count(Document.id), func.coalesce(func.sum(Document.chunk_count), 0)
+        ).join(chatbot_documents, chatbot_documents.c.document_id == Document.id).filter(
+            chatbot_documents.c.chatbot_id == chatbot_id,
+            Document.deleted_at.is_(None)
+        ).one()
+        session_count = db.query(ChatSession).filter(ChatSession.chatbot_id == chatbot_id).count()
+        message_count = db.query(ChatMessage).join(
+            ChatSession, ChatSession.session_id == ChatMessage.session_id
+        ).filter(ChatSession.chatbot_id == chatbot_id, ChatMessage.abandoned.is_(False)).count()
         
+        counters = db.query(ChatbotCounter).filter(ChatbotCounter.chatbot_id == chatbot_id).first()
+        if not counters:
+            counters = ChatbotCounter(chatbot_id=chatbot_id)
+            db.add(counters)
+        counters.document_count = document_count
+        counters.chunk_count = int(chunk_count)
+        counters.session_count = session_count
+        counters.message_count = message_count
+        config_cache.notify(db, f"chatbot:{chatbot_id}")
+        db.commit()
+        config_cache.invalidate_chatbot(chatbot_id)
+    
+    def _stats_from_row(self, chatbot: Chatbot, counters: Optional[ChatbotCounter]) -> Dict[str, Any]:
+        """Build a stats dictionary from a chatbot and its counters row"""
         return {
             "id": chatbot.id,
             "name": chatbot.name,
             "description": chatbot.description,
             "is_active": chatbot.is_active,
-            "document_count": document_count,
-            "chunk_count": chunk_count,
-            "session_count": session_count,
+            "document_count": counters.document_count if counters else 0,
+            "chunk_count": counters.chunk_count if counters else 0,
+            "session_count": counters.session_count if counters else 0,
+            "message_count": counters.message_count if counters else 0,
             "created_at": chatbot.created_at,
             "updated_at": chatbot.updated_at
         }
     
+    def get_chatbot_stats(self, db: Session, chatbot_id: int) -> Dict[str, Any]:
+        """Get statistics for a chatbot from its materialized counters"""
+        row = db.query(Chatbot, ChatbotCounter).outerjoin(
+            ChatbotCounter, ChatbotCounter.chatbot_id == Chatbot.id
+        ).filter(Chatbot.id == chatbot_id, Chatbot.deleted_at.is_(None)).first()
+        if not row:
+            return {}
+        return self._stats_from_row(*row)
+    
     def get_all_chatbot_stats(self, db: Session) -> List[Dict[str, Any]]:
-        """Get statistics for all chatbots"""
-        chatbots = self.get_all_chatbots(db, include_inactive=True)
-        return [self.get_chatbot_stats(db, chatbot.id) for chatbot in chatbots]
\ No newline at end of file
+        """Get statistics for all chatbots in a single query"""
+        rows = db.query(Chatbot, ChatbotCounter).outerjoin(
+            ChatbotCounter, ChatbotCounter.chatbot_id == Chatbot.id
+        ).filter(Chatbot.deleted_at.is_(None)).order_by(Chatbot.created_at.desc()).all()
+        return [self._stats_from_row(chatbot, counters) for chatbot, counters in rows]
@@ -0,0 +1,187 @@
+import os
+import select
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.orm import Session
+from ..models import Chatbot, AdminSettings
+
+@dataclass(frozen=True)
+class ChatbotConfig:
+    """Immutable snapshot of the chatbot fields used on the chat path"""
+    id: int
+    name: str
+    system_prompt: str
+    is_active: bool
+    settings: Dict[str, Any] = field(default_factory=dict)
+    updated_at: Optional[datetime] = None
+    chunk_count: int = 0
+
+class ConfigCache:
+    """In-process cache of chatbot configs and admin settings.
+    
+    Writers call notify() inside their transaction so Postgres delivers the
+    invalidation to every worker's LISTEN connection on commit. Every
+    invalidation bumps a version number; loads that raced with an
+    invalidation are discarded instead of cached. Entries also expire after
+    CONFIG_CACHE_TTL seconds as a safety net if the listener is down.
+    """
+    
+    CHANNEL = "config_changed"
+    
+    def __init__(self):
+        self.ttl_seconds = float(os.getenv("CONFIG_CACHE_TTL", 300))
+        self.listen_enabled = os.getenv("CONFIG_CACHE_LISTEN", "true").lower() == "true"
+        self._lock = threading.Lock()
+        self._version = 0
+        self._chatbots: Dict[int, tuple] = {}
+        self._settings: Optional[tuple] = None
+        self._listener: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._handlers: Dict[str, Callable[[str], None]] = {}
+    
+    @property
+    def version(self) -> int:
+        """Monotonic counter bumped on every invalidation"""
+        return self._version
+    
+    def _is_fresh(self, loaded_at: float) -> bool:
+        return time.monotonic() - loaded_at < self.ttl_seconds
+    
+    def get_chatbot(self, db: Session, chatbot_id: int) -> Optional[ChatbotConfig]:
+        """Get a chatbot config, loading it from the database on a miss"""
+        with self._lock:
+            entry = self._chatbots.get(chatbot_id)
+            version = self._version
+        if entry and self._is_fresh(entry[1]):
+            return entry[0]
+        
+        chatbot = db.query(Chatbot).filter(Chatbot.id == chatbot_id, Chatbot.deleted_at.is_(None)).first()
+        if not chatbot:
+            return None
+        
+        config = ChatbotConfig(
+            id=chatbot.id,
+            name=chatbot.name,
+            system_prompt=chatbot.system_prompt,
+            is_active=chatbot.is_active,
+            settings=dict(chatbot.settings or {}),
+            updated_at=chatbot.updated_at,
+            chunk_count=chatbot.counters.chunk_count if chatbot.counters else 0
+        )
+        with self._lock:
+            if self._version == version:
+                self._chatbots[chatbot_id] = (config, time.monotonic())
+        return config
+    
+    def get_settings(self, db: Session) -> Dict[str, str]:
+        """Get all admin settings as a key/value mapping"""
+        with self._lock:
+            entry = self._settings
+            version = self._version
+        if entry and self._is_fresh(entry[1]):
+            return entry[0]
+        
+        settings = {setting.key: setting.value for setting in db.query(AdminSettings).all()}
+        with self._lock:
+            if self._version == version:
+                self._settings = (settings, time.monotonic())
+        return settings
+    
+    def get_setting(self, db: Session, key: str, default: str = None) -> Optional[str]:
+        """Get a single admin setting value"""
+        return self.get_settings(db).get(key, default)
+    
+    def invalidate_chatbot(self, chatbot_id: int) -> None:
+        """Drop a cached chatbot config"""
+        with self._lock:
+            self._version += 1
+            self._chatbots.pop(chatbot_id, None)
+    
+    def invalidate_settings(self) -> None:
+        """Drop cached admin settings"""
+        with self._lock:
+            self._version += 1
+            self._settings = None
+    
+    def clear(self) -> None:
+        """Drop everything, e.g. after missing notifications while disconnected"""
+        with self._lock:
+            self._version += 1
+            self._chatbots.clear()
+            self._settings = None
+    
+    def notify(self, db: Session, payload: str) -> None:
+        """Queue a cross-worker invalidation; Postgres delivers it when the caller commits"""
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.CHANNEL, "payload": payload})
+    
+    def subscribe(self, kind: str, handler: Callable[[str], None]) -> None:
+        """Route notifications with payload '<kind>:<key>' to another in-process cache"""
+        self._handlers[kind] = handler
+    
+    def handle_notification(self, payload: str) -> None:
+        """Apply an invalidation received from another worker"""
+        kind, _, key = payload.partition(":")
+        if kind in self._handlers:
+            self._handlers[kind](key)
+        elif kind == "chatbot" and key.isdigit():
+            self.invalidate_chatbot(int(key))
+        elif kind == "settings":
+            self.invalidate_settings()
+        else:
+            self.clear()
+    
+    def start_listener(self, url: Optional[str]) -> None:
+        """Start the background LISTEN thread for this worker, on a direct (non-PgBouncer) connection to ``url``"""
+        if not self.listen_enabled or self._listener:
+            return
+        if url is None:
+            # Transaction-pooled connections can't hold a LISTEN
+            print("Config cache listener disabled: set DATABASE_DIRECT_URL when DB_PGBOUNCER=true")
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(
+            target=self._listen, args=(make_url(url),), name="config-cache-listener", daemon=True
+        )
+        self._listener.start()
+    
+    def stop_listener(self) -> None:
+        """Stop the background LISTEN thread"""
+        self._stop.set()
+        if self._listener:
+            self._listener.join(timeout=5)
+            self._listener = None
+    
+    def _listen(self, url: URL) -> None:
+        connect_args = url.translate_connect_args(username="user", database="dbname")
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**connect_args, **url.query)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {self.CHANNEL};")
+                # Anything cached before (re)connecting may have missed an invalidation
+                self.clear()
+                
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.handle_notification(conn.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"Config cache listener error: {e}")
+                self.clear()
+                self._stop.wait(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+config_cache = ConfigCache()
@@ -0,0 +1,43 @@
+import asyncio
+import time
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage cannot finish within the request's remaining budget"""
+
+class Deadline:
+    """End-to-end time budget for one request, shared by every stage it runs"""
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+    
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+    
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+    
+    def check(self) -> None:
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded")
+    
+    async def run(self, awaitable: Awaitable[T], reserve: float = 0.0) -> T:
+        """Await within the remaining budget (minus ``reserve``), cancelling it on expiry"""
+        timeout = self.remaining() - reserve
+        if timeout <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded")
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded")
+    
+    def statement_timeout_ms(self, reserve: float = 0.0) -> Optional[int]:
+        """Remaining budget as a Postgres statement_timeout, or None if already spent"""
+        timeout = self.remaining() - reserve
+        return max(int(timeout * 1000), 1) if timeout > 0 else None
@@ -1,10 +1,13 @@
 import os
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from PyPDF2 import PdfReader
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from ..models import Document, DocumentChunk
+from ..database import SessionLocal
+from ..models import Document, DocumentChunk, ChunkEmbedding, chatbot_documents
 from .embeddings import EmbeddingService
+from .providers import EmbeddingSpace
+from .metrics import stage
 import uuid
 
 class DocumentProcessor:
@@ -12,6 +15,7 @@ class DocumentProcessor:
         self.embedding_service = embedding_service
         self.chunk_size = int(os.getenv("CHUNK_SIZE", 1000))
         self.chunk_overlap = int(os.getenv("CHUNK_OVERLAP", 200))
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
     
     def extract_text_from_pdf(self, file_path: str) -> str:
         """Extract text from PDF file"""
@@ -69,58 +73,109 @@ class DocumentProcessor:
         file_extension = filename.lower().split('.')[-1]
         
         # Extract text based on file type
-        if file_extension == 'pdf':
-            content = self.extract_text_from_pdf(file_path)
-            file_type = 'pdf'
-        elif file_extension == 'txt':
-            content = self.extract_text_from_txt(file_path)
-            file_type = 'txt'
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
+        with stage("extract"):
+            if file_extension == 'pdf':
+                content = self.extract_text_from_pdf(file_path)
+                file_type = 'pdf'
+            elif file_extension == 'txt':
+                content = self.extract_text_from_txt(file_path)
+                file_type = 'txt'
+            else:
+                raise ValueError(f"Unsupported file type: {file_extension}")
         
         # Create document record
-        document = Document(
-            filename=filename,
-            content=content,
-            file_type=file_type
-        )
-        db.add(document)
-        db.commit()
-        db.refresh(document)
+        with stage("persist"):
+            document = Document(
+                filename=filename,
+                content=content,
+                file_type=file_type,
+                content_length=len(content)
+            )
+            db.add(document)
+            db.commit()
+            db.refresh(document)
         
         # Chunk the text
-        chunks = self.chunk_text(content)
+        with stage("chunk"):
+            chunks = self.chunk_text(content)
         
         # Get embeddings for all chunks
-        embeddings = await self.embedding_service.get_embeddings_batch(chunks)
+        with stage("embedding") as span:
+            span.set_attribute("embedding.inputs", len(chunks))
+            embeddings = await self.embedding_service.get_embeddings_batch(chunks)
         
         # Store chunks with embeddings
-        for i, (chunk_text, embedding) in enumerate(zip(chunks, embeddings)):
-            chunk = DocumentChunk(
-                document_id=document.id,
-                chunk_text=chunk_text,
-                chunk_index=i,
-                embedding=embedding
-            )
-            db.add(chunk)
-        
-        db.commit()
+        with stage("persist"):
+            for i, (chunk_text, embedding) in enumerate(zip(chunks, embeddings)):
+                chunk = DocumentChunk(
+                    document_id=document.id,
+                    chunk_text=chunk_text,
+                    chunk_index=i,
+                    embedding=embedding
+                )
+                db.add(chunk)
+            
+            document.chunk_count = len(chunks)
+            document.total_chunk_length = sum(len(chunk) for chunk in chunks)
+            db.commit()
         return document
     
+    async def ensure_space_embeddings(self, document_ids: List[int], space: EmbeddingSpace, db: Session) -> int:
+        """Embed the documents' chunks in a non-default space where missing; returns the number embedded"""
+        if space == self.embedding_service.space or not document_ids:
+            return 0
+        
+        missing = db.execute(text("""
+            SELECT dc.id, dc.chunk_text
+            FROM document_chunks dc
+            WHERE dc.document_id = ANY(:document_ids)
+              AND NOT EXISTS (
+                  SELECT 1 FROM chunk_embeddings ce WHERE ce.chunk_id = dc.id AND ce.space = :space
+              )
+            ORDER BY dc.id
+        """), {"document_ids": list(document_ids), "space": space.key}).fetchall()
+        
+        for start in range(0, len(missing), self.embedding_batch_size):
+            batch = missing[start:start + self.embedding_batch_size]
+            embeddings = await self.embedding_service.get_embeddings_batch([row.chunk_text for row in batch], space)
+            for row, embedding in zip(batch, embeddings):
+                db.merge(ChunkEmbedding(chunk_id=row.id, space=space.key, embedding=embedding))
+            db.commit()
+        return len(missing)
+    
+    async def backfill_chatbot_space(self, chatbot_id: int, space: EmbeddingSpace) -> None:
+        """Embed all of a chatbot's documents in its space, e.g. after its embedding settings change"""
+        db = SessionLocal()
+        try:
+            document_ids = [row.document_id for row in db.query(chatbot_documents.c.document_id).filter(
+                chatbot_documents.c.chatbot_id == chatbot_id
+            )]
+            embedded = await self.ensure_space_embeddings(document_ids, space, db)
+            if embedded:
+                print(f"Embedded {embedded} chunks in {space.key} for chatbot {chatbot_id}")
+        except Exception as e:
+            print(f"Error embedding documents for chatbot {chatbot_id} in {space.key}: {e}")
+        finally:
+            db.close()
+    
     async def search_similar_chunks(self, query: str, db: Session, top_k: int = 5) -> List[Tuple[DocumentChunk, float]]:
         """Search for similar document chunks using vector similarity"""
         # Get query embedding
-        query_embedding = await self.embedding_service.get_embedding(query)
+        with stage("embedding"):
+            query_embedding = await self.embedding_service.get_embedding(query)
         
         # Query for similar chunks using cosine similarity
-        results = db.execute(text("""
-            SELECT dc.*, d.filename, 
-                   1 - (dc.embedding <=> :query_embedding) as similarity_score
-            FROM document_chunks dc
-            JOIN documents d ON dc.document_id = d.id
-            ORDER BY dc.embedding <=> :query_embedding
-            LIMIT :top_k
-        """), {"query_embedding": str(query_embedding), "top_k": top_k}).fetchall()
+        with stage("vector_search") as span:
+            results = db.execute(text("""
+                SELECT dc.*, d.filename, 
+                       1 - (dc.embedding <=> :query_embedding) as similarity_score
+                FROM document_chunks dc
+                JOIN documents d ON dc.document_id = d.id
+                WHERE d.deleted_at IS NULL
+                ORDER BY dc.embedding <=> :query_embedding
+                LIMIT :top_k
+            """), {"query_embedding": str(query_embedding), "top_k": top_k}).fetchall()
+            span.set_attribute("db.response.returned_rows", len(results))
         
         chunks_with_scores = []
         for row in results:
@@ -139,19 +194,61 @@ class DocumentProcessor:
     async def search_similar_chunks_for_chatbot(self, query: str, chatbot_id: int, db: Session, top_k: int = 5) -> List[Tuple[DocumentChunk, float]]:
         """Search for similar document chunks using vector similarity, limited to chatbot's documents"""
         # Get query embedding
-        query_embedding = await self.embedding_service.get_embedding(query)
+        with stage("embedding", chatbot_id):
+            query_embedding = await self.embedding_service.get_embedding(query)
+        return self.search_chunks_by_embedding(query_embedding, chatbot_id, db, top_k)
+    
+    def search_chunks_by_embedding(
+        self,
+        query_embedding: List[float],
+        chatbot_id: int,
+        db: Session,
+        top_k: int = 5,
+        timeout_ms: Optional[int] = None,
+        space_key: Optional[str] = None
+    ) -> List[Tuple[DocumentChunk, float]]:
+        """Search a chatbot's documents with an already computed query embedding.
         
-        # Query for similar chunks using cosine similarity, filtered by chatbot's documents
-        results = db.execute(text("""
-            SELECT dc.*, d.filename, 
-                   1 - (dc.embedding <=> :query_embedding) as similarity_score
-            FROM document_chunks dc
-            JOIN documents d ON dc.document_id = d.id
-            JOIN chatbot_documents cd ON d.id = cd.document_id
-            WHERE cd.chatbot_id = :chatbot_id
-            ORDER BY dc.embedding <=> :query_embedding
-            LIMIT :top_k
-        """), {"query_embedding": str(query_embedding), "chatbot_id": chatbot_id, "top_k": top_k}).fetchall()
+        ``timeout_ms`` bounds the query with a transaction-local statement_timeout.
+        ``space_key`` selects a non-default embedding space from chunk_embeddings.
+        """
+        if timeout_ms is not None:
+            db.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+        
+        params = {"query_embedding": str(query_embedding), "chatbot_id": chatbot_id, "top_k": top_k}
+        with stage("vector_search", chatbot_id) as span:
+            if space_key is None or space_key == self.embedding_service.space.key:
+                # Query for similar chunks using cosine similarity, filtered by chatbot's documents
+                results = db.execute(text("""
+                    SELECT dc.*, d.filename, 
+                           1 - (dc.embedding <=> :query_embedding) as similarity_score
+                    FROM document_chunks dc
+                    JOIN documents d ON dc.document_id = d.id
+                    JOIN chatbot_documents cd ON d.id = cd.document_id
+                    WHERE cd.chatbot_id = :chatbot_id
+                      AND d.deleted_at IS NULL
+                    ORDER BY dc.embedding <=> :query_embedding
+                    LIMIT :top_k
+                """), params).fetchall()
+            else:
+                # Same query against the chatbot's own space; no ANN index, so this is an exact scan
+                results = db.execute(text("""
+                    SELECT dc.id, dc.document_id, dc.chunk_text, dc.chunk_index, ce.embedding, d.filename,
+                           1 - (ce.embedding <=> :query_embedding) as similarity_score
+                    FROM chunk_embeddings ce
+                    JOIN document_chunks dc ON ce.chunk_id = dc.id
+                    JOIN documents d ON dc.document_id = d.id
+                    JOIN chatbot_documents cd ON d.id = cd.document_id
+                    WHERE ce.space = :space
+                      AND cd.chatbot_id = :chatbot_id
+                      AND d.deleted_at IS NULL
+                    ORDER BY ce.embedding <=> :query_embedding
+                    LIMIT :top_k
+                """), {**params, "space": space_key}).fetchall()
+            span.set_attribute("db.response.returned_rows", len(results))
+        
+        if timeout_ms is not None:
+            db.execute(text("SET LOCAL statement_timeout = DEFAULT"))
         
         chunks_with_scores = []
         for row in results:
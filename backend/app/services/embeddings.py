@@ -1,49 +1,68 @@
-from openai import OpenAI
-import os
-from typing import List
+from typing import List, Tuple, Dict, Optional
 from dotenv import load_dotenv
+from .singleflight import SingleFlight
+from .providers import ModelProvider, EmbeddingSpace, get_provider, default_embedding_space
+from .metrics import llm_calls_in_flight
 
 load_dotenv()
 
+# Shared by every EmbeddingService instance in the process
+embedding_calls = SingleFlight()
+
 class EmbeddingService:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = "text-embedding-ada-002"
+    """Embeddings and chat completions through the configured model provider.
+    
+    MODEL_PROVIDER selects the backend ("openai" or the offline "local"
+    one). Embeddings default to the space stored in document_chunks
+    (EMBEDDING_MODEL / EMBEDDING_DIMENSION); chatbots may use another space.
+    """
+    
+    def __init__(self, provider: Optional[ModelProvider] = None):
+        self.provider = provider or get_provider()
+        self.space = default_embedding_space()
+        self.model = self.space.model
+    
+    def _provider_for(self, space: EmbeddingSpace) -> ModelProvider:
+        return self.provider if space.provider == self.provider.name else get_provider(space.provider)
     
-    async def get_embedding(self, text: str) -> List[float]:
-        """Get embedding for a single text"""
+    async def get_embedding(self, text: str, space: Optional[EmbeddingSpace] = None) -> List[float]:
+        """Get embedding for a single text, sharing the call with identical concurrent requests"""
+        space = space or self.space
+        embedding, _ = await embedding_calls.do((space.key, text), lambda: self._create_embedding(text, space))
+        return embedding
+    
+    async def _create_embedding(self, text: str, space: EmbeddingSpace) -> List[float]:
         try:
-            response = self.client.embeddings.create(
-                input=text,
-                model=self.model
-            )
-            return response.data[0].embedding
+            with llm_calls_in_flight.labels(kind="embedding").track_inprogress():
+                embeddings = await self._provider_for(space).embed([text], space.model, space.dimensions)
+            return embeddings[0]
         except Exception as e:
             print(f"Error getting embedding: {e}")
             raise
     
-    async def get_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    async def get_embeddings_batch(self, texts: List[str], space: Optional[EmbeddingSpace] = None) -> List[List[float]]:
         """Get embeddings for multiple texts"""
+        space = space or self.space
         try:
-            response = self.client.embeddings.create(
-                input=texts,
-                model=self.model
-            )
-            return [data.embedding for data in response.data]
+            # Never hedge large batches: the duplicate would double the cost
+            with llm_calls_in_flight.labels(kind="embedding").track_inprogress():
+                return await self._provider_for(space).embed(texts, space.model, space.dimensions, hedge=False)
         except Exception as e:
             print(f"Error getting batch embeddings: {e}")
             raise
     
-    async def get_chat_completion(self, messages: List[dict], temperature: float = 0.7) -> str:
-        """Get chat completion from OpenAI"""
+    async def get_chat_completion(self, messages: List[dict], temperature: float = 0.7, hedge: bool = True) -> str:
+        """Get chat completion from the provider"""
+        content, _ = await self.get_chat_completion_with_usage(messages, temperature, hedge)
+        return content
+    
+    async def get_chat_completion_with_usage(
+        self, messages: List[dict], temperature: float = 0.7, hedge: bool = True
+    ) -> Tuple[str, Dict[str, int]]:
+        """Get chat completion from the provider along with its token usage"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                temperature=temperature,
-                max_tokens=1500
-            )
-            return response.choices[0].message.content
+            with llm_calls_in_flight.labels(kind="completion").track_inprogress():
+                return await self.provider.complete(messages, temperature, max_tokens=1500, hedge=hedge)
         except Exception as e:
             print(f"Error getting chat completion: {e}")
-            raise
\ No newline at end of file
+            raise
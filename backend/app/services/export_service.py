@@ -0,0 +1,141 @@
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+from ..database import SessionLocal
+
+EXPORT_FORMATS = ("ndjson", "parquet")
+
+EXPORT_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("session_id", pa.string()),
+    ("chatbot_id", pa.int64()),
+    ("message", pa.string()),
+    ("response", pa.string()),
+    ("retrieval_decision", pa.string()),
+    ("degraded", pa.bool_()),
+    ("abandoned", pa.bool_()),
+    ("created_at", pa.timestamp("us")),
+    ("context", pa.list_(pa.struct([("chunk_id", pa.int64()), ("document_id", pa.int64())])))
+])
+
+class _StreamSink:
+    """Write-only file object that hands buffered Parquet bytes back to the response"""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+    
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def flush(self) -> None:
+        pass
+    
+    def close(self) -> None:
+        self.closed = True
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class ExportService:
+    """Streams chat messages with their retrieval context for offline analysis.
+    
+    Rows are read through a server-side cursor in batches of
+    EXPORT_BATCH_SIZE and written out batch by batch, so memory stays
+    bounded regardless of the size of the export.
+    """
+    
+    def __init__(self):
+        self.batch_size = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+    
+    def iter_batches(self, chatbot_id: int, start: datetime, end: datetime) -> Iterator[List[Dict[str, Any]]]:
+        """Yield lists of message records, oldest first"""
+        db = SessionLocal()
+        try:
+            result = db.connection().execution_options(stream_results=True, yield_per=self.batch_size).execute(text("""
+                SELECT cm.id, cm.session_id, cs.chatbot_id, cm.message, cm.response,
+                       cm.context_chunks, cm.retrieval_decision, cm.degraded, cm.abandoned, cm.created_at
+                FROM chat_messages cm
+                JOIN chat_sessions cs ON cs.session_id = cm.session_id
+                WHERE cs.chatbot_id = :chatbot_id
+                  AND cm.created_at >= :start
+                  AND cm.created_at < :end
+                ORDER BY cm.created_at, cm.id
+            """), {"chatbot_id": chatbot_id, "start": start, "end": end})
+            
+            for rows in result.partitions(self.batch_size):
+                yield self._resolve_context(db, rows)
+        finally:
+            db.close()
+    
+    def _resolve_context(self, db, rows) -> List[Dict[str, Any]]:
+        """Attach document ids to the context chunk ids of one batch"""
+        chunk_ids = {
+            int(chunk_id)
+            for row in rows
+            for chunk_id in (row.context_chunks or [])
+            if str(chunk_id).isdigit()
+        }
+        documents_by_chunk = {}
+        if chunk_ids:
+            documents_by_chunk = dict(db.execute(
+                text("SELECT id, document_id FROM document_chunks WHERE id = ANY(:ids)"),
+                {"ids": list(chunk_ids)}
+            ).fetchall())
+        
+        return [
+            {
+                "id": row.id,
+                "session_id": row.session_id,
+                "chatbot_id": row.chatbot_id,
+                "message": row.message,
+                "response": row.response,
+                "retrieval_decision": row.retrieval_decision,
+                "degraded": row.degraded,
+                "abandoned": row.abandoned,
+                "created_at": row.created_at,
+                "context": [
+                    {
+                        "chunk_id": int(chunk_id),
+                        # None when the chunk's document has since been deleted
+                        "document_id": documents_by_chunk.get(int(chunk_id))
+                    }
+                    for chunk_id in (row.context_chunks or [])
+                    if str(chunk_id).isdigit()
+                ]
+            }
+            for row in rows
+        ]
+    
+    def stream_ndjson(self, chatbot_id: int, start: datetime, end: datetime) -> Iterator[bytes]:
+        """Stream the export as newline-delimited JSON"""
+        for batch in self.iter_batches(chatbot_id, start, end):
+            yield "".join(
+                json.dumps({**record, "created_at": record["created_at"].isoformat()}) + "\n"
+                for record in batch
+            ).encode("utf-8")
+    
+    def stream_parquet(self, chatbot_id: int, start: datetime, end: datetime) -> Iterator[bytes]:
+        """Stream the export as a Parquet file, one row group per batch"""
+        sink = _StreamSink()
+        writer = pq.ParquetWriter(sink, EXPORT_SCHEMA, compression="zstd")
+        try:
+            for batch in self.iter_batches(chatbot_id, start, end):
+                writer.write_table(pa.Table.from_pylist(batch, schema=EXPORT_SCHEMA))
+                yield sink.drain()
+        finally:
+            writer.close()
+        yield sink.drain()
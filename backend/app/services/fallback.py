@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+DEFAULT_FALLBACK_MESSAGE = (
+    "Sorry, I couldn't put together an answer in time. Please try again in a moment."
+)
+
+def normalize_message(message: str) -> str:
+    return " ".join(message.lower().split())
+
+class FallbackResponder:
+    """Degraded answers for requests that run out of time.
+    
+    Prefers a recent full answer to the same question for the same chatbot
+    (kept in a small in-process LRU), then a retrieval-only answer quoting
+    the best matching chunks, then a fixed apology.
+    """
+    
+    def __init__(self):
+        self.max_answers = int(os.getenv("FALLBACK_ANSWER_CACHE_SIZE", 1000))
+        self.quote_chunks = int(os.getenv("FALLBACK_QUOTE_CHUNKS", 2))
+        self.quote_chars = int(os.getenv("FALLBACK_QUOTE_CHARS", 600))
+        self._answers: "OrderedDict[Tuple[int, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def remember(self, chatbot_id: int, message: str, response: str) -> None:
+        """Keep a full (non-degraded) answer for later fallbacks"""
+        if self.max_answers <= 0:
+            return
+        key = (chatbot_id, normalize_message(message))
+        with self._lock:
+            self._answers[key] = response
+            self._answers.move_to_end(key)
+            while len(self._answers) > self.max_answers:
+                self._answers.popitem(last=False)
+    
+    def cached_answer(self, chatbot_id: int, message: str) -> Optional[str]:
+        key = (chatbot_id, normalize_message(message))
+        with self._lock:
+            response = self._answers.get(key)
+            if response is not None:
+                self._answers.move_to_end(key)
+            return response
+    
+    def retrieval_answer(self, chunks: List[Tuple[Any, float]]) -> Optional[str]:
+        """Quote the top chunks verbatim"""
+        if not chunks or self.quote_chunks <= 0:
+            return None
+        quotes = []
+        for chunk, _ in chunks[:self.quote_chunks]:
+            text = chunk.chunk_text.strip()
+            if len(text) > self.quote_chars:
+                text = text[:self.quote_chars].rstrip() + "..."
+            quotes.append(f"**{chunk.document_filename}**\n\n> " + text.replace("\n", "\n> "))
+        return (
+            "I couldn't generate a full answer in time. Here is the most relevant information I found:\n\n"
+            + "\n\n".join(quotes)
+        )
+    
+    def respond(self, chatbot_id: int, message: str, chunks: List[Tuple[Any, float]]) -> str:
+        """Best available degraded answer"""
+        return (
+            self.cached_answer(chatbot_id, message)
+            or self.retrieval_answer(chunks)
+            or DEFAULT_FALLBACK_MESSAGE
+        )
@@ -0,0 +1,128 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Set
+from sqlalchemy import tuple_
+from ..database import SessionLocal
+from ..models import ChatSession, ChatMessage
+from .embeddings import EmbeddingService
+from .admission import admission_controller, AdmissionRejected
+from .config_cache import config_cache
+
+SUMMARY_INSTRUCTIONS = """You maintain a running summary of a conversation between a user and an assistant.
+Update the existing summary with the new turns below. Keep facts, names, preferences and open questions
+the assistant may need later; drop pleasantries. Reply with the updated summary only, at most {max_words} words."""
+
+class ConversationMemory:
+    """Bounded multi-turn memory: the last CHAT_MEMORY_TURNS turns verbatim plus a rolling summary.
+    
+    Turns that fall out of the verbatim window are folded into
+    ChatSession.summary by a background task once CHAT_MEMORY_SUMMARY_BATCH
+    of them have accumulated, so the prompt stays roughly the same size no
+    matter how long the session runs.
+    """
+    
+    def __init__(self, embedding_service: EmbeddingService):
+        self.embedding_service = embedding_service
+        self.turns = int(os.getenv("CHAT_MEMORY_TURNS", 6))
+        self.summary_batch = int(os.getenv("CHAT_MEMORY_SUMMARY_BATCH", 6))
+        self.summary_max_words = int(os.getenv("CHAT_MEMORY_SUMMARY_MAX_WORDS", 200))
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def build_messages(self, summary: Optional[str], history: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Turn the rolling summary and recent history into chat messages, oldest first"""
+        messages = []
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        for turn in history:
+            messages.append({"role": "user", "content": turn["message"]})
+            messages.append({"role": "assistant", "content": turn["response"]})
+        return messages
+    
+    def history_limit(self, message_count: int, summary_message_count: int) -> int:
+        """Turns to include verbatim: everything not yet summarized, bounded so a stalled summary cannot grow the prompt"""
+        if self.turns <= 0:
+            return 0
+        return min(max(message_count - summary_message_count, self.turns), self.turns + max(self.summary_batch, 0))
+    
+    def unsummarized_count(self, message_count: int, summary_message_count: int) -> int:
+        """Messages older than the verbatim window that are not in the summary yet"""
+        return max(message_count - summary_message_count - self.turns, 0)
+    
+    def schedule_refresh(self, session_id: str, message_count: int, summary_message_count: int) -> None:
+        """Start a background summary refresh if enough turns have left the verbatim window"""
+        if self.summary_batch <= 0 or session_id in self._in_flight:
+            return
+        if self.unsummarized_count(message_count, summary_message_count) < self.summary_batch:
+            return
+        self._in_flight.add(session_id)
+        task = asyncio.create_task(self.refresh_summary(session_id), name=f"summary-{session_id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def refresh_summary(self, session_id: str) -> None:
+        """Fold the turns that left the verbatim window into the session summary"""
+        try:
+            db = SessionLocal()
+            try:
+                session = db.query(ChatSession).filter(ChatSession.session_id == session_id).first()
+                if not session:
+                    return
+                summarized = session.summary_message_count or 0
+                query = db.query(ChatMessage).filter(
+                    ChatMessage.session_id == session_id, ChatMessage.abandoned.is_(False)
+                )
+                if session.summary_through and session.summary_through_id is not None:
+                    # Keyset on (created_at, id): turns sharing the boundary timestamp are not skipped
+                    query = query.filter(
+                        tuple_(ChatMessage.created_at, ChatMessage.id) > (session.summary_through, session.summary_through_id)
+                    )
+                elif session.summary_through:
+                    # Summaries written before summary_through_id existed
+                    query = query.filter(ChatMessage.created_at > session.summary_through)
+                turns = query.order_by(ChatMessage.created_at, ChatMessage.id).limit(
+                    self.unsummarized_count(session.message_count or 0, summarized)
+                ).all()
+                previous_summary = session.summary
+                new_turns = [(turn.message, turn.response, turn.created_at, turn.id) for turn in turns]
+                chatbot = config_cache.get_chatbot(db, session.chatbot_id) if session.chatbot_id else None
+            finally:
+                # Release the connection before the slow completion call
+                db.close()
+            if not new_turns:
+                return
+            
+            if chatbot is None:
+                return
+            
+            transcript = "\n\n".join(f"User: {message}\nAssistant: {response}" for message, response, _, _ in new_turns)
+            # Summaries share the chatbot's LLM slots and fair-queue position with its chat traffic.
+            # Nobody waits on them, so a slow one is never hedged
+            async with admission_controller.slot(chatbot):
+                summary = await self.embedding_service.get_chat_completion([
+                    {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(max_words=self.summary_max_words)},
+                    {"role": "user", "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"}
+                ], temperature=0.2, hedge=False)
+            
+            db = SessionLocal()
+            try:
+                # Only apply if no other worker refreshed the summary in the meantime
+                db.query(ChatSession).filter(
+                    ChatSession.session_id == session_id,
+                    ChatSession.summary_message_count == summarized
+                ).update({
+                    ChatSession.summary: summary,
+                    ChatSession.summary_message_count: summarized + len(new_turns),
+                    ChatSession.summary_through: new_turns[-1][2],
+                    ChatSession.summary_through_id: new_turns[-1][3]
+                }, synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+        except AdmissionRejected:
+            # LLM slots are saturated: leave it for a later turn to trigger again
+            pass
+        except Exception as e:
+            print(f"Error refreshing summary for session {session_id}: {e}")
+        finally:
+            self._in_flight.discard(session_id)
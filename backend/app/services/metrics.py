@@ -0,0 +1,146 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+from opentelemetry.trace import Span
+from prometheus_client import Counter, Gauge, Histogram
+from ..database import engine, checkout_listeners
+from .tracing import tracer
+
+# Seconds; spans cache hits through slow completions
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+stage_duration = Histogram(
+    "chatbot_stage_duration_seconds",
+    "Time spent in each stage of chat, upload and search requests",
+    ["chatbot", "stage"],
+    buckets=STAGE_BUCKETS
+)
+llm_calls_in_flight = Gauge(
+    "llm_calls_in_flight",
+    "Embedding and completion calls waiting on the model provider",
+    ["kind"]
+)
+llm_slots_in_flight = Gauge("llm_slots_in_flight", "Chat requests holding an admission slot")
+llm_slots_queued = Gauge("llm_slots_queued", "Chat requests waiting for an admission slot")
+db_pool_connections = Gauge("db_pool_connections", "Database connection pool usage", ["state"])
+db_pool_utilization = Gauge("db_pool_utilization", "Checked out connections as a fraction of pool size plus max overflow")
+db_pool_checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection (including opening a new one)",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+db_pool_checkout_timeouts = Counter("db_pool_checkout_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT")
+provider_circuit_state = Gauge(
+    "provider_circuit_state",
+    "Circuit breaker state of each kind of provider call (0 closed, 1 half-open, 2 open)",
+    ["provider"]
+)
+provider_circuit_trips = Counter("provider_circuit_trips_total", "Times a provider circuit breaker opened", ["provider"])
+provider_rejected_calls = Counter(
+    "provider_rejected_calls_total", "Provider calls refused because the circuit was open", ["provider"]
+)
+provider_hedges = Counter("provider_hedges_total", "Backup requests sent because the first attempt was slow", ["provider"])
+provider_hedge_wins = Counter("provider_hedge_wins_total", "Hedged calls answered by the backup request", ["provider"])
+
+for kind in ("embedding", "completion"):
+    llm_calls_in_flight.labels(kind=kind)
+
+def _observe_checkout(waited: float, timed_out: bool) -> None:
+    db_pool_checkout_wait.observe(waited)
+    if timed_out:
+        db_pool_checkout_timeouts.inc()
+
+def _pool_capacity() -> int:
+    return engine.pool.size() + max(engine.pool._max_overflow, 0)
+
+def _pool_utilization() -> float:
+    capacity = _pool_capacity()
+    return engine.pool.checkedout() / capacity if capacity else 0.0
+
+if hasattr(engine.pool, "checkedout"):
+    # Looked up on every scrape: engine.dispose() replaces the pool
+    db_pool_connections.labels(state="checked_out").set_function(lambda: engine.pool.checkedout())
+    db_pool_connections.labels(state="idle").set_function(lambda: engine.pool.checkedin())
+    db_pool_connections.labels(state="overflow").set_function(lambda: max(engine.pool.overflow(), 0))
+    db_pool_connections.labels(state="size").set_function(lambda: engine.pool.size())
+    db_pool_connections.labels(state="max").set_function(_pool_capacity)
+    db_pool_utilization.set_function(_pool_utilization)
+    checkout_listeners.append(_observe_checkout)
+
+@dataclass
+class RequestTimings:
+    """Stage durations collected while one HTTP request is handled"""
+    chatbot: str = "none"
+    stages: List[Tuple[str, float]] = field(default_factory=list)
+    
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """Format as a Server-Timing header value; repeated stages are summed"""
+        totals: Dict[str, float] = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        if total is not None:
+            totals["total"] = total
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+def set_chatbot(chatbot_id: Optional[int]) -> None:
+    """Label the current request's stages with the chatbot they work for"""
+    timings = _request_timings.get()
+    if timings is not None and chatbot_id is not None:
+        timings.chatbot = str(chatbot_id)
+
+@contextmanager
+def stage(name: str, chatbot_id: Optional[int] = None) -> Iterator[Span]:
+    """Time a block into the stage histogram, the current request's Server-Timing header and a trace span.
+    
+    Yields the span so callers can attach details such as row or token counts.
+    """
+    timings = _request_timings.get()
+    if chatbot_id is not None:
+        chatbot = str(chatbot_id)
+    else:
+        chatbot = timings.chatbot if timings is not None else "none"
+    started = time.perf_counter()
+    try:
+        with tracer.start_as_current_span(name, attributes={"chatbot.id": chatbot}) as span:
+            yield span
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.labels(chatbot=chatbot, stage=name).observe(elapsed)
+        if timings is not None:
+            timings.stages.append((name, elapsed))
+
+class ServerTimingMiddleware:
+    """ASGI middleware that collects stage timings per request and reports them in a Server-Timing header.
+    
+    Plain ASGI rather than BaseHTTPMiddleware so the handler (and the tasks
+    it spawns) run in the context that holds the request's timings.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self.header = os.getenv("SERVER_TIMING_HEADER", "true").lower() == "true"
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        timings = RequestTimings()
+        started = time.perf_counter()
+        
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and self.header:
+                value = timings.server_timing(time.perf_counter() - started)
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value.encode("latin-1"))]}
+            await send(message)
+        
+        token = _request_timings.set(timings)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
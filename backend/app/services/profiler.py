@@ -0,0 +1,169 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Leaf frames of threads that are parked rather than running Python code
+IDLE_MODULES = tuple(
+    os.sep + name for name in ("threading.py", "selectors.py", "queue.py", os.path.join("futures", "thread.py"))
+)
+GROUP_BY = ("lineno", "filename", "traceback")
+
+def _short_path(filename: str) -> str:
+    """Trim a source path to its package-relative form for readable stacks"""
+    for prefix in sorted((p for p in sys.path if p), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{frame.f_lineno})"
+
+class StackSampler:
+    """Samples the Python stacks of every thread in the process.
+    
+    A sampling profiler rather than cProfile: it needs no hooks in the
+    running code, sees the event loop and the threadpool (PDF extraction,
+    ORM work) alike, and costs one stack walk per thread per interval.
+    Output is in the collapsed ("folded") format read by flamegraph.pl,
+    speedscope and inferno.
+    """
+    
+    def __init__(self):
+        self.max_seconds = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+        self._lock = threading.Lock()
+    
+    def sample(self, seconds: float, interval_ms: float = 10, include_idle: bool = False) -> Dict[str, Any]:
+        """Block for ``seconds`` collecting stacks; only one profile runs at a time"""
+        if seconds <= 0 or seconds > self.max_seconds:
+            raise ValueError(f"Duration must be between 0 and {self.max_seconds:g} seconds")
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        
+        try:
+            own_thread = threading.get_ident()
+            interval = interval_ms / 1000
+            stacks: Counter = Counter()
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    if not include_idle and frame.f_code.co_filename.endswith(IDLE_MODULES):
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(names.get(thread_id, str(thread_id)))
+                    stacks[";".join(reversed(labels))] += 1
+                samples += 1
+                time.sleep(interval)
+            return {
+                "duration_seconds": round(time.perf_counter() - started, 3),
+                "interval_ms": interval_ms,
+                "samples": samples,
+                "stacks": dict(stacks.most_common())
+            }
+        finally:
+            self._lock.release()
+    
+    @staticmethod
+    def folded(profile: Dict[str, Any]) -> str:
+        """Render a profile as collapsed stacks, one ``frame;frame;frame count`` line each"""
+        return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+    
+    @staticmethod
+    def top_functions(profile: Dict[str, Any], limit: int = 25) -> List[Dict[str, Any]]:
+        """Functions ranked by samples where they were on top of the stack (self time)"""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in profile["stacks"].items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        return [
+            {"function": label, "self_samples": count, "total_samples": total[label]}
+            for label, count in own.most_common(limit)
+        ]
+
+class MemoryTracker:
+    """tracemalloc snapshots diffed against a baseline, to find what keeps growing"""
+    
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+        self._filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>")
+        ]
+    
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self._filters)
+    
+    def start(self, frames: int = 10) -> Dict[str, Any]:
+        """Start tracing allocations (slows allocation-heavy code) and take the baseline"""
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            tracemalloc.start(frames)
+            self._baseline = self._snapshot()
+        return self.status()
+    
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+        return self.status()
+    
+    def status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "traced_bytes": current,
+            "peak_traced_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracing else 0
+        }
+    
+    def diff(self, limit: int = 25, group_by: str = "lineno", reset: bool = False) -> Dict[str, Any]:
+        """Largest allocation changes since the baseline; ``reset`` makes this snapshot the new baseline"""
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of: {', '.join(GROUP_BY)}")
+        with self._lock:
+            if not tracemalloc.is_tracing() or self._baseline is None:
+                raise RuntimeError("Memory tracing is not running")
+            snapshot = self._snapshot()
+            differences = snapshot.compare_to(self._baseline, group_by)
+            if reset:
+                self._baseline = snapshot
+        return {
+            **self.status(),
+            "size_diff_bytes": sum(stat.size_diff for stat in differences),
+            "top": [
+                {
+                    "traceback": [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback],
+                    "size_bytes": stat.size,
+                    "size_diff_bytes": stat.size_diff,
+                    "count": stat.count,
+                    "count_diff": stat.count_diff
+                }
+                for stat in differences[:limit]
+            ]
+        }
+
+stack_sampler = StackSampler()
+memory_tracker = MemoryTracker()
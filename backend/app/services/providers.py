@@ -0,0 +1,209 @@
+import hashlib
+from abc import ABC, abstractmethod
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import openai
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from .resilience import ProviderGuard, CircuitOpenError
+
+load_dotenv()
+
+# Errors that indicate the provider (not the request) is unhealthy
+PROVIDER_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+embedding_guard = ProviderGuard("embedding", PROVIDER_ERRORS)
+# A hedged completion can pay for a second full answer, so completions are only hedged on request
+HEDGE_COMPLETIONS = os.getenv("PROVIDER_HEDGE_COMPLETIONS", "false").lower() == "true"
+completion_guard = ProviderGuard("completion", PROVIDER_ERRORS, hedging=HEDGE_COMPLETIONS)
+fallback_completion_guard = ProviderGuard("completion_fallback", PROVIDER_ERRORS, hedging=HEDGE_COMPLETIONS)
+provider_guards = [embedding_guard, completion_guard, fallback_completion_guard]
+
+@dataclass(frozen=True)
+class EmbeddingSpace:
+    """A provider, model and dimension; vectors are only comparable within one space"""
+    provider: str
+    model: str
+    dimensions: int
+    
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model}:{self.dimensions}"
+
+class ModelProvider(ABC):
+    """Interface for embedding and chat backends"""
+    
+    name = "base"
+    
+    @abstractmethod
+    async def embed(self, texts: List[str], model: str, dimensions: int, hedge: bool = True) -> List[List[float]]:
+        """Embed ``texts`` with ``model`` at ``dimensions``, in input order"""
+    
+    @abstractmethod
+    async def complete(
+        self, messages: List[Dict[str, str]], temperature: float, max_tokens: int, hedge: bool = True
+    ) -> Tuple[str, Dict[str, int]]:
+        """Return the completion text and its prompt/completion token usage"""
+
+class OpenAIProvider(ModelProvider):
+    """OpenAI API backend, with hedging and circuit breaking on every call"""
+    
+    name = "openai"
+    
+    def __init__(self):
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL") or None)
+        self.chat_model = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o")
+        # Used while the primary model's circuit is open; unset means fail fast
+        self.fallback_chat_model = os.getenv("OPENAI_FALLBACK_CHAT_MODEL") or None
+    
+    async def embed(self, texts: List[str], model: str, dimensions: int, hedge: bool = True) -> List[List[float]]:
+        kwargs: Dict[str, Any] = {"input": texts, "model": model}
+        if model.startswith("text-embedding-3"):
+            # Only the v3 models can shorten their output
+            kwargs["dimensions"] = dimensions
+        response = await embedding_guard.call(lambda: self.client.embeddings.create(**kwargs), hedge=hedge)
+        return [data.embedding for data in response.data]
+    
+    async def complete(
+        self, messages: List[Dict[str, str]], temperature: float, max_tokens: int, hedge: bool = True
+    ) -> Tuple[str, Dict[str, int]]:
+        def create(model: str):
+            return lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        
+        try:
+            response = await completion_guard.call(create(self.chat_model), hedge=hedge)
+        except CircuitOpenError:
+            if not self.fallback_chat_model:
+                raise
+            response = await fallback_completion_guard.call(create(self.fallback_chat_model), hedge=hedge)
+        usage = {
+            "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
+            "completion_tokens": response.usage.completion_tokens if response.usage else 0
+        }
+        return response.choices[0].message.content, usage
+
+TOKEN = re.compile(r"\w+")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+class LocalProvider(ModelProvider):
+    """Offline, deterministic backend for tests and load runs.
+    
+    Embeddings hash unigrams and bigrams into a signed, L2-normalised vector
+    of the requested dimension, so texts sharing words land close together.
+    Term counts are damped (1 + log tf) so repeated stop words do not drown
+    out rare terms. Chat answers are templated from the first context chunk
+    in the prompt.
+    """
+    
+    name = "local"
+    
+    def embed_text(self, text: str, dimensions: int) -> List[float]:
+        tokens = TOKEN.findall(text.lower())
+        counts = Counter(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+        vector = [0.0] * dimensions
+        for feature, count in counts.items():
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+            weight = 1.0 + math.log(count)
+            vector[digest % dimensions] += weight if digest >> 63 else -weight
+        norm = math.sqrt(sum(value * value for value in vector))
+        if not norm:
+            # Keep cosine distance defined for empty or punctuation-only text
+            vector[0] = 1.0
+            return vector
+        return [value / norm for value in vector]
+    
+    async def embed(self, texts: List[str], model: str, dimensions: int, hedge: bool = True) -> List[List[float]]:
+        return [self.embed_text(text, dimensions) for text in texts]
+    
+    async def complete(
+        self, messages: List[Dict[str, str]], temperature: float, max_tokens: int, hedge: bool = True
+    ) -> Tuple[str, Dict[str, int]]:
+        question = messages[-1]["content"] if messages else ""
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        _, _, context = system.partition("Context information:\n")
+        if context.strip():
+            source, _, text = context.strip().split("\n\n")[0].partition(": ")
+            excerpt = " ".join(SENTENCE_END.split(text.strip())[:2])
+            response = f"According to **{source.replace('From ', '', 1)}**: {excerpt}"
+        else:
+            response = f"Thanks for your message. I don't have specific information about \"{question[:80]}\"."
+        words = response.split()[:max_tokens]
+        usage = {
+            "prompt_tokens": sum(len(message["content"].split()) for message in messages),
+            "completion_tokens": len(words)
+        }
+        return " ".join(words), usage
+
+# Output size of OpenAI embedding models; only the v3 models can be shortened
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072
+}
+
+PROVIDERS = {
+    "openai": OpenAIProvider,
+    "local": LocalProvider
+}
+
+_instances: Dict[str, ModelProvider] = {}
+
+def get_provider(name: Optional[str] = None) -> ModelProvider:
+    """Get the (shared) provider instance by name, defaulting to MODEL_PROVIDER"""
+    name = name or os.getenv("MODEL_PROVIDER", "openai")
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown model provider: {name}")
+    if name not in _instances:
+        _instances[name] = PROVIDERS[name]()
+    return _instances[name]
+
+def validate_provider_settings(settings: Optional[Dict[str, Any]]) -> None:
+    """Reject chatbot settings naming an unknown provider or an unusable dimension (raises ValueError)"""
+    settings = settings or {}
+    provider = settings.get("embedding_provider")
+    if provider is not None and provider not in PROVIDERS:
+        raise ValueError(f"Unknown embedding_provider: {provider} (expected one of: {', '.join(PROVIDERS)})")
+    if settings.get("embedding_dimensions") is not None:
+        try:
+            dimensions = int(settings["embedding_dimensions"])
+        except (TypeError, ValueError):
+            dimensions = 0
+        if dimensions <= 0:
+            raise ValueError("embedding_dimensions must be a positive integer")
+    
+    space = embedding_space_for(settings)
+    if space.provider == "openai" and space.model in OPENAI_EMBEDDING_DIMENSIONS:
+        native = OPENAI_EMBEDDING_DIMENSIONS[space.model]
+        if space.dimensions > native or (not space.model.startswith("text-embedding-3") and space.dimensions != native):
+            raise ValueError(f"{space.model} cannot produce {space.dimensions}-dimensional embeddings (native: {native})")
+
+def default_embedding_space() -> EmbeddingSpace:
+    """The space stored in document_chunks.embedding"""
+    return EmbeddingSpace(
+        provider=os.getenv("MODEL_PROVIDER", "openai"),
+        model=os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002"),
+        dimensions=int(os.getenv("EMBEDDING_DIMENSION", 1536))
+    )
+
+def embedding_space_for(settings: Optional[Dict[str, Any]]) -> EmbeddingSpace:
+    """Resolve a chatbot's embedding space from its settings, falling back to the default"""
+    default = default_embedding_space()
+    settings = settings or {}
+    try:
+        dimensions = int(settings.get("embedding_dimensions", default.dimensions))
+    except (TypeError, ValueError):
+        dimensions = default.dimensions
+    return EmbeddingSpace(
+        provider=settings.get("embedding_provider") or default.provider,
+        model=settings.get("embedding_model") or default.model,
+        dimensions=dimensions
+    )
@@ -0,0 +1,99 @@
+import os
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models import Chatbot, Document
+from .chatbot_service import ChatbotService
+from .config_cache import config_cache
+from .background import PeriodicTask, register_periodic_task
+
+class PurgeService:
+    """Soft deletes for documents and chatbots, followed by a batched purge.
+    
+    Deleting only flags the row, so the API returns immediately. The purge
+    removes chunks, messages and sessions in PURGE_BATCH_SIZE batches, each
+    in its own short transaction, and never loads them into memory.
+    """
+    
+    def __init__(self):
+        self.batch_size = int(os.getenv("PURGE_BATCH_SIZE", 5000))
+        self.chatbot_service = ChatbotService()
+    
+    def soft_delete_document(self, db: Session, document: Document) -> None:
+        """Hide a document from all reads and release its chatbot counters"""
+        chatbot_ids = self.chatbot_service.release_document_counters(db, document)
+        document.deleted_at = datetime.utcnow()
+        db.commit()
+        for chatbot_id in chatbot_ids:
+            config_cache.invalidate_chatbot(chatbot_id)
+    
+    def _delete_in_batches(self, db: Session, statement: str, params: dict) -> int:
+        total = 0
+        while True:
+            deleted = db.execute(text(statement), {**params, "batch_size": self.batch_size}).rowcount
+            db.commit()
+            total += deleted
+            if deleted < self.batch_size:
+                return total
+    
+    def purge_document(self, document_id: int) -> None:
+        """Remove a soft-deleted document and its chunks"""
+        db = SessionLocal()
+        try:
+            if not db.query(Document.id).filter(Document.id == document_id, Document.deleted_at.isnot(None)).first():
+                return
+            chunks = self._delete_in_batches(db, """
+                DELETE FROM document_chunks
+                WHERE id IN (
+                    SELECT id FROM document_chunks WHERE document_id = :document_id LIMIT :batch_size
+                )
+            """, {"document_id": document_id})
+            # Remaining rows (chatbot links) are removed by ON DELETE CASCADE
+            db.execute(text("DELETE FROM documents WHERE id = :document_id"), {"document_id": document_id})
+            db.commit()
+            print(f"Purged document {document_id} ({chunks} chunks)")
+        finally:
+            db.close()
+    
+    def purge_chatbot(self, chatbot_id: int) -> None:
+        """Remove a soft-deleted chatbot with its sessions and messages"""
+        db = SessionLocal()
+        try:
+            if not db.query(Chatbot.id).filter(Chatbot.id == chatbot_id, Chatbot.deleted_at.isnot(None)).first():
+                return
+            messages = self._delete_in_batches(db, """
+                DELETE FROM chat_messages
+                WHERE (id, created_at) IN (
+                    SELECT cm.id, cm.created_at
+                    FROM chat_messages cm
+                    JOIN chat_sessions cs ON cs.session_id = cm.session_id
+                    WHERE cs.chatbot_id = :chatbot_id
+                    LIMIT :batch_size
+                )
+            """, {"chatbot_id": chatbot_id})
+            sessions = self._delete_in_batches(db, """
+                DELETE FROM chat_sessions
+                WHERE id IN (
+                    SELECT id FROM chat_sessions WHERE chatbot_id = :chatbot_id LIMIT :batch_size
+                )
+            """, {"chatbot_id": chatbot_id})
+            # Document links, counters and rollups are removed by ON DELETE CASCADE
+            db.execute(text("DELETE FROM chatbots WHERE id = :chatbot_id"), {"chatbot_id": chatbot_id})
+            db.commit()
+            print(f"Purged chatbot {chatbot_id} ({sessions} sessions, {messages} messages)")
+        finally:
+            db.close()
+    
+    def purge_pending(self, db: Session) -> None:
+        """Purge everything still flagged as deleted (e.g. after a restart)"""
+        for (document_id,) in db.query(Document.id).filter(Document.deleted_at.isnot(None)).all():
+            self.purge_document(document_id)
+        for (chatbot_id,) in db.query(Chatbot.id).filter(Chatbot.deleted_at.isnot(None)).all():
+            self.purge_chatbot(chatbot_id)
+
+register_periodic_task(PeriodicTask(
+    "soft-delete-purge",
+    float(os.getenv("PURGE_INTERVAL", 300)),
+    lambda db: PurgeService().purge_pending(db)
+))
@@ -0,0 +1,242 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+from .metrics import (
+    provider_circuit_state, provider_circuit_trips, provider_rejected_calls, provider_hedges, provider_hedge_wins
+)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+class LatencyTracker:
+    """Recent successful call latencies, used to pick the hedging delay"""
+    
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+    
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+    
+    def percentile(self, percentile: float, min_samples: int = 20) -> Optional[float]:
+        """Latency at the given percentile, or None until enough samples exist"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        index = min(int(len(samples) * percentile / 100), len(samples) - 1)
+        return samples[index]
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker over the last ``window`` calls.
+    
+    Opens when at least ``min_requests`` outcomes are recorded and the failure
+    rate reaches ``failure_rate``. After ``open_seconds`` a single probe call
+    is let through (half-open); its outcome closes or re-opens the circuit.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    # Exported as the provider_circuit_state gauge
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    
+    def __init__(
+        self,
+        window: int,
+        failure_rate: float,
+        min_requests: int,
+        open_seconds: float,
+        on_open: Optional[Callable[[], None]] = None
+    ):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_count = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._on_open = on_open
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Whether a call may go through now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+    
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if success:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (
+                self.state == self.CLOSED
+                and len(self._outcomes) >= self.min_requests
+                and failures / len(self._outcomes) >= self.failure_rate
+            ):
+                self._open()
+    
+    def release_probe(self) -> None:
+        """Forget a probe that was cancelled before it produced an outcome"""
+        with self._lock:
+            self._probe_in_flight = False
+    
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.opened_count += 1
+        self._outcomes.clear()
+        if self._on_open is not None:
+            self._on_open()
+
+class ProviderGuard:
+    """Hedging and circuit breaking for one kind of upstream call (e.g. completions).
+    
+    Once enough latencies are known, a backup request is sent if the first
+    has not answered within the PROVIDER_HEDGE_PERCENTILE latency (at least
+    PROVIDER_HEDGE_MIN_DELAY_MS); whichever succeeds first wins and the other
+    is cancelled. Failures matching ``failure_types`` feed the circuit breaker.
+    Calls made with ``hedge=False`` (large embedding batches and background
+    summaries, where a duplicate only adds cost) are never hedged and stay
+    out of the latency percentiles. ``hedging`` turns hedging on or off for
+    the guard; by default it follows PROVIDER_HEDGING.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        failure_types: Tuple[Type[BaseException], ...] = (Exception,),
+        hedging: Optional[bool] = None
+    ):
+        self.name = name
+        self.failure_types = failure_types
+        if hedging is None:
+            hedging = os.getenv("PROVIDER_HEDGING", "true").lower() == "true"
+        self.hedging = hedging
+        self.hedge_percentile = float(os.getenv("PROVIDER_HEDGE_PERCENTILE", 95))
+        self.hedge_min_delay = int(os.getenv("PROVIDER_HEDGE_MIN_DELAY_MS", 200)) / 1000
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(
+            window=int(os.getenv("PROVIDER_BREAKER_WINDOW", 50)),
+            failure_rate=float(os.getenv("PROVIDER_BREAKER_FAILURE_RATE", 0.5)),
+            min_requests=int(os.getenv("PROVIDER_BREAKER_MIN_REQUESTS", 10)),
+            open_seconds=float(os.getenv("PROVIDER_BREAKER_OPEN_SECONDS", 30)),
+            on_open=provider_circuit_trips.labels(provider=name).inc
+        )
+        self.counters: Dict[str, int] = {
+            "calls": 0, "failures": 0, "rejected": 0, "hedges": 0, "hedge_wins": 0
+        }
+        provider_circuit_state.labels(provider=name).set_function(
+            lambda: CircuitBreaker.STATE_VALUES[self.breaker.state]
+        )
+        self._rejected_metric = provider_rejected_calls.labels(provider=name)
+        self._hedges_metric = provider_hedges.labels(provider=name)
+        self._hedge_wins_metric = provider_hedge_wins.labels(provider=name)
+    
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedging:
+            return None
+        observed = self.latency.percentile(self.hedge_percentile)
+        return None if observed is None else max(observed, self.hedge_min_delay)
+    
+    async def call(self, factory: Callable[[], Awaitable[Any]], hedge: bool = True) -> Any:
+        """Run ``factory()`` through the breaker, hedging it when allowed"""
+        if not self.breaker.allow():
+            self.counters["rejected"] += 1
+            self._rejected_metric.inc()
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        
+        self.counters["calls"] += 1
+        started = time.monotonic()
+        try:
+            delay = self.hedge_delay() if hedge else None
+            if delay is not None:
+                result = await self._hedged(factory, delay)
+            else:
+                result = await factory()
+                if hedge:
+                    self.latency.record(time.monotonic() - started)
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+        except BaseException as e:
+            if isinstance(e, self.failure_types):
+                self.counters["failures"] += 1
+                self.breaker.record(False)
+            else:
+                self.breaker.release_probe()
+            raise
+        self.breaker.record(True)
+        return result
+    
+    async def _hedged(self, factory: Callable[[], Awaitable[Any]], delay: float) -> Any:
+        started = time.monotonic()
+        hedge_won = False
+        
+        def record_primary(task: asyncio.Future) -> None:
+            # The hedge delay is a percentile of the primary attempt, so record it whether or not it won.
+            # A primary cancelled because the hedge won counts with its elapsed time, a lower bound;
+            # recording only winners would pull the percentile down and hedge ever more requests
+            if task.cancelled():
+                if hedge_won:
+                    self.latency.record(time.monotonic() - started)
+            elif task.exception() is None:
+                self.latency.record(time.monotonic() - started)
+        
+        primary = asyncio.ensure_future(factory())
+        primary.add_done_callback(record_primary)
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.counters["hedges"] += 1
+                self._hedges_metric.inc()
+                tasks.add(asyncio.ensure_future(factory()))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.counters["hedge_wins"] += 1
+                            self._hedge_wins_metric.inc()
+                            hedge_won = True
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.latency.percentile(50, min_samples=1)
+        p95 = self.latency.percentile(95, min_samples=1)
+        return {
+            "name": self.name,
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.opened_count,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000) if self.hedge_delay() is not None else None,
+            "latency_p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000) if p95 is not None else None,
+            **self.counters
+        }
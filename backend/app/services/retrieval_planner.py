@@ -0,0 +1,70 @@
+import os
+import re
+from .config_cache import ChatbotConfig
+
+# Decisions recorded on each chat message
+RETRIEVAL_SEARCH = "search"
+RETRIEVAL_SKIP_NO_DOCUMENTS = "skip_no_documents"
+RETRIEVAL_SKIP_SMALL_TALK = "skip_small_talk"
+RETRIEVAL_REUSE = "reuse"
+RETRIEVAL_MERGE = "merge"
+
+SMALL_TALK_WORDS = frozenset("""
+    hi hello hey hiya howdy yo greetings morning afternoon evening good there all again
+    thanks thank thx ty cheers appreciate appreciated much so very you a lot
+    cool great nice awesome perfect
+    bye goodbye later see soon night have day
+    lol haha wow oh ah got it that's thats helps helpful
+""".split())
+# Answers to a question; only small talk when there is no earlier turn they could be answering
+REPLY_WORDS = frozenset("ok okay k kk sure yes yeah yep no nope alright fine".split())
+
+WORD = re.compile(r"[a-z']+")
+
+class RetrievalPlanner:
+    """Decides whether a chat message needs embedding and vector search.
+    
+    Retrieval is skipped when the chatbot has no chunks (from the cached
+    chatbot config) or when a cheap local check flags the message as small
+    talk: a short message made up only of greetings, thanks and the like.
+    
+    Follow-up turns whose embedding is close to the previous turn's reuse the
+    session's working set outright, or merge it with a narrower search.
+    """
+    
+    def __init__(self):
+        self.skip_small_talk = os.getenv("RETRIEVAL_SKIP_SMALL_TALK", "true").lower() == "true"
+        self.small_talk_max_words = int(os.getenv("RETRIEVAL_SMALL_TALK_MAX_WORDS", 6))
+        self.reuse_similarity = float(os.getenv("RETRIEVAL_REUSE_SIMILARITY", 0.92))
+        self.merge_similarity = float(os.getenv("RETRIEVAL_MERGE_SIMILARITY", 0.8))
+    
+    def is_small_talk(self, message: str, follow_up: bool = False) -> bool:
+        """Check whether a message is a short greeting, acknowledgement or farewell.
+        
+        In a ``follow_up`` (the session has earlier turns) a "yes" or "sure, ok"
+        may answer the assistant's own question, so it is not small talk.
+        """
+        if "?" in message:
+            return False
+        words = WORD.findall(message.lower())
+        if not words or len(words) > self.small_talk_max_words:
+            return False
+        if follow_up and any(word in REPLY_WORDS for word in words):
+            return False
+        return all(word in SMALL_TALK_WORDS or word in REPLY_WORDS for word in words)
+    
+    def plan(self, message: str, chatbot: ChatbotConfig, follow_up: bool = False) -> str:
+        """Return the retrieval decision for a message"""
+        if chatbot.chunk_count <= 0:
+            return RETRIEVAL_SKIP_NO_DOCUMENTS
+        if self.skip_small_talk and self.is_small_talk(message, follow_up):
+            return RETRIEVAL_SKIP_SMALL_TALK
+        return RETRIEVAL_SEARCH
+    
+    def plan_follow_up(self, similarity: float) -> str:
+        """Decide how to retrieve for a follow-up given its similarity to the previous query"""
+        if similarity >= self.reuse_similarity:
+            return RETRIEVAL_REUSE
+        if similarity >= self.merge_similarity:
+            return RETRIEVAL_MERGE
+        return RETRIEVAL_SEARCH
@@ -0,0 +1,184 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import event
+
+# Statements using the pgvector cosine distance operator
+VECTOR_DISTANCE = re.compile(r"<=>")
+EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+# Only a plain SELECT is safe to actually execute under ANALYZE; a WITH can hide a data-modifying CTE
+ANALYZABLE = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|nextval|setval|pg_notify|FOR\s+(UPDATE|SHARE|NO\s+KEY\s+UPDATE|KEY\s+SHARE))\b", re.IGNORECASE)
+
+def describe_parameters(parameters: Any) -> Any:
+    """Replace bound values (which may be session tokens or message text) with their type names"""
+    if isinstance(parameters, dict):
+        return {key: describe_parameters(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if len(parameters) > 10:
+            # Embeddings and id lists
+            return f"{type(parameters).__name__}({len(parameters)} items)"
+        return [describe_parameters(value) for value in parameters]
+    if isinstance(parameters, str):
+        return f"str({len(parameters)} chars)"
+    return type(parameters).__name__
+
+def is_read_only(statement: str) -> bool:
+    """Whether EXPLAIN ANALYZE may execute the statement: a SELECT with no writes, locks or sequence calls"""
+    return ANALYZABLE.match(statement) is not None and WRITES.search(statement) is None
+
+def plan_nodes(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten an EXPLAIN (FORMAT JSON) plan tree"""
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+class SlowQueryMonitor:
+    """Captures slow SQL statements in a ring buffer, with sampled EXPLAIN plans.
+    
+    Statements slower than SLOW_QUERY_THRESHOLD_MS are recorded. A
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE fraction of the slow SELECTs are
+    explained on a background thread and a separate connection, so the
+    request that hit the slow query does not pay twice. Only plain reads are
+    re-run under EXPLAIN (ANALYZE, BUFFERS); anything that could write
+    (a WITH, sequence calls, row locks) gets a plain EXPLAIN. Bound
+    parameters are stored as type names only.
+    Vector searches (``<=>``) are flagged when their plan does not use an
+    ivfflat/hnsw index.
+    """
+    
+    def __init__(self):
+        self.threshold_ms = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 500))
+        self.sample_rate = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 0.1))
+        self.explain_timeout_ms = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", 10000))
+        self._entries = deque(maxlen=int(os.getenv("SLOW_QUERY_BUFFER_SIZE", 100)))
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+        self._explaining = 0
+        self._engine = None
+        self.recorded = 0
+        self.index_misses = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+    
+    def attach(self, engine) -> None:
+        """Start timing every statement run through ``engine``"""
+        if not self.enabled or self._engine is not None:
+            return
+        self._engine = engine
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+    
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        context._query_started_at = time.perf_counter()
+    
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        started = getattr(context, "_query_started_at", None)
+        if started is None:
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        
+        entry = {
+            "recorded_at": datetime.utcnow().isoformat(),
+            "duration_ms": round(duration_ms, 1),
+            "statement": statement.strip()[:4000],
+            "parameters": describe_parameters(parameters),
+            "rows": cursor.rowcount,
+            "vector_search": bool(VECTOR_DISTANCE.search(statement)),
+            "plan": None,
+            "plan_error": None,
+            "analyzed": None,
+            "uses_vector_index": None,
+            "seq_scans": None,
+            "execution_ms": None
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+            sampled = (
+                not executemany
+                and EXPLAINABLE.match(statement) is not None
+                and self._explaining < 4
+                and random.random() < self.sample_rate
+            )
+            if sampled:
+                self._explaining += 1
+        if sampled:
+            self._executor.submit(self._explain, entry, statement, parameters)
+    
+    def _explain(self, entry: Dict[str, Any], statement: str, parameters: Any) -> None:
+        try:
+            # Raw DBAPI connection: bypasses the engine events, so EXPLAIN is never captured itself
+            connection = self._engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                # Transaction-local, so the pooled connection goes back with its defaults
+                cursor.execute(f"SET LOCAL statement_timeout = {self.explain_timeout_ms}")
+                cursor.execute("""
+                    SELECT indexname FROM pg_indexes
+                    WHERE indexdef ILIKE '%USING ivfflat%' OR indexdef ILIKE '%USING hnsw%'
+                """)
+                vector_indexes = {row[0] for row in cursor.fetchall()}
+                analyze = is_read_only(statement)
+                options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+                cursor.execute(f"EXPLAIN ({options}) {statement}", parameters)
+                result = cursor.fetchone()[0]
+                cursor.close()
+            finally:
+                # ANALYZE really ran the statement; never keep anything it did (plain EXPLAIN runs nothing)
+                connection.rollback()
+                connection.close()
+            explained = result[0] if isinstance(result, list) else json.loads(result)[0]
+            nodes = plan_nodes(explained["Plan"])
+            used_indexes = {node["Index Name"] for node in nodes if "Index Name" in node}
+            with self._lock:
+                entry["plan"] = explained
+                entry["analyzed"] = analyze
+                entry["execution_ms"] = explained.get("Execution Time")
+                entry["seq_scans"] = sorted({node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"})
+                if entry["vector_search"]:
+                    entry["uses_vector_index"] = bool(used_indexes & vector_indexes)
+                    if not entry["uses_vector_index"]:
+                        self.index_misses += 1
+        except Exception as e:
+            with self._lock:
+                entry["plan_error"] = str(e)
+        finally:
+            with self._lock:
+                self._explaining -= 1
+    
+    def entries(self, limit: Optional[int] = None, vector_only: bool = False) -> List[Dict[str, Any]]:
+        """Captured slow queries, newest first"""
+        with self._lock:
+            entries = [dict(entry) for entry in reversed(self._entries)]
+        if vector_only:
+            entries = [entry for entry in entries if entry["vector_search"]]
+        return entries[:limit] if limit else entries
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "explain_sample_rate": self.sample_rate,
+            "recorded": self.recorded,
+            "vector_index_misses": self.index_misses,
+            "buffered": len(self._entries)
+        }
+
+slow_query_monitor = SlowQueryMonitor()
@@ -0,0 +1,58 @@
+import os
+from opentelemetry import trace
+
+# Spans are no-ops until setup_tracing installs an SDK tracer provider
+tracer = trace.get_tracer("chatbot-api")
+
+def setup_tracing(app, engine) -> bool:
+    """Configure OpenTelemetry tracing from the environment; returns whether it was enabled.
+    
+    TRACING_ENABLED turns it on. Spans go to an OTLP/HTTP collector
+    (OTEL_EXPORTER_OTLP_ENDPOINT, default http://localhost:4318), a JSON
+    lines file (TRACING_FILE) or the console, per TRACING_EXPORTER. Root
+    spans are sampled at TRACING_SAMPLE_RATIO and children follow their
+    parent. FastAPI, SQLAlchemy and httpx (the OpenAI client) are
+    instrumented automatically.
+    """
+    if os.getenv("TRACING_ENABLED", "false").lower() != "true":
+        return False
+    
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+    from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+    
+    exporter_name = os.getenv("TRACING_EXPORTER", "otlp")
+    if exporter_name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    elif exporter_name == "file":
+        out = open(os.getenv("TRACING_FILE", "traces.jsonl"), "a", buffering=1)
+        exporter = ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    elif exporter_name == "console":
+        exporter = ConsoleSpanExporter()
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {exporter_name}")
+    
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "chatbot-api")}),
+        sampler=ParentBased(TraceIdRatioBased(float(os.getenv("TRACING_SAMPLE_RATIO", 1.0))))
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    
+    # Per-message ASGI receive/send spans only add noise
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="health,metrics", exclude_spans=["receive", "send"])
+    SQLAlchemyInstrumentor().instrument(engine=engine)
+    HTTPXClientInstrumentor().instrument()
+    print(f"Tracing enabled ({exporter_name} exporter)")
+    return True
+
+def shutdown_tracing() -> None:
+    """Flush buffered spans on shutdown"""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
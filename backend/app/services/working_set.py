@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+import numpy as np
+from ..models import DocumentChunk
+from .config_cache import ChatbotConfig
+
+def as_vector(value: Any) -> np.ndarray:
+    """Convert an embedding (list or pgvector text such as '[0.1,0.2]') to a float array"""
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b)) / norm if norm else 0.0
+
+@dataclass
+class WorkingSet:
+    """The last turn's query embedding and retrieved chunks for one session"""
+    chatbot_id: int
+    chatbot_version: Tuple[Any, int]
+    query_embedding: np.ndarray
+    chunks: List[Tuple[DocumentChunk, np.ndarray]]
+    stored_at: float
+
+class SessionWorkingSetCache:
+    """LRU of per-session retrieval working sets.
+    
+    Holds at most SESSION_WORKING_SET_SIZE sessions; entries expire after
+    SESSION_WORKING_SET_TTL seconds or as soon as the chatbot's cached config
+    changes (e.g. documents linked or removed).
+    """
+    
+    def __init__(self):
+        self.max_sessions = int(os.getenv("SESSION_WORKING_SET_SIZE", 1000))
+        self.ttl_seconds = float(os.getenv("SESSION_WORKING_SET_TTL", 1800))
+        self._entries: "OrderedDict[str, WorkingSet]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def chatbot_version(chatbot: ChatbotConfig) -> Tuple[Any, int]:
+        return (chatbot.updated_at, chatbot.chunk_count)
+    
+    def get(self, session_id: str, chatbot: ChatbotConfig) -> Optional[WorkingSet]:
+        """Get a session's working set if it is still valid for the chatbot"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if (
+                entry.chatbot_id != chatbot.id
+                or entry.chatbot_version != self.chatbot_version(chatbot)
+                or time.monotonic() - entry.stored_at >= self.ttl_seconds
+            ):
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return entry
+    
+    def put(
+        self,
+        session_id: str,
+        chatbot: ChatbotConfig,
+        query_embedding: np.ndarray,
+        chunks: List[Tuple[DocumentChunk, np.ndarray]]
+    ) -> None:
+        """Store the retrieval result of the latest turn"""
+        if self.max_sessions <= 0:
+            return
+        entry = WorkingSet(chatbot.id, self.chatbot_version(chatbot), query_embedding, chunks, time.monotonic())
+        with self._lock:
+            self._entries[session_id] = entry
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+session_working_sets = SessionWorkingSetCache()
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from ..database import SessionLocal
+from ..models import ChatSession, ChatMessage
+from .chatbot_service import ChatbotService
+from .analytics_service import AnalyticsService
+
+class ChatWriteBuffer:
+    """Optional write-behind queue for chat sessions and messages.
+    
+    When enabled (CHAT_WRITE_BEHIND=true) the chat path appends new sessions
+    and messages here instead of committing them itself. A background loop
+    writes everything buffered in one multi-row transaction every
+    CHAT_WRITE_BEHIND_INTERVAL_MS, or sooner once CHAT_WRITE_BEHIND_BATCH_SIZE
+    messages are waiting. Buffered rows stay visible to readers until they are
+    committed, and the buffer is flushed on shutdown.
+    """
+    
+    def __init__(self):
+        self.enabled = os.getenv("CHAT_WRITE_BEHIND", "false").lower() == "true"
+        self.interval_seconds = int(os.getenv("CHAT_WRITE_BEHIND_INTERVAL_MS", 200)) / 1000
+        self.batch_size = int(os.getenv("CHAT_WRITE_BEHIND_BATCH_SIZE", 100))
+        self.max_pending = int(os.getenv("CHAT_WRITE_BEHIND_MAX_PENDING", 2000))
+        self.max_retries = int(os.getenv("CHAT_WRITE_BEHIND_MAX_RETRIES", 3))
+        self.dead_letter_file = os.getenv("CHAT_WRITE_BEHIND_DEAD_LETTER_FILE", "chat_write_dead_letter.jsonl")
+        self.chatbot_service = ChatbotService()
+        self.analytics_service = AnalyticsService()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._messages: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._failures = 0
+        self.dead_lettered = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def pending(self) -> int:
+        return len(self._sessions) + len(self._messages)
+    
+    def is_full(self) -> bool:
+        return self.pending >= self.max_pending
+    
+    def add_session(self, session_id: str, chatbot_id: int) -> bool:
+        """Buffer a new session; returns False if the buffer is full"""
+        with self._lock:
+            if session_id in self._sessions:
+                return True
+            if self.is_full():
+                return False
+            self._sessions[session_id] = {
+                "session_id": session_id,
+                "chatbot_id": chatbot_id,
+                "created_at": datetime.utcnow()
+            }
+        return True
+    
+    def add_message(self, record: Dict[str, Any]) -> bool:
+        """Buffer a chat message record; returns False if the buffer is full"""
+        with self._lock:
+            if self.is_full():
+                return False
+            self._messages.append(record)
+            should_wake = len(self._messages) >= self.batch_size
+        if should_wake and self._wake is not None:
+            self._wake.set()
+        return True
+    
+    def get_pending_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a buffered session that has not been committed yet"""
+        with self._lock:
+            return self._sessions.get(session_id)
+    
+    def get_pending_messages(self, session_id: str) -> List[Dict[str, Any]]:
+        """Get buffered messages for a session, oldest first (abandoned turns excluded)"""
+        with self._lock:
+            return [
+                record for record in self._messages
+                if record["session_id"] == session_id and not record["abandoned"]
+            ]
+    
+    def flush(self) -> int:
+        """Write everything currently buffered, returning rows written or dead-lettered.
+        
+        The buffer is written in one transaction. A batch that keeps failing is
+        retried one row per transaction after max_retries attempts, so a single
+        bad row (e.g. a message whose session was purged) cannot hold back or
+        take down the rest. Rows that still fail while the database is
+        reachable go to the dead-letter file; if the database is down, every
+        unwritten row stays buffered for the next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                sessions = list(self._sessions.values())
+                messages = list(self._messages)
+            if not sessions and not messages:
+                return 0
+            
+            error = self._commit(sessions, messages)
+            if error is not None:
+                self._failures += 1
+                print(f"Error flushing chat write buffer (attempt {self._failures}): {error}")
+                if self._failures < self.max_retries:
+                    return 0
+                self._failures = 0
+                sessions, messages = self._write_rows(sessions, messages)
+            else:
+                self._failures = 0
+            
+            # Only now stop serving these rows from memory; new rows may have been appended meanwhile
+            with self._lock:
+                for session in sessions:
+                    if self._sessions.get(session["session_id"]) is session:
+                        del self._sessions[session["session_id"]]
+                done = {id(record) for record in messages}
+                self._messages[:] = [record for record in self._messages if id(record) not in done]
+            return len(sessions) + len(messages)
+    
+    def _commit(self, sessions: List[Dict[str, Any]], messages: List[Dict[str, Any]]) -> Optional[Exception]:
+        """Write rows in one transaction; returns the error instead of raising"""
+        db = SessionLocal()
+        try:
+            self._write_batch(db, sessions, messages)
+            db.commit()
+            return None
+        except Exception as e:
+            db.rollback()
+            return e
+        finally:
+            db.close()
+    
+    def _write_rows(self, sessions: List[Dict[str, Any]], messages: List[Dict[str, Any]]):
+        """Write a failed batch one row per transaction; returns the sessions and messages that are done with"""
+        done_sessions, done_messages = [], []
+        failed = []
+        for session in sessions:
+            error = self._commit([session], [])
+            if error is None:
+                done_sessions.append(session)
+            else:
+                failed.append(("session", session, error))
+        for message in messages:
+            error = self._commit([], [message])
+            if error is None:
+                done_messages.append(message)
+            else:
+                failed.append(("message", message, error))
+        
+        if failed and self._database_reachable():
+            # The database is up, so these rows themselves are bad: set them aside instead of retrying forever
+            self._dead_letter(failed)
+            done_sessions += [row for kind, row, _ in failed if kind == "session"]
+            done_messages += [row for kind, row, _ in failed if kind == "message"]
+        elif failed:
+            print(f"Chat write buffer: database unreachable, keeping {len(failed)} rows for the next flush")
+        return done_sessions, done_messages
+    
+    def _database_reachable(self) -> bool:
+        db = SessionLocal()
+        try:
+            db.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+        finally:
+            db.close()
+    
+    def _dead_letter(self, failed: List[Tuple[str, Dict[str, Any], Exception]]) -> None:
+        """Append rows that could not be written to the dead-letter file (JSON lines)"""
+        self.dead_lettered += len(failed)
+        print(f"Chat write buffer: {len(failed)} rows could not be written, see {self.dead_letter_file}")
+        try:
+            with open(self.dead_letter_file, "a") as out:
+                for kind, row, error in failed:
+                    out.write(json.dumps({
+                        "kind": kind,
+                        "row": row,
+                        "error": str(error),
+                        "failed_at": datetime.utcnow().isoformat()
+                    }, default=str) + "\n")
+        except Exception as e:
+            print(f"Error writing chat dead-letter file: {e}")
+            for kind, row, error in failed:
+                print(f"Dead-lettered {kind}: {json.dumps(row, default=str)} ({error})")
+    
+    def _write_batch(self, db, sessions: List[Dict[str, Any]], messages: List[Dict[str, Any]]) -> None:
+        session_counts = defaultdict(int)
+        if sessions:
+            stmt = insert(ChatSession.__table__).values(sessions).on_conflict_do_nothing(
+                index_elements=["session_id"]
+            ).returning(ChatSession.__table__.c.chatbot_id, ChatSession.__table__.c.created_at)
+            for chatbot_id, created_at in db.execute(stmt):
+                session_counts[chatbot_id] += 1
+                self.analytics_service.record_session(db, chatbot_id, created_at)
+        
+        message_counts = defaultdict(int)
+        if messages:
+            columns = ("session_id", "message", "response", "context_chunks", "retrieval_decision", "degraded", "abandoned", "created_at")
+            db.execute(insert(ChatMessage.__table__).values([
+                {column: record[column] for column in columns} for record in messages
+            ]))
+            
+            # Aggregate rollup deltas per chatbot and hour before upserting
+            rollups = defaultdict(lambda: defaultdict(int))
+            for record in messages:
+                if record["abandoned"]:
+                    continue
+                message_counts[record["chatbot_id"]] += 1
+                bucket = rollups[(record["chatbot_id"], self.analytics_service.bucket_start(record["created_at"], "hour"))]
+                bucket["message_count"] += 1
+                bucket["context_hit_count"] += 1 if record["context_chunks"] else 0
+                bucket["prompt_tokens"] += record.get("prompt_tokens", 0)
+                bucket["completion_tokens"] += record.get("completion_tokens", 0)
+            for (chatbot_id, hour), deltas in rollups.items():
+                self.analytics_service.increment(db, chatbot_id, hour, **deltas)
+        
+        if messages:
+            per_session = defaultdict(int)
+            for record in messages:
+                if not record["abandoned"]:
+                    per_session[record["session_id"]] += 1
+            for session_id, count in per_session.items():
+                db.query(ChatSession).filter(ChatSession.session_id == session_id).update(
+                    {ChatSession.message_count: ChatSession.message_count + count}, synchronize_session=False
+                )
+        
+        for chatbot_id in set(session_counts) | set(message_counts):
+            self.chatbot_service.increment_counters(
+                db, [chatbot_id],
+                session_count=session_counts[chatbot_id],
+                message_count=message_counts[chatbot_id]
+            )
+    
+    async def flush_async(self) -> int:
+        """Flush from the event loop without blocking it"""
+        return await asyncio.to_thread(self.flush)
+    
+    def start(self) -> None:
+        """Start the background flush loop"""
+        if self.enabled and self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="chat-write-behind")
+    
+    async def stop(self) -> None:
+        """Stop the flush loop and write out anything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _ in range(self.max_retries):
+            if not self.pending:
+                break
+            await self.flush_async()
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self.pending:
+                await self.flush_async()
+
+chat_write_buffer = ChatWriteBuffer()
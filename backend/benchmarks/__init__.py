@@ -0,0 +1 @@
+"""Offline benchmarks for tuning retrieval settings"""
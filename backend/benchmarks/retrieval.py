@@ -0,0 +1,407 @@
+"""Retrieval quality and latency benchmark.
+
+Generates a synthetic corpus in which every "part code" fact appears once,
+ingests it through DocumentProcessor (so CHUNK_SIZE / CHUNK_OVERLAP and the
+embedding provider behave exactly as in production), then asks one question
+per sampled fact and scores the chunks returned by the chatbot vector search:
+recall@k, MRR and query latency, for each vector index configuration.
+Results are appended as JSON lines so runs can be compared over time.
+
+The benchmark drops and recreates document_chunks_embedding_idx and
+truncates the documents tables, so it only runs against the database given
+with --database-url / BENCHMARK_DATABASE_URL, never DATABASE_URL itself.
+
+    MODEL_PROVIDER=local python -m benchmarks.retrieval --database-url postgresql://.../bench \\
+        --sizes 10000,100000 --index ivfflat:lists=100,probes=10 --index hnsw:m=16,ef_construction=64,ef_search=40
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session, sessionmaker
+from app.models import Base, Chatbot, Document, chatbot_documents
+from app.services.embeddings import EmbeddingService
+from app.services.document_processor import DocumentProcessor
+from loadtest.driver import percentile
+
+INDEX_NAME = "document_chunks_embedding_idx"
+CHATBOT_PREFIX = "benchmark-"
+
+# Build-time and query-time parameters accepted per index type
+INDEX_PARAMS = {
+    "none": ((), ()),
+    "ivfflat": (("lists",), ("probes",)),
+    "hnsw": (("m", "ef_construction"), ("ef_search",)),
+}
+
+CITIES = ["Lisbon", "Osaka", "Denver", "Nairobi", "Oslo", "Lima", "Perth", "Tallinn", "Accra", "Quito"]
+TEAMS = ["logistics", "returns", "assembly", "quality", "inbound", "export", "repairs", "catalog"]
+FILLER_SUBJECTS = ["The warehouse", "Each shipment", "The inventory system", "A supplier", "The night shift", "Every pallet"]
+FILLER_PREDICATES = [
+    "is scanned twice before it leaves the dock.",
+    "follows the standard handling procedure.",
+    "is recorded in the daily stock report.",
+    "must be labelled according to the regional rules.",
+    "is reviewed by a supervisor at the end of the week.",
+    "uses the shared loading bays during peak hours.",
+]
+
+@dataclass
+class Fact:
+    code: str
+    city: str
+    team: str
+    filename: str
+    
+    @property
+    def sentence(self) -> str:
+        return f"Part {self.code} is stocked in {self.city} by the {self.team} team."
+    
+    @property
+    def question(self) -> str:
+        return f"Which team stocks part {self.code} and where?"
+
+@dataclass
+class IndexConfig:
+    kind: str
+    build: Dict[str, int] = field(default_factory=dict)
+    query: Dict[str, int] = field(default_factory=dict)
+    
+    @property
+    def label(self) -> str:
+        params = ",".join(f"{key}={value}" for key, value in {**self.build, **self.query}.items())
+        return f"{self.kind}:{params}" if params else self.kind
+
+def parse_index(value: str) -> IndexConfig:
+    """Parse e.g. ``hnsw:m=16,ef_construction=64,ef_search=40``"""
+    kind, _, params = value.partition(":")
+    if kind not in INDEX_PARAMS:
+        raise argparse.ArgumentTypeError(f"Unknown index type: {kind}")
+    build_keys, query_keys = INDEX_PARAMS[kind]
+    config = IndexConfig(kind)
+    for part in filter(None, params.split(",")):
+        key, _, number = part.partition("=")
+        if key in build_keys:
+            config.build[key] = int(number)
+        elif key in query_keys:
+            config.query[key] = int(number)
+        else:
+            raise argparse.ArgumentTypeError(f"Unknown {kind} parameter: {key}")
+    return config
+
+def generate_corpus(target_chunks: int, chunk_size: int, chunk_overlap: int, seed: int) -> Tuple[List[Tuple[str, str]], List[Fact]]:
+    """Documents of about 20 chunks each with roughly one unique fact per chunk"""
+    rng = random.Random(seed)
+    chunks_per_document = 20
+    stride = max(chunk_size - chunk_overlap, 1)
+    documents, facts = [], []
+    for index in range(math.ceil(target_chunks / chunks_per_document)):
+        filename = f"benchmark-{index:07d}.txt"
+        sentences = []
+        for j in range(chunks_per_document):
+            code = f"p{index:07d}x{j:02d}"
+            fact = Fact(code, rng.choice(CITIES), rng.choice(TEAMS), filename)
+            facts.append(fact)
+            length = len(fact.sentence)
+            block = [fact.sentence]
+            while length < stride:
+                filler = f"{rng.choice(FILLER_SUBJECTS)} {rng.choice(FILLER_PREDICATES)}"
+                block.insert(rng.randint(0, len(block)), filler)
+                length += len(filler) + 1
+            sentences.extend(block)
+        documents.append((filename, " ".join(sentences)))
+    return documents, facts
+
+class RetrievalBenchmark:
+    def __init__(self, engine, processor: DocumentProcessor, args: argparse.Namespace):
+        self.engine = engine
+        self.Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+        self.processor = processor
+        self.args = args
+    
+    def corpus_name(self, target_chunks: int) -> str:
+        return f"{CHATBOT_PREFIX}{target_chunks}-{self.processor.chunk_size}-{self.processor.chunk_overlap}-{self.args.seed}"
+    
+    def loaded_chatbot(self, db: Session, name: str) -> Optional[int]:
+        """The corpus chatbot's id if the database holds exactly that corpus"""
+        chatbot = db.query(Chatbot).filter(Chatbot.name == name).first()
+        if chatbot is None:
+            return None
+        total = db.execute(text("SELECT count(*) FROM document_chunks")).scalar()
+        linked = db.execute(text("""
+            SELECT count(*) FROM document_chunks dc
+            JOIN chatbot_documents cd ON cd.document_id = dc.document_id
+            WHERE cd.chatbot_id = :chatbot_id
+        """), {"chatbot_id": chatbot.id}).scalar()
+        return chatbot.id if total and total == linked else None
+    
+    async def ingest(self, name: str, documents: List[Tuple[str, str]]) -> Tuple[int, float]:
+        """Replace the database contents with the corpus; returns (chatbot id, seconds)"""
+        db = self.Session()
+        try:
+            # Other corpora would share the index and skew both recall and latency
+            db.execute(text("TRUNCATE chatbots, documents, document_chunks, chatbot_documents RESTART IDENTITY CASCADE"))
+            db.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}"))
+            chatbot = Chatbot(name=name, system_prompt="Retrieval benchmark", settings={})
+            db.add(chatbot)
+            db.commit()
+            chatbot_id = chatbot.id
+        finally:
+            db.close()
+        
+        semaphore = asyncio.Semaphore(self.args.ingest_concurrency)
+        done = 0
+        started = time.perf_counter()
+        
+        async def ingest_document(directory: str, filename: str, content: str) -> None:
+            nonlocal done
+            async with semaphore:
+                path = os.path.join(directory, filename)
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write(content)
+                db = self.Session()
+                try:
+                    document = await self.processor.process_document(path, filename, db)
+                    db.execute(chatbot_documents.insert().values(chatbot_id=chatbot_id, document_id=document.id))
+                    db.commit()
+                finally:
+                    db.close()
+                    os.remove(path)
+                done += 1
+                if done % 500 == 0:
+                    print(f"  ingested {done}/{len(documents)} documents")
+        
+        with tempfile.TemporaryDirectory() as directory:
+            await asyncio.gather(*(ingest_document(directory, filename, content) for filename, content in documents))
+        with self.engine.begin() as connection:
+            connection.execute(text("ANALYZE document_chunks"))
+        return chatbot_id, time.perf_counter() - started
+    
+    def ground_truth(self, db: Session, facts: List[Fact]) -> List[Set[Tuple[int, int]]]:
+        """(document_id, chunk_index) pairs holding each fact, from re-chunking the generated text"""
+        filenames = {fact.filename for fact in facts}
+        ids = dict(db.query(Document.filename, Document.id).filter(Document.filename.in_(filenames)).all())
+        contents = dict(db.query(Document.filename, Document.content).filter(Document.filename.in_(filenames)).all())
+        chunks = {filename: self.processor.chunk_text(content) for filename, content in contents.items()}
+        return [
+            {(ids[fact.filename], i) for i, chunk in enumerate(chunks[fact.filename]) if fact.code in chunk}
+            for fact in facts
+        ]
+    
+    def build_index(self, config: IndexConfig) -> Tuple[Optional[float], Optional[int]]:
+        """Recreate the embedding index; returns (build seconds, size in bytes)"""
+        with self.engine.begin() as connection:
+            connection.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}"))
+            if config.kind == "none":
+                return None, None
+            options = ", ".join(f"{key} = {value}" for key, value in config.build.items())
+            started = time.perf_counter()
+            connection.execute(text(
+                f"CREATE INDEX {INDEX_NAME} ON document_chunks USING {config.kind} (embedding vector_cosine_ops)"
+                + (f" WITH ({options})" if options else "")
+            ))
+            seconds = time.perf_counter() - started
+            size = connection.execute(text(f"SELECT pg_relation_size('{INDEX_NAME}')")).scalar()
+        return seconds, size
+    
+    def evaluate(
+        self,
+        chatbot_id: int,
+        config: IndexConfig,
+        query_embeddings: List[List[float]],
+        truth: List[Set[Tuple[int, int]]],
+        exact: Optional[List[List[Tuple[int, int]]]]
+    ) -> Tuple[Dict[str, Any], List[List[Tuple[int, int]]]]:
+        """Score one index configuration; also returns the ranked results per query.
+        
+        ``recall@k`` is measured against the ground truth, ``ann_recall@k``
+        against the exact (index-free) results, which isolates what the index
+        itself loses regardless of how good the embeddings are.
+        """
+        ks = sorted(self.args.k)
+        db = self.Session()
+        try:
+            for key, value in config.query.items():
+                db.execute(text(f"SET {config.kind}.{key} = {int(value)}"))
+            # Warm the cache and the planner before timing
+            for embedding in query_embeddings[:min(10, len(query_embeddings))]:
+                self.processor.search_chunks_by_embedding(embedding, chatbot_id, db, ks[-1])
+            
+            latencies, reciprocal_ranks, rankings = [], [], []
+            recalls: Dict[int, List[float]] = {k: [] for k in ks}
+            ann_recalls: Dict[int, List[float]] = {k: [] for k in ks}
+            for i, (embedding, relevant) in enumerate(zip(query_embeddings, truth)):
+                started = time.perf_counter()
+                results = self.processor.search_chunks_by_embedding(embedding, chatbot_id, db, ks[-1])
+                latencies.append((time.perf_counter() - started) * 1000)
+                ranked = [(chunk.document_id, chunk.chunk_index) for chunk, _ in results]
+                rankings.append(ranked)
+                rank = next((position + 1 for position, key in enumerate(ranked) if key in relevant), None)
+                reciprocal_ranks.append(1 / rank if rank else 0.0)
+                for k in ks:
+                    recalls[k].append(len(relevant.intersection(ranked[:k])) / len(relevant) if relevant else 0.0)
+                    if exact is not None and exact[i][:k]:
+                        ann_recalls[k].append(len(set(exact[i][:k]).intersection(ranked[:k])) / len(exact[i][:k]))
+            db.rollback()
+        finally:
+            db.close()
+        
+        metrics = {
+            **{f"recall@{k}": sum(values) / len(values) for k, values in recalls.items()},
+            **{f"ann_recall@{k}": sum(values) / len(values) if values else 1.0 for k, values in ann_recalls.items()},
+            f"mrr@{ks[-1]}": sum(reciprocal_ranks) / len(reciprocal_ranks),
+            "latency_ms": {
+                "mean": sum(latencies) / len(latencies),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99)
+            }
+        }
+        return metrics, rankings
+    
+    async def run_size(self, target_chunks: int) -> List[Dict[str, Any]]:
+        args = self.args
+        name = self.corpus_name(target_chunks)
+        documents, facts = generate_corpus(target_chunks, self.processor.chunk_size, self.processor.chunk_overlap, args.seed)
+        db = self.Session()
+        try:
+            chatbot_id = self.loaded_chatbot(db, name) if not args.reingest else None
+        finally:
+            db.close()
+        ingest_seconds = None
+        if chatbot_id is None:
+            print(f"Ingesting {len(documents)} documents for ~{target_chunks} chunks")
+            chatbot_id, ingest_seconds = await self.ingest(name, documents)
+        else:
+            print(f"Reusing the loaded {name} corpus")
+        
+        sample = random.Random(args.seed).sample(facts, min(args.queries, len(facts)))
+        db = self.Session()
+        try:
+            truth = self.ground_truth(db, sample)
+            chunk_count = db.execute(text("SELECT count(*) FROM document_chunks")).scalar()
+        finally:
+            db.close()
+        embedding_started = time.perf_counter()
+        query_embeddings = await self.processor.embedding_service.get_embeddings_batch([fact.question for fact in sample])
+        embedding_ms = (time.perf_counter() - embedding_started) * 1000 / len(sample)
+        
+        results = []
+        exact = None
+        # The exact scan runs first: it is the reference for ann_recall@k
+        configs = [IndexConfig("none")] + [config for config in args.index if config.kind != "none"]
+        for config in configs:
+            build_seconds, index_bytes = self.build_index(config)
+            metrics, rankings = self.evaluate(chatbot_id, config, query_embeddings, truth, exact)
+            if exact is None:
+                exact = rankings
+            results.append({
+                "corpus": {
+                    "target_chunks": target_chunks,
+                    "chunks": chunk_count,
+                    "documents": len(documents),
+                    "chunk_size": self.processor.chunk_size,
+                    "chunk_overlap": self.processor.chunk_overlap,
+                    "seed": args.seed,
+                    "ingest_seconds": ingest_seconds
+                },
+                "index": {
+                    "type": config.kind,
+                    "label": config.label,
+                    "build": config.build,
+                    "query": config.query,
+                    "build_seconds": build_seconds,
+                    "size_bytes": index_bytes
+                },
+                "queries": len(sample),
+                "query_embedding_ms": embedding_ms,
+                **metrics
+            })
+            print_result(results[-1])
+        return results
+
+def print_result(result: Dict[str, Any]) -> None:
+    recalls = " ".join(f"{key}={value:.3f}" for key, value in result.items() if "recall@" in key)
+    mrr = next(f"{key}={value:.3f}" for key, value in result.items() if key.startswith("mrr@"))
+    latency = result["latency_ms"]
+    build = result["index"]["build_seconds"]
+    print(
+        f"  {result['corpus']['chunks']:>8} chunks  {result['index']['label']:<40} {recalls} {mrr}"
+        f"  p50={latency['p50']:.1f}ms p99={latency['p99']:.1f}ms"
+        + (f"  build={build:.1f}s" if build is not None else "")
+    )
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def main_async(args: argparse.Namespace) -> int:
+    if not args.database_url:
+        print("Pass --database-url (or set BENCHMARK_DATABASE_URL) to a dedicated database", file=sys.stderr)
+        return 2
+    if args.database_url == os.getenv("DATABASE_URL"):
+        print("Refusing to benchmark against DATABASE_URL: the benchmark truncates document tables", file=sys.stderr)
+        return 2
+    
+    engine = create_engine(args.database_url)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    Base.metadata.create_all(bind=engine)
+    
+    processor = DocumentProcessor(EmbeddingService())
+    if args.chunk_size:
+        processor.chunk_size = args.chunk_size
+    if args.chunk_overlap is not None:
+        processor.chunk_overlap = args.chunk_overlap
+    benchmark = RetrievalBenchmark(engine, processor, args)
+    
+    run = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_commit": git_commit(),
+        "label": args.label,
+        "embedding_space": processor.embedding_service.space.key
+    }
+    with open(args.output, "a") as output:
+        for size in args.sizes:
+            for result in await benchmark.run_size(size):
+                output.write(json.dumps({**run, **result}) + "\n")
+                output.flush()
+    print(f"Results appended to {args.output}")
+    return 0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--database-url", default=os.getenv("BENCHMARK_DATABASE_URL"))
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[10_000],
+                        help="Comma-separated corpus sizes in chunks, e.g. 10000,100000,1000000")
+    parser.add_argument("--index", type=parse_index, action="append", default=[],
+                        help="ivfflat:lists=N,probes=N | hnsw:m=N,ef_construction=N,ef_search=N (repeatable); an exact scan always runs first")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Override CHUNK_SIZE")
+    parser.add_argument("--chunk-overlap", type=int, default=None, help="Override CHUNK_OVERLAP")
+    parser.add_argument("--k", type=lambda value: [int(k) for k in value.split(",")],
+                        default=sorted({1, 5, 10, int(os.getenv("TOP_K_RESULTS", 5))}), help="Cut-offs for recall@k")
+    parser.add_argument("--queries", type=int, default=500, help="Questions asked per corpus")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ingest-concurrency", type=int, default=4, help="Documents embedded in parallel")
+    parser.add_argument("--reingest", action="store_true", help="Rebuild the corpus even if it is already loaded")
+    parser.add_argument("--label", default=None, help="Free-form note stored with every result")
+    parser.add_argument("--output", default="retrieval_benchmark.jsonl", help="JSON lines file results are appended to")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+if __name__ == "__main__":
+    main()
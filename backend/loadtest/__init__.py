@@ -0,0 +1 @@
+"""Load-testing harness: a mock OpenAI-compatible server, a seeder and a traffic driver"""
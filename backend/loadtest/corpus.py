@@ -0,0 +1,59 @@
+import random
+from typing import List, Tuple
+
+# Topics shared by the seeded documents and the generated questions, so searches find relevant chunks
+TOPICS = [
+    ("refund policy", ["refunds", "returns", "store credit", "receipts", "damaged items"]),
+    ("shipping times", ["delivery", "couriers", "tracking numbers", "customs", "express orders"]),
+    ("account security", ["passwords", "two-factor codes", "login alerts", "recovery emails", "sessions"]),
+    ("billing", ["invoices", "payment methods", "tax receipts", "subscriptions", "proration"]),
+    ("warranty claims", ["defects", "repairs", "replacement parts", "serial numbers", "inspections"]),
+    ("data export", ["CSV files", "archives", "API tokens", "scheduled reports", "retention"]),
+    ("team management", ["roles", "invitations", "permissions", "seats", "audit logs"]),
+    ("mobile app", ["notifications", "offline mode", "updates", "device limits", "sync"]),
+]
+
+VERBS = ["covers", "explains", "limits", "requires", "changes", "describes", "affects", "simplifies"]
+QUALIFIERS = ["within 30 days", "for business accounts", "in most regions", "after verification",
+              "on the annual plan", "unless stated otherwise", "during peak season", "for new customers"]
+QUESTIONS = [
+    "What is the {topic} for {detail}?",
+    "How does the {topic} work with {detail}?",
+    "Can you explain {detail} in the {topic}?",
+    "Tell me about {topic} and {detail}",
+]
+FOLLOW_UPS = ["What about {detail}?", "And for {detail}?", "Does that also apply to {detail}?", "Can you give more detail?"]
+SMALL_TALK = ["hi", "thanks!", "hello there", "ok thank you"]
+
+def document(rng: random.Random, index: int, paragraphs: int = 12) -> Tuple[str, str]:
+    """A synthetic help-centre article; returns (filename, text)"""
+    topic, details = TOPICS[index % len(TOPICS)]
+    lines = [f"{topic.title()} guide {index}", ""]
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(4, 7)):
+            sentences.append(
+                f"The {topic} {rng.choice(VERBS)} {rng.choice(details)} {rng.choice(QUALIFIERS)}."
+            )
+        lines.append(" ".join(sentences))
+        lines.append("")
+    return f"loadtest-{topic.replace(' ', '-')}-{index}.txt", "\n".join(lines)
+
+def question(rng: random.Random) -> str:
+    topic, details = rng.choice(TOPICS)
+    return rng.choice(QUESTIONS).format(topic=topic, detail=rng.choice(details))
+
+def follow_up(rng: random.Random) -> str:
+    _, details = rng.choice(TOPICS)
+    return rng.choice(FOLLOW_UPS).format(detail=rng.choice(details))
+
+def small_talk(rng: random.Random) -> str:
+    return rng.choice(SMALL_TALK)
+
+def search_query(rng: random.Random) -> str:
+    topic, details = rng.choice(TOPICS)
+    return f"{topic} {rng.choice(details)}"
+
+def documents(seed: int, count: int) -> List[Tuple[str, str]]:
+    rng = random.Random(seed)
+    return [document(rng, index) for index in range(count)]
@@ -0,0 +1,265 @@
+"""Open-loop load driver for /chat/, /documents/search and /documents/upload.
+
+Requests are started at the target rate regardless of how fast the server
+answers (so queueing shows up as latency instead of being hidden by the
+client), for seeded ``loadtest-*`` chatbots. Prints p50/p95/p99 latency,
+throughput and error rates per endpoint, and exits non-zero when an SLO given
+with --slo is missed, so it can gate a release.
+
+    python -m loadtest.driver --rps 20 --duration 120 --mix chat=90,search=8,upload=2 \\
+        --slo chat:p95=4000 --slo chat:error_rate=0.01
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import httpx
+from . import corpus
+from .seed import CHATBOT_PREFIX
+
+ENDPOINTS = ("chat", "search", "upload")
+METRICS = ("p50", "p95", "p99", "error_rate")
+
+@dataclass
+class Sample:
+    endpoint: str
+    started_at: float
+    latency: float
+    outcome: str
+    degraded: bool = False
+
+@dataclass
+class Run:
+    """Everything the driver recorded; samples started during warm-up are kept out of the report"""
+    started_at: float
+    warmup: float
+    samples: List[Sample] = field(default_factory=list)
+    dropped: Counter = field(default_factory=Counter)
+
+def percentile(values: List[float], rank: float) -> Optional[float]:
+    """Nearest-rank percentile of ``values`` (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(math.ceil(rank / 100 * len(ordered)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint in mix: {name}")
+        mix[name.strip()] = float(weight)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("Mix needs at least one positive weight")
+    return mix
+
+def parse_slo(value: str) -> Tuple[str, str, float]:
+    """Parse ``endpoint:metric=value``, e.g. ``chat:p95=4000`` (milliseconds) or ``all:error_rate=0.01``"""
+    try:
+        target, threshold = value.split("=")
+        endpoint, metric = target.split(":")
+        limit = float(threshold)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected endpoint:metric=value, got {value}")
+    if endpoint not in ENDPOINTS + ("all",) or metric not in METRICS:
+        raise argparse.ArgumentTypeError(f"Unknown SLO target: {value}")
+    return endpoint, metric, limit
+
+class Driver:
+    def __init__(self, client: httpx.AsyncClient, chatbot_ids: List[int], args: argparse.Namespace):
+        self.client = client
+        self.chatbot_ids = chatbot_ids
+        self.args = args
+        self.rng = random.Random(args.seed)
+        # Sessions that recently got an answer, for follow-up turns
+        self.sessions: Deque[Tuple[int, str]] = deque(maxlen=500)
+        self.upload_count = 0
+    
+    async def chat(self) -> Tuple[httpx.Response, bool]:
+        if self.sessions and self.rng.random() < self.args.follow_up_rate:
+            chatbot_id, session_id = self.rng.choice(self.sessions)
+            message = corpus.follow_up(self.rng)
+        else:
+            chatbot_id, session_id = self.rng.choice(self.chatbot_ids), str(uuid.uuid4())
+            if self.rng.random() < self.args.small_talk_rate:
+                message = corpus.small_talk(self.rng)
+            else:
+                message = corpus.question(self.rng)
+        response = await self.client.post("/chat/", json={
+            "message": message, "chatbot_id": chatbot_id, "session_id": session_id
+        })
+        degraded = False
+        if response.status_code == 200:
+            self.sessions.append((chatbot_id, session_id))
+            degraded = bool(response.json().get("degraded"))
+        return response, degraded
+    
+    async def search(self) -> Tuple[httpx.Response, bool]:
+        return await self.client.post("/documents/search", json={"query": corpus.search_query(self.rng)}), False
+    
+    async def upload(self) -> Tuple[httpx.Response, bool]:
+        self.upload_count += 1
+        filename, text = corpus.document(self.rng, self.rng.randrange(10_000), paragraphs=4)
+        response = await self.client.post(
+            "/documents/upload",
+            data={"chatbot_id": str(self.rng.choice(self.chatbot_ids))},
+            files={"file": (f"{self.upload_count}-{filename}", text.encode("utf-8"), "text/plain")}
+        )
+        return response, False
+    
+    async def request(self, run: Run, endpoint: str) -> None:
+        started = time.monotonic()
+        degraded = False
+        try:
+            response, degraded = await getattr(self, endpoint)()
+            outcome = str(response.status_code)
+        except httpx.TimeoutException:
+            outcome = "timeout"
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        run.samples.append(Sample(endpoint, started, time.monotonic() - started, outcome, degraded))
+    
+    async def run(self) -> Run:
+        args = self.args
+        endpoints = list(args.mix)
+        weights = [args.mix[name] for name in endpoints]
+        run = Run(started_at=time.monotonic(), warmup=args.warmup)
+        stop_at = run.started_at + args.warmup + args.duration
+        tasks = set()
+        next_at = run.started_at
+        while next_at < stop_at:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            endpoint = self.rng.choices(endpoints, weights)[0]
+            if len(tasks) >= args.max_in_flight:
+                # The client itself is saturated; count it rather than silently slowing the arrival rate
+                if next_at - run.started_at >= run.warmup:
+                    run.dropped[endpoint] += 1
+            else:
+                task = asyncio.create_task(self.request(run, endpoint))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            next_at += self.rng.expovariate(args.rps) if args.arrival == "poisson" else 1 / args.rps
+        if tasks:
+            await asyncio.wait(tasks)
+        return run
+
+def summarize(run: Run, duration: float) -> Dict[str, Dict[str, Any]]:
+    """Per-endpoint (and overall) latency percentiles in ms, throughput and error rates"""
+    measured = [sample for sample in run.samples if sample.started_at - run.started_at >= run.warmup]
+    groups: Dict[str, List[Sample]] = {"all": measured}
+    for sample in measured:
+        groups.setdefault(sample.endpoint, []).append(sample)
+    
+    report = {}
+    for name in ("all",) + ENDPOINTS:
+        samples = groups.get(name, [])
+        dropped = sum(run.dropped.values()) if name == "all" else run.dropped.get(name, 0)
+        if not samples and not dropped:
+            continue
+        ok = [sample for sample in samples if sample.outcome.startswith("2")]
+        latencies = [sample.latency * 1000 for sample in ok]
+        total = len(samples) + dropped
+        outcomes = Counter(sample.outcome for sample in samples)
+        if dropped:
+            outcomes["client_saturated"] = dropped
+        report[name] = {
+            "requests": total,
+            "ok": len(ok),
+            "errors": total - len(ok),
+            "error_rate": (total - len(ok)) / total if total else 0.0,
+            "degraded": sum(1 for sample in ok if sample.degraded),
+            "throughput_rps": len(ok) / duration if duration else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+            "outcomes": dict(outcomes)
+        }
+    return report
+
+def print_report(report: Dict[str, Dict[str, Any]]) -> None:
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value:.0f}"
+    
+    print(f"{'endpoint':<9}{'requests':>9}{'ok':>8}{'error%':>8}{'degraded':>9}{'rps':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for name, row in report.items():
+        print(
+            f"{name:<9}{row['requests']:>9}{row['ok']:>8}{row['error_rate'] * 100:>7.2f}%{row['degraded']:>9}"
+            f"{row['throughput_rps']:>8.1f}{ms(row['p50']):>8}{ms(row['p95']):>8}{ms(row['p99']):>8}{ms(row['max']):>8}"
+        )
+    print("latencies in ms over successful requests")
+    for name, row in report.items():
+        failures = {outcome: count for outcome, count in row["outcomes"].items() if not outcome.startswith("2")}
+        if failures:
+            print(f"{name} failures: {', '.join(f'{outcome}={count}' for outcome, count in sorted(failures.items()))}")
+
+def check_slos(report: Dict[str, Dict[str, Any]], slos: List[Tuple[str, str, float]]) -> List[str]:
+    """Return a message for every SLO the run missed"""
+    missed = []
+    for endpoint, metric, limit in slos:
+        row = report.get(endpoint)
+        if row is None:
+            missed.append(f"{endpoint}:{metric} has no samples")
+            continue
+        value = row[metric]
+        if value is None or value > limit:
+            missed.append(f"{endpoint}:{metric}={'-' if value is None else f'{value:.4g}'} exceeds {limit:g}")
+    return missed
+
+async def discover_chatbots(client: httpx.AsyncClient) -> List[int]:
+    response = await client.get("/chatbots/")
+    response.raise_for_status()
+    return [bot["id"] for bot in response.json() if bot["name"].startswith(CHATBOT_PREFIX)]
+
+async def main_async(args: argparse.Namespace) -> int:
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.api, timeout=args.timeout, limits=limits) as client:
+        chatbot_ids = args.chatbot_ids or await discover_chatbots(client)
+        if not chatbot_ids:
+            print("No load-test chatbots found; run `python -m loadtest.seed` first", file=sys.stderr)
+            return 2
+        print(f"Driving {args.rps} rps for {args.duration}s (+{args.warmup}s warm-up) against chatbots {chatbot_ids}")
+        run = await Driver(client, chatbot_ids, args).run()
+    
+    report = summarize(run, args.duration)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "slo"}, "report": report}, file, indent=2)
+    missed = check_slos(report, args.slo)
+    for message in missed:
+        print(f"SLO missed: {message}", file=sys.stderr)
+    return 1 if missed else 0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--api", default="http://localhost:8000")
+    parser.add_argument("--rps", type=float, default=10, help="Target arrival rate")
+    parser.add_argument("--duration", type=float, default=60, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=10, help="Seconds of traffic excluded from the report")
+    parser.add_argument("--arrival", choices=["poisson", "constant"], default="poisson")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("chat=90,search=8,upload=2"))
+    parser.add_argument("--follow-up-rate", type=float, default=0.3, help="Share of chat requests that continue a recent session")
+    parser.add_argument("--small-talk-rate", type=float, default=0.05, help="Share of new chat requests that are greetings")
+    parser.add_argument("--timeout", type=float, default=60, help="Client timeout per request in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Client-side cap on concurrent requests")
+    parser.add_argument("--chatbot-ids", type=lambda value: [int(i) for i in value.split(",")], default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--slo", type=parse_slo, action="append", default=[], help="endpoint:metric=value, e.g. chat:p99=8000")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Mock OpenAI-compatible server for load tests.
+
+Serves /v1/embeddings and /v1/chat/completions (including ``stream=true``)
+with deterministic content from the local provider, a log-normal latency
+distribution and optional error injection. Point the backend at it with
+OPENAI_BASE_URL=http://localhost:8100/v1.
+
+    python -m loadtest.mock_openai --port 8100 --latency-p50-ms 400 --latency-p99-ms 2500 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import random
+import struct
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.services.providers import LocalProvider
+
+# z-score of the 99th percentile of a standard normal distribution
+Z_99 = 2.326
+
+# Dimensions of the OpenAI embedding models when no ``dimensions`` argument is sent
+MODEL_DIMENSIONS = {"text-embedding-3-large": 3072}
+DEFAULT_DIMENSIONS = 1536
+
+@dataclass
+class MockConfig:
+    latency_p50_ms: float = 400
+    latency_p99_ms: float = 2500
+    embedding_latency_p50_ms: float = 40
+    embedding_latency_p99_ms: float = 250
+    tokens_per_second: float = 60
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    hang_rate: float = 0.0
+    hang_seconds: float = 120
+    seed: Optional[int] = None
+
+class LatencyModel:
+    """Log-normal latency fitted to a median and a 99th percentile"""
+    
+    def __init__(self, p50_ms: float, p99_ms: float, rng: random.Random):
+        self.mu = math.log(max(p50_ms, 0.001) / 1000)
+        self.sigma = max(math.log(max(p99_ms, p50_ms) / max(p50_ms, 0.001)), 0.0) / Z_99
+        self.rng = rng
+    
+    def sample(self) -> float:
+        return self.rng.lognormvariate(self.mu, self.sigma) if self.sigma else math.exp(self.mu)
+
+def error_response(status_code: int, message: str, error_type: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type, "param": None, "code": None}},
+        headers=headers
+    )
+
+def encode_embedding(embedding: List[float], encoding_format: str) -> Any:
+    if encoding_format == "base64":
+        # The OpenAI SDK asks for little-endian float32 in base64 unless told otherwise
+        return base64.b64encode(struct.pack(f"<{len(embedding)}f", *embedding)).decode("ascii")
+    return embedding
+
+def create_app(config: MockConfig) -> FastAPI:
+    rng = random.Random(config.seed)
+    completion_latency = LatencyModel(config.latency_p50_ms, config.latency_p99_ms, rng)
+    embedding_latency = LatencyModel(config.embedding_latency_p50_ms, config.embedding_latency_p99_ms, rng)
+    provider = LocalProvider()
+    stats: Dict[str, int] = {"embeddings": 0, "completions": 0, "streams": 0, "errors": 0, "rate_limited": 0, "hangs": 0}
+    app = FastAPI(title="Mock OpenAI API")
+    
+    async def inject_failure() -> Optional[JSONResponse]:
+        """Roll for an injected error, 429 or hang; returns the response to send, if any"""
+        roll = rng.random()
+        if roll < config.error_rate:
+            stats["errors"] += 1
+            return error_response(500, "Injected server error", "server_error")
+        roll -= config.error_rate
+        if roll < config.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return error_response(429, "Injected rate limit", "rate_limit_exceeded", {"Retry-After": "1"})
+        roll -= config.rate_limit_rate
+        if roll < config.hang_rate:
+            stats["hangs"] += 1
+            await asyncio.sleep(config.hang_seconds)
+            return error_response(504, "Injected timeout", "timeout")
+        return None
+    
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        stats["embeddings"] += 1
+        failure = await inject_failure()
+        if failure is not None:
+            return failure
+        
+        texts = body.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        model = body.get("model", "text-embedding-ada-002")
+        dimensions = int(body.get("dimensions") or MODEL_DIMENSIONS.get(model, DEFAULT_DIMENSIONS))
+        await asyncio.sleep(embedding_latency.sample())
+        
+        encoding_format = body.get("encoding_format", "float")
+        tokens = sum(len(str(text).split()) for text in texts)
+        return {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": encode_embedding(provider.embed_text(str(text), dimensions), encoding_format)}
+                for i, text in enumerate(texts)
+            ],
+            "model": model,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["completions"] += 1
+        failure = await inject_failure()
+        if failure is not None:
+            return failure
+        
+        model = body.get("model", "gpt-4o")
+        content, usage = await provider.complete(body.get("messages", []), body.get("temperature", 0.7), body.get("max_tokens") or 1500)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        # Time to first token, then a steady token rate
+        token_delay = 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        await asyncio.sleep(completion_latency.sample())
+        
+        if body.get("stream"):
+            stats["streams"] += 1
+            
+            async def events() -> AsyncIterator[str]:
+                def chunk(delta: Dict[str, str], finish_reason: Optional[str] = None) -> str:
+                    payload = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                    }
+                    return f"data: {json.dumps(payload)}\n\n"
+                
+                yield chunk({"role": "assistant", "content": ""})
+                for i, word in enumerate(content.split(" ")):
+                    yield chunk({"content": word if i == 0 else f" {word}"})
+                    await asyncio.sleep(token_delay)
+                yield chunk({}, "stop")
+                yield "data: [DONE]\n\n"
+            
+            return StreamingResponse(events(), media_type="text/event-stream")
+        
+        await asyncio.sleep(token_delay * usage["completion_tokens"])
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {**usage, "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"]}
+        }
+    
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+    
+    return app
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-p50-ms", type=float, default=MockConfig.latency_p50_ms, help="Median time to first token")
+    parser.add_argument("--latency-p99-ms", type=float, default=MockConfig.latency_p99_ms, help="99th percentile time to first token")
+    parser.add_argument("--embedding-latency-p50-ms", type=float, default=MockConfig.embedding_latency_p50_ms)
+    parser.add_argument("--embedding-latency-p99-ms", type=float, default=MockConfig.embedding_latency_p99_ms)
+    parser.add_argument("--tokens-per-second", type=float, default=MockConfig.tokens_per_second, help="Generation speed after the first token (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that stall for --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=MockConfig.hang_seconds)
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible latencies and failures")
+    args = parser.parse_args()
+    
+    import uvicorn
+    config = MockConfig(
+        latency_p50_ms=args.latency_p50_ms,
+        latency_p99_ms=args.latency_p99_ms,
+        embedding_latency_p50_ms=args.embedding_latency_p50_ms,
+        embedding_latency_p99_ms=args.embedding_latency_p99_ms,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
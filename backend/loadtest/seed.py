@@ -0,0 +1,72 @@
+"""Seed a running backend with load-test chatbots and documents through the public API.
+
+Chatbots are named ``loadtest-<n>``; existing ones are reused and only get
+documents when they have none, so seeding is safe to repeat.
+
+    python -m loadtest.seed --api http://localhost:8000 --chatbots 4 --documents 25
+"""
+import argparse
+import asyncio
+from typing import Dict, List
+import httpx
+from . import corpus
+
+CHATBOT_PREFIX = "loadtest-"
+SYSTEM_PROMPT = "You are a support assistant for a load test. Answer from the provided context."
+
+async def seed(api: str, chatbots: int, documents: int, seed: int, concurrency: int = 4) -> List[int]:
+    """Create the chatbots and upload ``documents`` articles to each; returns the chatbot ids"""
+    async with httpx.AsyncClient(base_url=api, timeout=300) as client:
+        response = await client.get("/chatbots/", params={"include_inactive": True})
+        response.raise_for_status()
+        existing: Dict[str, int] = {bot["name"]: bot["id"] for bot in response.json()}
+        
+        chatbot_ids = []
+        for index in range(chatbots):
+            name = f"{CHATBOT_PREFIX}{index}"
+            if name in existing:
+                chatbot_ids.append(existing[name])
+                continue
+            response = await client.post("/chatbots/", json={
+                "name": name,
+                "description": "Created by loadtest.seed",
+                "system_prompt": SYSTEM_PROMPT
+            })
+            response.raise_for_status()
+            chatbot_ids.append(response.json()["id"])
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def upload(chatbot_id: int, filename: str, text: str) -> None:
+            async with semaphore:
+                response = await client.post(
+                    "/documents/upload",
+                    data={"chatbot_id": str(chatbot_id)},
+                    files={"file": (filename, text.encode("utf-8"), "text/plain")}
+                )
+                response.raise_for_status()
+        
+        uploads = []
+        for offset, chatbot_id in enumerate(chatbot_ids):
+            response = await client.get("/documents/", params={"chatbot_id": chatbot_id})
+            response.raise_for_status()
+            if response.json():
+                continue
+            for filename, text in corpus.documents(seed + offset, documents):
+                uploads.append(upload(chatbot_id, filename, text))
+        await asyncio.gather(*uploads)
+        print(f"Seeded chatbots {chatbot_ids} ({len(uploads)} documents uploaded)")
+        return chatbot_ids
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--api", default="http://localhost:8000")
+    parser.add_argument("--chatbots", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=25, help="Documents per chatbot")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel uploads")
+    args = parser.parse_args()
+    asyncio.run(seed(args.api, args.chatbots, args.documents, args.seed, args.concurrency))
+
+if __name__ == "__main__":
+    main()
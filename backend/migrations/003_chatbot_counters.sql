@@ -0,0 +1,45 @@
+-- Migration: Materialized per-chatbot statistics
+-- Keeps document, chunk, session and message counts per chatbot so stats pages
+-- no longer have to walk every document chunk
+
+-- Cache the number of chunks on each document
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS chunk_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE documents d
+SET chunk_count = sub.chunk_count
+FROM (
+    SELECT document_id, COUNT(*) AS chunk_count
+    FROM document_chunks
+    GROUP BY document_id
+) sub
+WHERE d.id = sub.document_id;
+
+-- Create the counters table (one row per chatbot)
+CREATE TABLE IF NOT EXISTS chatbot_counters (
+    chatbot_id INTEGER PRIMARY KEY REFERENCES chatbots(id) ON DELETE CASCADE,
+    document_count INTEGER NOT NULL DEFAULT 0,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    session_count INTEGER NOT NULL DEFAULT 0,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Backfill counters from existing data
+INSERT INTO chatbot_counters (chatbot_id, document_count, chunk_count, session_count, message_count)
+SELECT
+    c.id,
+    (SELECT COUNT(*) FROM chatbot_documents cd WHERE cd.chatbot_id = c.id),
+    (SELECT COALESCE(SUM(d.chunk_count), 0)
+     FROM chatbot_documents cd JOIN documents d ON d.id = cd.document_id
+     WHERE cd.chatbot_id = c.id),
+    (SELECT COUNT(*) FROM chat_sessions cs WHERE cs.chatbot_id = c.id),
+    (SELECT COUNT(*) FROM chat_messages cm
+     JOIN chat_sessions cs ON cs.session_id = cm.session_id
+     WHERE cs.chatbot_id = c.id)
+FROM chatbots c
+ON CONFLICT (chatbot_id) DO UPDATE SET
+    document_count = EXCLUDED.document_count,
+    chunk_count = EXCLUDED.chunk_count,
+    session_count = EXCLUDED.session_count,
+    message_count = EXCLUDED.message_count,
+    updated_at = CURRENT_TIMESTAMP;
@@ -0,0 +1,70 @@
+-- Migration: Precomputed analytics rollups for the admin dashboard
+-- Adds hourly and daily usage buckets per chatbot and per-document size columns
+-- so dashboard and analytics endpoints no longer scan messages or chunk text
+
+-- Cache document and chunk sizes computed at ingest time
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_length INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS total_chunk_length BIGINT NOT NULL DEFAULT 0;
+
+UPDATE documents SET content_length = LENGTH(content);
+
+UPDATE documents d
+SET total_chunk_length = sub.total_chunk_length
+FROM (
+    SELECT document_id, SUM(LENGTH(chunk_text)) AS total_chunk_length
+    FROM document_chunks
+    GROUP BY document_id
+) sub
+WHERE d.id = sub.document_id;
+
+-- Create the rollup table
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    id SERIAL PRIMARY KEY,
+    granularity VARCHAR(10) NOT NULL CHECK (granularity IN ('hour', 'day')),
+    bucket_start TIMESTAMP NOT NULL,
+    chatbot_id INTEGER NOT NULL REFERENCES chatbots(id) ON DELETE CASCADE,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    session_count INTEGER NOT NULL DEFAULT 0,
+    context_hit_count INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    CONSTRAINT uq_usage_rollups_bucket UNIQUE (granularity, bucket_start, chatbot_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_usage_rollups_bucket_start ON usage_rollups(bucket_start);
+CREATE INDEX IF NOT EXISTS idx_usage_rollups_chatbot_id ON usage_rollups(chatbot_id);
+
+-- Backfill from existing history (token usage was not recorded before this migration)
+DO $$
+DECLARE
+    bucket_granularity TEXT;
+BEGIN
+    FOREACH bucket_granularity IN ARRAY ARRAY['hour', 'day'] LOOP
+        INSERT INTO usage_rollups (granularity, bucket_start, chatbot_id, message_count, context_hit_count)
+        SELECT
+            bucket_granularity,
+            date_trunc(bucket_granularity, cm.created_at),
+            cs.chatbot_id,
+            COUNT(*),
+            COUNT(*) FILTER (WHERE COALESCE(array_length(cm.context_chunks, 1), 0) > 0)
+        FROM chat_messages cm
+        JOIN chat_sessions cs ON cs.session_id = cm.session_id
+        WHERE cs.chatbot_id IS NOT NULL
+        GROUP BY 2, 3
+        ON CONFLICT (granularity, bucket_start, chatbot_id) DO UPDATE SET
+            message_count = EXCLUDED.message_count,
+            context_hit_count = EXCLUDED.context_hit_count;
+
+        INSERT INTO usage_rollups (granularity, bucket_start, chatbot_id, session_count)
+        SELECT
+            bucket_granularity,
+            date_trunc(bucket_granularity, cs.created_at),
+            cs.chatbot_id,
+            COUNT(*)
+        FROM chat_sessions cs
+        WHERE cs.chatbot_id IS NOT NULL
+        GROUP BY 2, 3
+        ON CONFLICT (granularity, bucket_start, chatbot_id) DO UPDATE SET
+            session_count = EXCLUDED.session_count;
+    END LOOP;
+END $$;
@@ -0,0 +1,7 @@
+-- Migration: Index admin session expiry
+-- Lets the background sweeper delete expired admin sessions in small batches
+
+CREATE INDEX IF NOT EXISTS ix_admin_sessions_expires_at ON admin_sessions(expires_at);
+
+-- Remove sessions that have already expired or been logged out
+DELETE FROM admin_sessions WHERE expires_at < CURRENT_TIMESTAMP OR is_active = false;
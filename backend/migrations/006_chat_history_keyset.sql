@@ -0,0 +1,20 @@
+-- Migration: Keyset-paginated chat history
+-- Adds a per-session message counter and an index matching the history query
+-- (session_id, created_at DESC, id DESC) so every page is an index range scan.
+-- Message bodies are not included in the index: large TEXT values can exceed
+-- the btree tuple size limit.
+
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_created
+ON chat_messages(session_id, created_at, id);
+
+-- Backfill message counts
+UPDATE chat_sessions cs
+SET message_count = sub.message_count
+FROM (
+    SELECT session_id, COUNT(*) AS message_count
+    FROM chat_messages
+    GROUP BY session_id
+) sub
+WHERE cs.session_id = sub.session_id;
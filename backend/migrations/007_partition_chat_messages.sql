@@ -0,0 +1,62 @@
+-- Migration: Monthly range partitioning of chat_messages
+-- Rebuilds chat_messages as a table partitioned by created_at so old months can
+-- be archived to Parquet and dropped (see ArchiveService). The primary key
+-- becomes (id, created_at) because the partition key must be part of it.
+-- Take a backup first: existing rows are copied into the new table.
+
+-- Move the existing table out of the way, keeping its id sequence
+ALTER TABLE chat_messages RENAME TO chat_messages_legacy;
+ALTER TABLE chat_messages_legacy RENAME CONSTRAINT chat_messages_pkey TO chat_messages_legacy_pkey;
+ALTER TABLE chat_messages_legacy DROP CONSTRAINT IF EXISTS chat_messages_session_id_fkey;
+ALTER SEQUENCE chat_messages_id_seq OWNED BY NONE;
+DROP INDEX IF EXISTS idx_chat_messages_session_created;
+DROP INDEX IF EXISTS ix_chat_messages_id;
+
+CREATE TABLE chat_messages (
+    id INTEGER NOT NULL DEFAULT nextval('chat_messages_id_seq'),
+    session_id VARCHAR(255) REFERENCES chat_sessions(session_id) ON DELETE CASCADE,
+    message TEXT NOT NULL,
+    response TEXT NOT NULL,
+    context_chunks TEXT[], -- Array of chunk IDs used for context
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE chat_messages_id_seq OWNED BY chat_messages.id;
+
+-- Create one partition per month of existing data plus the next three months
+DO $$
+DECLARE
+    first_month DATE;
+    last_month DATE := date_trunc('month', CURRENT_DATE + INTERVAL '3 months')::date;
+    partition_month DATE;
+BEGIN
+    SELECT COALESCE(date_trunc('month', MIN(created_at))::date, date_trunc('month', CURRENT_DATE)::date)
+    INTO first_month
+    FROM chat_messages_legacy;
+
+    partition_month := first_month;
+    WHILE partition_month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF chat_messages FOR VALUES FROM (%L) TO (%L)',
+            'chat_messages_y' || to_char(partition_month, 'YYYY') || 'm' || to_char(partition_month, 'MM'),
+            partition_month,
+            (partition_month + INTERVAL '1 month')::date
+        );
+        partition_month := (partition_month + INTERVAL '1 month')::date;
+    END LOOP;
+END $$;
+
+-- Catch-all for rows outside the pre-created months
+CREATE TABLE IF NOT EXISTS chat_messages_default PARTITION OF chat_messages DEFAULT;
+
+-- Copy existing messages into their partitions
+INSERT INTO chat_messages (id, session_id, message, response, context_chunks, created_at)
+SELECT id, session_id, message, response, context_chunks, COALESCE(created_at, CURRENT_TIMESTAMP)
+FROM chat_messages_legacy;
+
+DROP TABLE chat_messages_legacy;
+
+-- Recreate the history index on the partitioned table
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_created
+ON chat_messages(session_id, created_at, id);
@@ -0,0 +1,12 @@
+-- Migration: Soft delete for documents and chatbots
+-- Deletes only set deleted_at; chunks, sessions and messages are purged in batches afterwards
+
+ALTER TABLE chatbots ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+
+-- Small partial indexes for the purge job to find pending deletes
+CREATE INDEX IF NOT EXISTS ix_chatbots_deleted_at ON chatbots(deleted_at) WHERE deleted_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_documents_deleted_at ON documents(deleted_at) WHERE deleted_at IS NOT NULL;
+
+-- Batched chunk deletes look chunks up by document
+CREATE INDEX IF NOT EXISTS ix_document_chunks_document_id ON document_chunks(document_id);
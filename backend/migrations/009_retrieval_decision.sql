@@ -0,0 +1,4 @@
+-- Migration: Record the retrieval planner decision per chat message
+-- NULL for messages written before the planner existed (they always searched)
+
+ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS retrieval_decision VARCHAR(32);
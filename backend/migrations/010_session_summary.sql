@@ -0,0 +1,6 @@
+-- Migration: Rolling conversation summaries
+-- Turns older than the verbatim memory window are folded into chat_sessions.summary
+
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary_message_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary_through TIMESTAMP;
@@ -0,0 +1,3 @@
+-- Migration: Flag chat messages answered with a fallback after the request deadline
+
+ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS degraded BOOLEAN NOT NULL DEFAULT false;
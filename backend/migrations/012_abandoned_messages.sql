@@ -0,0 +1,4 @@
+-- Migration: Flag chat turns abandoned because the client disconnected
+-- Abandoned turns are kept for auditing but excluded from history and counters
+
+ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS abandoned BOOLEAN NOT NULL DEFAULT false;
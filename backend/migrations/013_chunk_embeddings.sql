@@ -0,0 +1,15 @@
+-- Migration: Per-chatbot embedding spaces
+-- Chunks keep their default-space embedding in document_chunks.embedding; chatbots
+-- configured with another embedding model/dimension read vectors from here.
+-- Vectors of different dimensions share the column, so searches are exact scans
+-- filtered by space and chatbot.
+
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    chunk_id INTEGER NOT NULL REFERENCES document_chunks(id) ON DELETE CASCADE,
+    space VARCHAR(255) NOT NULL,
+    embedding vector NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (chunk_id, space)
+);
+
+CREATE INDEX IF NOT EXISTS ix_chunk_embeddings_space ON chunk_embeddings(space);
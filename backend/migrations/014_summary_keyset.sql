@@ -0,0 +1,5 @@
+-- Migration: Keyset boundary for rolling summaries
+-- summary_through alone skipped turns sharing its timestamp; the summary now
+-- records the (created_at, id) of the last turn folded in.
+
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary_through_id INTEGER;
@@ -0,0 +1,4 @@
+import os
+
+# Services build their provider clients at import time; tests never reach the network
+os.environ.setdefault("OPENAI_API_KEY", "test")
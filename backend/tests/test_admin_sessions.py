@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models import AdminSession
+from app.services import admin_service
+from app.services.admin_service import AdminService, SessionTokenCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admin_service.time, "monotonic", clock)
+    return clock
+
+@pytest.fixture
+def cache():
+    cache = SessionTokenCache()
+    cache.ttl_seconds = 60
+    cache.max_entries = 3
+    return cache
+
+def test_cached_token_expires_with_the_cache_ttl(cache, clock):
+    cache.put("token", datetime.utcnow() + timedelta(hours=1))
+    assert cache.is_valid("token")
+    clock.now += 59
+    assert cache.is_valid("token")
+    clock.now += 1
+    assert not cache.is_valid("token")
+
+def test_cached_token_expires_with_the_session(cache, clock):
+    cache.put("token", datetime.utcnow() + timedelta(seconds=10))
+    clock.now += 11
+    assert not cache.is_valid("token")
+
+def test_expired_session_is_not_cached(cache):
+    cache.put("token", datetime.utcnow() - timedelta(seconds=1))
+    assert not cache.is_valid("token")
+
+def test_invalidation(cache):
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    cache.put("one", expires_at)
+    cache.put("two", expires_at)
+    
+    cache.invalidate("one")
+    # Other workers receive the digest, never the token itself
+    cache.invalidate_hash(SessionTokenCache.token_hash("two"))
+    assert not cache.is_valid("one")
+    assert not cache.is_valid("two")
+
+def test_oldest_tokens_are_evicted_when_full(cache):
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    for token in ("one", "two", "three", "four"):
+        cache.put(token, expires_at)
+    assert not cache.is_valid("one")
+    assert all(cache.is_valid(token) for token in ("two", "three", "four"))
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://")
+    AdminSession.__table__.create(engine)
+    monkeypatch.setattr(admin_service, "session_token_cache", SessionTokenCache())
+    monkeypatch.setattr(admin_service.config_cache, "notify", lambda db, payload: None)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def add_session(db, token: str, expires_in: timedelta, is_active: bool = True):
+    db.add(AdminSession(session_token=token, expires_at=datetime.utcnow() + expires_in, is_active=is_active))
+    db.commit()
+
+def test_validated_token_is_served_from_the_cache(db):
+    service = AdminService()
+    add_session(db, "token", timedelta(hours=1))
+    assert service.validate_session("token", db)
+    
+    db.query(AdminSession).delete()
+    db.commit()
+    assert service.validate_session("token", db)
+    assert not service.validate_session("unknown", db)
+
+def test_logout_invalidates_the_cached_token(db):
+    service = AdminService()
+    add_session(db, "token", timedelta(hours=1))
+    assert service.validate_session("token", db)
+    
+    assert service.invalidate_session("token", db)
+    assert not service.validate_session("token", db)
+
+def test_cleanup_deletes_expired_and_logged_out_sessions_in_batches(db):
+    for number in range(5):
+        add_session(db, f"expired-{number}", -timedelta(minutes=1))
+    add_session(db, "logged-out", timedelta(hours=1), is_active=False)
+    add_session(db, "live", timedelta(hours=1))
+    
+    assert AdminService().cleanup_expired_sessions(db, batch_size=2) == 6
+    assert [session.session_token for session in db.query(AdminSession).all()] == ["live"]
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from app.services.admission import AdmissionController, AdmissionRejected
+from app.services.config_cache import ChatbotConfig
+
+def chatbot(chatbot_id: int, **settings) -> ChatbotConfig:
+    return ChatbotConfig(id=chatbot_id, name=f"bot-{chatbot_id}", system_prompt="", is_active=True, settings=settings)
+
+@pytest.fixture
+def controller():
+    controller = AdmissionController()
+    controller.max_in_flight = 1
+    controller.max_queued = 10
+    controller.queue_timeout = 1
+    controller.default_rate_per_minute = 0
+    return controller
+
+async def hold_slot(controller, bot, held: asyncio.Event, release: asyncio.Event):
+    async with controller.slot(bot):
+        held.set()
+        await release.wait()
+
+def test_waiters_are_served_fairly_across_chatbots(controller):
+    busy, quiet = chatbot(1), chatbot(2)
+    order = []
+    
+    async def request(bot):
+        async with controller.slot(bot):
+            order.append(bot.id)
+            await asyncio.sleep(0)
+    
+    async def main():
+        held, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.ensure_future(hold_slot(controller, busy, held, release))
+        await held.wait()
+        waiters = [asyncio.ensure_future(request(busy)) for _ in range(3)]
+        await asyncio.sleep(0)
+        waiters.append(asyncio.ensure_future(request(quiet)))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *waiters)
+    
+    asyncio.run(main())
+    # The quiet chatbot does not wait behind the busy chatbot's whole backlog
+    assert order.index(2) < 2
+    assert controller.in_flight == 0 and controller.queued == 0
+
+def test_full_queue_is_rejected(controller):
+    controller.max_queued = 0
+    
+    async def main():
+        held, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.ensure_future(hold_slot(controller, chatbot(1), held, release))
+        await held.wait()
+        try:
+            async with controller.slot(chatbot(2)):
+                pass
+        finally:
+            release.set()
+            await holder
+    
+    with pytest.raises(AdmissionRejected) as error:
+        asyncio.run(main())
+    assert error.value.status_code == 503
+
+def wait_for_slot(controller, timeout=None):
+    async def main():
+        held, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.ensure_future(hold_slot(controller, chatbot(1), held, release))
+        await held.wait()
+        try:
+            async with controller.slot(chatbot(2), timeout=timeout):
+                pass
+        finally:
+            release.set()
+            await holder
+            assert controller.in_flight == 0 and controller.queued == 0
+    
+    asyncio.run(main())
+
+def test_queue_timeout_is_rejected(controller):
+    controller.queue_timeout = 0.02
+    with pytest.raises(AdmissionRejected) as error:
+        wait_for_slot(controller)
+    assert error.value.status_code == 503
+
+def test_queue_timeout_shorter_than_deadline_is_rejected(controller):
+    controller.queue_timeout = 0.02
+    with pytest.raises(AdmissionRejected):
+        wait_for_slot(controller, timeout=5)
+
+def test_rate_limit_uses_chatbot_settings(controller):
+    bot = chatbot(1, rate_limit_per_minute=60, rate_limit_burst=2)
+    controller.check_rate(bot)
+    controller.check_rate(bot)
+    with pytest.raises(AdmissionRejected) as error:
+        controller.check_rate(bot)
+    assert error.value.status_code == 429
+    assert error.value.retry_after >= 1
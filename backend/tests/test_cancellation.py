@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from app.services import chat_service as chat_module
+from app.services.chat_service import ChatService
+from app.services.config_cache import ChatbotConfig
+
+class FakeQuery:
+    def filter(self, *criteria):
+        return self
+    
+    def first(self):
+        return None
+
+class FakeSession:
+    def __init__(self):
+        self.rollbacks = 0
+    
+    def query(self, *entities):
+        return FakeQuery()
+    
+    def rollback(self):
+        self.rollbacks += 1
+    
+    def close(self):
+        pass
+
+@pytest.fixture
+def chat_service(monkeypatch):
+    chatbot = ChatbotConfig(id=1, name="bot", system_prompt="", is_active=True)
+    monkeypatch.setattr(chat_module.config_cache, "get_chatbot", lambda db, chatbot_id: chatbot)
+    service = ChatService(None, None)
+    service.saved = []
+    
+    async def ensure_session(session_id, chatbot_id, db):
+        pass
+    
+    async def save_message(record, db):
+        service.saved.append(record)
+    
+    service.ensure_session = ensure_session
+    service.save_message = save_message
+    service.get_retrieval_settings = lambda chatbot, db: (0.7, 5)
+    service.get_chat_history = lambda session_id, db, limit: []
+    return service
+
+def cancel_while_answering(service, db):
+    async def main():
+        started = asyncio.Event()
+        
+        async def answer(*args):
+            started.set()
+            await asyncio.sleep(1)
+        
+        service.answer = answer
+        request = asyncio.ensure_future(service.generate_response("hello", "s1", 1, db))
+        await started.wait()
+        request.cancel()
+        await request
+    
+    asyncio.run(main())
+
+@pytest.mark.parametrize("coalesce", [True, False])
+def test_disconnect_records_an_abandoned_turn(chat_service, monkeypatch, coalesce):
+    chat_service.coalesce_requests = coalesce
+    monkeypatch.setattr(chat_module, "SessionLocal", FakeSession)
+    
+    with pytest.raises(asyncio.CancelledError):
+        cancel_while_answering(chat_service, FakeSession())
+    
+    [record] = chat_service.saved
+    assert record["abandoned"]
+    assert record["response"] == ""
+    assert chat_module.admission_controller.in_flight == 0
+
+def test_failed_abandoned_save_does_not_mask_the_cancellation(chat_service):
+    async def save_message(record, db):
+        raise ConnectionError("database unreachable")
+    
+    chat_service.save_message = save_message
+    chat_service.coalesce_requests = False
+    db = FakeSession()
+    
+    with pytest.raises(asyncio.CancelledError):
+        cancel_while_answering(chat_service, db)
+    assert db.rollbacks == 1
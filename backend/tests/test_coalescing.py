@@ -0,0 +1,119 @@
+import asyncio
+import numpy as np
+import pytest
+from app.services.chat_service import ChatService
+from app.services.config_cache import ChatbotConfig
+from app.services.singleflight import SingleFlight
+from app.services.working_set import session_working_sets
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    runs = []
+    
+    async def answer():
+        runs.append(None)
+        await asyncio.sleep(0.01)
+        return "answer"
+    
+    async def main():
+        return await asyncio.gather(*(flight.do("key", answer) for _ in range(3)))
+    
+    results = asyncio.run(main())
+    assert len(runs) == 1
+    assert [result for result, _ in results] == ["answer"] * 3
+    assert [shared for _, shared in results] == [False, True, True]
+    assert flight.in_flight == 0
+
+def test_results_are_not_cached():
+    flight = SingleFlight()
+    
+    async def answer():
+        return "answer"
+    
+    async def main():
+        first = await flight.do("key", answer)
+        second = await flight.do("key", answer)
+        return first, second
+    
+    assert asyncio.run(main()) == (("answer", False), ("answer", False))
+
+def test_exception_reaches_every_caller():
+    flight = SingleFlight()
+    
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("provider error")
+    
+    async def main():
+        return await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+    
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_one_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+    
+    async def answer():
+        await asyncio.sleep(0.05)
+        return "answer"
+    
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", answer))
+        second = asyncio.ensure_future(flight.do("key", answer))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+    
+    assert asyncio.run(main()) == ("answer", True)
+
+def test_work_is_cancelled_once_every_caller_is_gone():
+    flight = SingleFlight()
+    cancelled = []
+    
+    async def answer():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(None)
+            raise
+    
+    async def main():
+        callers = [asyncio.ensure_future(flight.do("key", answer)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+    
+    asyncio.run(main())
+    assert cancelled
+    assert flight.in_flight == 0
+
+@pytest.fixture
+def chat_service():
+    service = ChatService(None, None)
+    service.coalesce_requests = True
+    return service
+
+@pytest.fixture
+def chatbot():
+    return ChatbotConfig(id=1, name="bot", system_prompt="", is_active=True)
+
+def test_fresh_session_can_coalesce(chat_service, chatbot):
+    assert chat_service.can_coalesce("fresh", chatbot, [])
+
+def test_session_with_memory_is_not_coalesced(chat_service, chatbot):
+    assert not chat_service.can_coalesce("fresh", chatbot, [{"role": "user", "content": "earlier"}])
+
+def test_session_with_working_set_is_not_coalesced(chat_service, chatbot):
+    session_working_sets.put("returning", chatbot, np.ones(3, dtype=np.float32), [])
+    try:
+        assert not chat_service.can_coalesce("returning", chatbot, [])
+    finally:
+        session_working_sets.invalidate("returning")
+
+def test_coalescing_can_be_disabled(chat_service, chatbot):
+    chat_service.coalesce_requests = False
+    assert not chat_service.can_coalesce("fresh", chatbot, [])
@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from app.services.admission import AdmissionController
+from app.services.chat_service import ChatService
+from app.services.config_cache import ChatbotConfig
+from app.services.deadline import Deadline, DeadlineExceeded
+
+def chatbot(chatbot_id: int) -> ChatbotConfig:
+    return ChatbotConfig(id=chatbot_id, name=f"bot-{chatbot_id}", system_prompt="", is_active=True)
+
+def test_deadline_running_out_in_the_queue_raises_deadline_exceeded():
+    controller = AdmissionController()
+    controller.max_in_flight = 1
+    controller.queue_timeout = 1
+    
+    async def main():
+        async with controller.slot(chatbot(1)):
+            async with controller.slot(chatbot(2), timeout=0.02):
+                pass
+    
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+    assert controller.in_flight == 0 and controller.queued == 0
+
+def test_deadline_run_cancels_on_expiry():
+    cancelled = []
+    
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(None)
+            raise
+    
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(Deadline(0.02).run(slow()))
+    assert cancelled
+
+def test_deadline_run_refuses_when_budget_is_reserved():
+    async def main():
+        return await Deadline(0.05).run(asyncio.sleep(0, "done"), reserve=0.1)
+    
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+    assert asyncio.run(Deadline(1).run(asyncio.sleep(0, "done"))) == "done"
+
+def test_deadline_fallback_is_a_degraded_answer():
+    result = ChatService(None, None).deadline_fallback(chatbot(1), "hello")
+    assert result["degraded"]
+    assert result["response"]
+    assert result["usage"] == {"prompt_tokens": 0, "completion_tokens": 0}
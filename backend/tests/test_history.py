@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from sqlalchemy.sql.elements import Tuple
+from app.services import chat_service as chat_module
+from app.services.chat_service import ChatService, PENDING_MESSAGE_ID
+from app.services.write_behind import ChatWriteBuffer
+
+START = datetime(2024, 5, 1, 12, 0)
+
+class FakeQuery:
+    """Applies the keyset condition, ordering and limit of the history query to in-memory rows"""
+    
+    def __init__(self, rows):
+        self.rows = list(rows)
+    
+    def filter(self, *criteria):
+        for criterion in criteria:
+            if isinstance(getattr(criterion, "left", None), Tuple):
+                position = tuple(param.value for param in criterion.right.clauses)
+                self.rows = [row for row in self.rows if (row.created_at, row.id) < position]
+        return self
+    
+    def order_by(self, *columns):
+        self.rows.sort(key=lambda row: (row.created_at, row.id), reverse=True)
+        return self
+    
+    def limit(self, count):
+        self.rows = self.rows[:count]
+        return self
+    
+    def all(self):
+        return self.rows
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+    
+    def query(self, *entities):
+        return FakeQuery(self.rows)
+
+def row(number: int, created_at: datetime = None):
+    return SimpleNamespace(
+        id=number,
+        created_at=created_at or START + timedelta(minutes=number),
+        message=f"message {number}",
+        response=f"response {number}",
+        context_chunks=[]
+    )
+
+def pending(text: str, created_at: datetime):
+    return {
+        "session_id": "s1",
+        "chatbot_id": 1,
+        "message": text,
+        "response": "hi",
+        "context_chunks": ["7"],
+        "retrieval_decision": None,
+        "degraded": False,
+        "abandoned": False,
+        "created_at": created_at
+    }
+
+@pytest.fixture
+def chat_service():
+    return ChatService(None, None)
+
+@pytest.fixture
+def buffer(monkeypatch):
+    buffer = ChatWriteBuffer()
+    monkeypatch.setattr(chat_module, "chat_write_buffer", buffer)
+    return buffer
+
+def test_cursor_round_trip(chat_service):
+    cursor = chat_service.encode_history_cursor(START, 42)
+    assert chat_service.decode_history_cursor(cursor) == (START, 42)
+    cursor = chat_service.encode_history_cursor(START, None)
+    assert chat_service.decode_history_cursor(cursor) == (START, PENDING_MESSAGE_ID)
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "bm8tc2VwYXJhdG9y", "MjAyNC0wNS0wMXxhYmM="])
+def test_bad_cursors_are_rejected(chat_service, cursor):
+    with pytest.raises(ValueError):
+        chat_service.decode_history_cursor(cursor)
+
+def test_pages_cover_every_message_once(chat_service, buffer):
+    db = FakeSession([row(number) for number in range(1, 8)])
+    seen = []
+    cursor = None
+    while True:
+        page = chat_service.get_chat_history_page("s1", db, limit=3, before=cursor)
+        # Each page is oldest first
+        ids = [message["id"] for message in page["history"]]
+        assert ids == sorted(ids)
+        seen = ids + seen
+        if not page["has_more"]:
+            assert page["next_cursor"] is None
+            break
+        cursor = page["next_cursor"]
+    assert seen == list(range(1, 8))
+
+def test_buffered_messages_come_after_committed_ones(chat_service, buffer):
+    db = FakeSession([row(1), row(2)])
+    buffer.add_message(pending("buffered", START + timedelta(minutes=2)))
+    
+    page = chat_service.get_chat_history_page("s1", db, limit=10)
+    assert [message["message"] for message in page["history"]] == ["message 1", "message 2", "buffered"]
+    assert page["history"][-1]["id"] is None
+    assert page["history"][-1]["context_used"]
+
+def test_paging_past_buffered_messages(chat_service, buffer):
+    db = FakeSession([row(1), row(2)])
+    buffer.add_message(pending("buffered", START + timedelta(minutes=3)))
+    
+    first = chat_service.get_chat_history_page("s1", db, limit=1)
+    assert [message["message"] for message in first["history"]] == ["buffered"]
+    second = chat_service.get_chat_history_page("s1", db, limit=5, before=first["next_cursor"])
+    assert [message["message"] for message in second["history"]] == ["message 1", "message 2"]
+
+def test_just_flushed_message_is_not_duplicated(chat_service, buffer):
+    flushed = row(3)
+    db = FakeSession([row(1), row(2), flushed])
+    buffer.add_message(pending(flushed.message, flushed.created_at))
+    
+    page = chat_service.get_chat_history_page("s1", db, limit=10)
+    assert [message["id"] for message in page["history"]] == [1, 2, 3]
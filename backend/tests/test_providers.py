@@ -0,0 +1,66 @@
+import asyncio
+import math
+import pytest
+from app.services.providers import LocalProvider, validate_provider_settings
+
+@pytest.fixture
+def provider():
+    return LocalProvider()
+
+def test_local_embeddings_are_deterministic(provider):
+    texts = ["How do I reset my password?", "Refunds take five days"]
+    first = asyncio.run(provider.embed(texts, "local", 64))
+    second = asyncio.run(LocalProvider().embed(texts, "local", 64))
+    assert first == second
+    assert first[0] != first[1]
+
+@pytest.mark.parametrize("dimensions", [8, 384, 1536])
+def test_local_embeddings_have_the_requested_dimension(provider, dimensions):
+    [vector] = asyncio.run(provider.embed(["reset my password"], "local", dimensions))
+    assert len(vector) == dimensions
+    assert math.isclose(sum(value * value for value in vector), 1.0, rel_tol=1e-6)
+
+def test_local_embeddings_place_related_texts_closer(provider):
+    query, related, unrelated = (
+        provider.embed_text(text, 256)
+        for text in ("reset my password", "how to reset a password", "shipping costs to canada")
+    )
+    similarity = lambda a, b: sum(x * y for x, y in zip(a, b))
+    assert similarity(query, related) > similarity(query, unrelated)
+
+def test_local_embedding_of_empty_text_is_a_unit_vector(provider):
+    # Cosine distance stays defined
+    assert provider.embed_text("", 16) == [1.0] + [0.0] * 15
+
+def test_local_completion_quotes_the_context(provider):
+    messages = [
+        {"role": "system", "content": "Be helpful.\n\nContext information:\nFrom faq.txt: Refunds take five days. Contact support.\n\nFrom other.txt: Unrelated."},
+        {"role": "user", "content": "How long do refunds take?"}
+    ]
+    response, usage = asyncio.run(provider.complete(messages, 0.7, 100))
+    assert response.startswith("According to **faq.txt**: Refunds take five days.")
+    assert usage["completion_tokens"] == len(response.split())
+
+@pytest.mark.parametrize("settings", [
+    None,
+    {},
+    {"embedding_provider": "local", "embedding_dimensions": 384},
+    {"embedding_provider": "local", "embedding_dimensions": "768"},
+    {"embedding_provider": "openai", "embedding_model": "text-embedding-3-small", "embedding_dimensions": 512},
+    {"embedding_provider": "openai", "embedding_model": "text-embedding-3-large", "embedding_dimensions": 3072},
+    {"embedding_provider": "openai", "embedding_model": "text-embedding-ada-002", "embedding_dimensions": 1536}
+])
+def test_valid_provider_settings(settings):
+    validate_provider_settings(settings)
+
+@pytest.mark.parametrize("settings", [
+    {"embedding_provider": "cohere"},
+    {"embedding_provider": "local", "embedding_dimensions": 0},
+    {"embedding_provider": "local", "embedding_dimensions": -3},
+    {"embedding_provider": "local", "embedding_dimensions": "many"},
+    {"embedding_provider": "openai", "embedding_model": "text-embedding-ada-002", "embedding_dimensions": 768},
+    {"embedding_provider": "openai", "embedding_model": "text-embedding-3-small", "embedding_dimensions": 3072}
+])
+def test_invalid_provider_settings(settings):
+    with pytest.raises(ValueError):
+        validate_provider_settings(settings)
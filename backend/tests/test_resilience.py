@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from prometheus_client import REGISTRY
+from app.services.resilience import CircuitOpenError, ProviderGuard
+
+def warmed_guard(latency: float = 0.01, name: str = "test") -> ProviderGuard:
+    guard = ProviderGuard(name)
+    guard.hedge_min_delay = 0.02
+    for _ in range(20):
+        guard.latency.record(latency)
+    return guard
+
+def attempts(*delays: float):
+    """Factory whose n-th call sleeps for ``delays[n]`` and returns n"""
+    calls = []
+    
+    async def factory():
+        number = len(calls)
+        calls.append(number)
+        await asyncio.sleep(delays[number])
+        return number
+    
+    return factory, calls
+
+def test_unhedged_calls_record_latency_until_warm():
+    guard = ProviderGuard("test")
+    factory, calls = attempts(0, 0)
+    
+    assert asyncio.run(guard.call(factory)) == 0
+    assert asyncio.run(guard.call(factory, hedge=False)) == 1
+    assert len(guard.latency._samples) == 1
+
+def test_hedge_wins_when_primary_is_slow():
+    guard = warmed_guard()
+    factory, calls = attempts(1.0, 0)
+    
+    assert asyncio.run(guard.call(factory)) == 1
+    assert guard.counters["hedges"] == 1
+    assert guard.counters["hedge_wins"] == 1
+
+def test_losing_primary_latency_is_recorded():
+    guard = warmed_guard()
+    factory, calls = attempts(1.0, 0)
+    
+    asyncio.run(guard.call(factory))
+    # The cancelled primary counts with at least the hedge delay, never the hedge's faster time
+    assert len(guard.latency._samples) == 21
+    assert guard.latency._samples[-1] >= 0.02
+
+def test_primary_failure_falls_back_to_hedge():
+    guard = warmed_guard()
+    calls = []
+    
+    async def factory():
+        calls.append(None)
+        if len(calls) == 1:
+            await asyncio.sleep(0.05)
+            raise ConnectionError("reset")
+        await asyncio.sleep(0.1)
+        return "hedge"
+    
+    assert asyncio.run(guard.call(factory)) == "hedge"
+    assert len(guard.latency._samples) == 20
+    
+    async def failing():
+        raise ConnectionError("reset")
+    
+    with pytest.raises(ConnectionError):
+        asyncio.run(guard.call(failing, hedge=False))
+    assert guard.counters["failures"] == 1
+
+def metric(name: str, provider: str):
+    return REGISTRY.get_sample_value(name, {"provider": provider}) or 0
+
+def test_hedges_are_exported():
+    guard = warmed_guard(name="hedge_metrics")
+    factory, calls = attempts(1.0, 0)
+    
+    asyncio.run(guard.call(factory))
+    assert metric("provider_hedges_total", "hedge_metrics") == 1
+    assert metric("provider_hedge_wins_total", "hedge_metrics") == 1
+
+def test_breaker_state_and_trips_are_exported():
+    guard = ProviderGuard("breaker_metrics")
+    guard.breaker.min_requests = 2
+    
+    async def failing():
+        raise ConnectionError("reset")
+    
+    assert metric("provider_circuit_state", "breaker_metrics") == 0
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            asyncio.run(guard.call(failing, hedge=False))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(guard.call(failing, hedge=False))
+    
+    assert metric("provider_circuit_state", "breaker_metrics") == 2
+    assert metric("provider_circuit_trips_total", "breaker_metrics") == 1
+    assert metric("provider_rejected_calls_total", "breaker_metrics") == 1
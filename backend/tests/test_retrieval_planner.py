@@ -0,0 +1,41 @@
+import pytest
+from app.services.config_cache import ChatbotConfig
+from app.services.retrieval_planner import (
+    RetrievalPlanner, RETRIEVAL_SEARCH, RETRIEVAL_SKIP_NO_DOCUMENTS, RETRIEVAL_SKIP_SMALL_TALK
+)
+
+@pytest.fixture
+def planner():
+    return RetrievalPlanner()
+
+@pytest.mark.parametrize("message", ["hi", "Hello there!", "thanks a lot", "thank you", "bye, have a good day"])
+def test_greetings_and_thanks_are_small_talk(planner, message):
+    assert planner.is_small_talk(message)
+    assert planner.is_small_talk(message, follow_up=True)
+
+@pytest.mark.parametrize("message", [
+    "what is the refund policy",
+    "hi, can you help",
+    "thanks?",
+    "hello hello hello hello hello hello hello",
+    ""
+])
+def test_questions_and_long_messages_are_not_small_talk(planner, message):
+    assert not planner.is_small_talk(message)
+
+@pytest.mark.parametrize("message", ["yes", "sure, ok", "no", "yep", "okay"])
+def test_replies_are_small_talk_only_without_earlier_turns(planner, message):
+    assert planner.is_small_talk(message)
+    assert not planner.is_small_talk(message, follow_up=True)
+
+def test_plan(planner):
+    chatbot = ChatbotConfig(id=1, name="bot", system_prompt="", is_active=True, chunk_count=10)
+    empty = ChatbotConfig(id=2, name="empty", system_prompt="", is_active=True)
+    
+    assert planner.plan("what is the refund policy", empty) == RETRIEVAL_SKIP_NO_DOCUMENTS
+    assert planner.plan("hello", chatbot) == RETRIEVAL_SKIP_SMALL_TALK
+    assert planner.plan("what is the refund policy", chatbot) == RETRIEVAL_SEARCH
+    assert planner.plan("yes", chatbot, follow_up=True) == RETRIEVAL_SEARCH
+    
+    planner.skip_small_talk = False
+    assert planner.plan("hello", chatbot) == RETRIEVAL_SEARCH
@@ -0,0 +1,153 @@
+import json
+from datetime import datetime
+import pytest
+from app.services import write_behind
+from app.services.write_behind import ChatWriteBuffer
+
+class FakeDatabase:
+    """Stands in for Postgres: rows become visible on commit, bad rows fail the whole transaction"""
+    
+    def __init__(self):
+        self.reachable = True
+        self.sessions = []
+        self.messages = []
+        self.transactions = 0
+    
+    def write_batch(self, db, sessions, messages):
+        if not self.reachable:
+            raise ConnectionError("database unreachable")
+        if any(message.get("bad") for message in messages):
+            raise ValueError("violates foreign key constraint")
+        db.pending.append((sessions, messages))
+
+class FakeSession:
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+        self.pending = []
+    
+    def execute(self, statement):
+        if not self.database.reachable:
+            raise ConnectionError("database unreachable")
+    
+    def commit(self):
+        self.database.transactions += 1
+        for sessions, messages in self.pending:
+            self.database.sessions.extend(sessions)
+            self.database.messages.extend(messages)
+        self.pending = []
+    
+    def rollback(self):
+        self.pending = []
+    
+    def close(self):
+        pass
+
+def message(session_id: str, text: str = "hello", **extra):
+    return {
+        "session_id": session_id,
+        "chatbot_id": 1,
+        "message": text,
+        "response": "hi",
+        "context_chunks": [],
+        "retrieval_decision": None,
+        "degraded": False,
+        "abandoned": False,
+        "created_at": datetime.utcnow(),
+        **extra
+    }
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(write_behind, "SessionLocal", lambda: FakeSession(database))
+    return database
+
+@pytest.fixture
+def buffer(database, tmp_path):
+    buffer = ChatWriteBuffer()
+    buffer.max_retries = 2
+    buffer.max_pending = 10
+    buffer.dead_letter_file = str(tmp_path / "dead_letter.jsonl")
+    buffer._write_batch = database.write_batch
+    return buffer
+
+def dead_letters(buffer):
+    with open(buffer.dead_letter_file) as f:
+        return [json.loads(line) for line in f]
+
+def test_flush_writes_everything_in_one_transaction(buffer, database):
+    buffer.add_session("s1", 1)
+    buffer.add_message(message("s1", "one"))
+    buffer.add_message(message("s1", "two"))
+    
+    assert buffer.flush() == 3
+    assert database.transactions == 1
+    assert [m["message"] for m in database.messages] == ["one", "two"]
+    assert buffer.pending == 0
+
+def test_failed_flush_keeps_rows_until_retries_run_out(buffer, database):
+    database.reachable = False
+    buffer.add_message(message("s1"))
+    
+    assert buffer.flush() == 0
+    assert buffer.pending == 1
+    database.reachable = True
+    assert buffer.flush() == 1
+    assert len(database.messages) == 1
+
+def test_bad_row_is_dead_lettered_and_the_rest_written(buffer, database):
+    buffer.add_session("s1", 1)
+    buffer.add_message(message("s1", "before"))
+    buffer.add_message(message("purged", "orphan", bad=True))
+    buffer.add_message(message("s1", "after"))
+    
+    assert buffer.flush() == 0
+    assert buffer.flush() == 4
+    
+    assert [m["message"] for m in database.messages] == ["before", "after"]
+    assert [s["session_id"] for s in database.sessions] == ["s1"]
+    assert buffer.pending == 0
+    assert buffer.dead_lettered == 1
+    [letter] = dead_letters(buffer)
+    assert letter["kind"] == "message"
+    assert letter["row"]["message"] == "orphan"
+    assert "foreign key" in letter["error"]
+
+def test_nothing_is_dead_lettered_while_the_database_is_down(buffer, database):
+    database.reachable = False
+    buffer.add_message(message("s1", "one"))
+    buffer.add_message(message("s1", "two"))
+    
+    for _ in range(buffer.max_retries * 2):
+        assert buffer.flush() == 0
+    assert buffer.pending == 2
+    assert buffer.dead_lettered == 0
+    
+    database.reachable = True
+    assert buffer.flush() == 2
+    assert [m["message"] for m in database.messages] == ["one", "two"]
+
+def test_rows_buffered_during_a_flush_are_kept(buffer, database):
+    buffer.add_message(message("s1", "first"))
+    write_batch = database.write_batch
+    
+    def write_and_receive_more(db, sessions, messages):
+        buffer.add_message(message("s1", "arrived during flush"))
+        write_batch(db, sessions, messages)
+    
+    buffer._write_batch = write_and_receive_more
+    assert buffer.flush() == 1
+    assert [m["message"] for m in buffer.get_pending_messages("s1")] == ["arrived during flush"]
+
+def test_pending_reads_and_capacity(buffer):
+    buffer.add_session("s1", 1)
+    buffer.add_message(message("s1", "answered"))
+    buffer.add_message(message("s1", "disconnected", abandoned=True))
+    
+    assert buffer.get_pending_session("s1")["chatbot_id"] == 1
+    assert [m["message"] for m in buffer.get_pending_messages("s1")] == ["answered"]
+    
+    while buffer.add_message(message("s2")):
+        pass
+    assert buffer.is_full()
+    assert not buffer.add_session("s3", 1)